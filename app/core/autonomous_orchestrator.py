@@ -1,23 +1,60 @@
 """
 Enhanced autonomous orchestrator with intelligent query processing and comparative analysis.
 """
-from typing import List, Dict, Optional
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
 import logging
+import os
 
-from app.services.web_automation.ai_navigator import AIWebNavigator
-import asyncio
+from app.services.web_automation.ai_navigator import AIWebNavigator, get_navigator
 from app.services.document_processing import DocumentProcessor
 from app.services.vector_store import VectorStoreService
 from app.services.rag_service import RAGService
 from app.services.query_analyzer import QueryAnalyzer
-from app.services.context_manager import ContextManager
+from app.services.context_manager import ContextManager, DEFAULT_AGENCIES
 from app.services.comparative_analysis import ComparativeAnalysisService
+from app.services.semantic_cache import SemanticCache
 from app.core.config import get_settings
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+BANNER = '=' * 70
+
+
+async def stream_tokens(
+    run: Callable[[Callable[[str], None]], Awaitable[Dict]]
+) -> AsyncIterator[Tuple[str, object]]:
+    """
+    Run a query while relaying the answer tokens it produces.
+    
+    Args:
+        run: Starts the query, given the callback that receives answer tokens
+        
+    Yields:
+        ('token', text) for each piece of the answer, then ('result', result)
+    """
+    tokens: asyncio.Queue = asyncio.Queue()
+    task = asyncio.ensure_future(run(tokens.put_nowait))
+    
+    try:
+        while not task.done():
+            next_token = asyncio.ensure_future(tokens.get())
+            await asyncio.wait({next_token, task}, return_when=asyncio.FIRST_COMPLETED)
+            
+            if next_token.done():
+                yield 'token', next_token.result()
+            else:
+                next_token.cancel()
+        
+        while not tokens.empty():
+            yield 'token', tokens.get_nowait()
+        
+        yield 'result', task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+
 
 class AutonomousOrchestrator:
     """
@@ -31,17 +68,42 @@ class AutonomousOrchestrator:
     - Manages conversation context
     """
     
+    __slots__ = (
+        'settings',
+        'doc_processor',
+        'vector_store',
+        'rag_service',
+        'query_analyzer',
+        'context_manager',
+        'comparative_service',
+        'semantic_cache',
+        'ai_navigator'
+    )
+    
+    # Agencies the AI navigator knows how to search
+    AVAILABLE_AGENCIES = tuple(AIWebNavigator.AGENCY_URLS)
+    
     def __init__(self):
         self.settings = get_settings()
         self.doc_processor = DocumentProcessor()
         self.vector_store = VectorStoreService()
-        self.rag_service = RAGService()
+        self.rag_service = RAGService(vector_store=self.vector_store)
         self.query_analyzer = QueryAnalyzer()
         self.context_manager = ContextManager()
         self.comparative_service = ComparativeAnalysisService()
+        self.semantic_cache = SemanticCache(
+            dimension=self.vector_store.dimension,
+            threshold=self.settings.semantic_cache_threshold,
+            ttl_seconds=self.settings.semantic_cache_ttl
+        )
+        
+        # Shared AI navigator (replaces all scrapers)
+        self.ai_navigator = get_navigator()
         
-        # Initialize AI navigator (replaces all scrapers)
-        self.ai_navigator = AIWebNavigator()
+        # Start browsers for the default agencies in the background so the
+        # first query doesn't pay the browser cold start
+        if self.settings.browser_warmup:
+            self.ai_navigator.warmup(DEFAULT_AGENCIES)
         
         logger.info("✓ Autonomous Orchestrator initialized")
     
@@ -51,6 +113,102 @@ class AutonomousOrchestrator:
         session_id: str = "default",
         selected_agencies: Optional[List[str]] = None,
         model: Optional[str] = None
+    ) -> Dict:
+        """
+        Process a user query autonomously (blocking wrapper around aprocess_query).
+        
+        Must not be called from a running event loop; await aprocess_query there.
+        
+        Args:
+            query: User's query
+            session_id: Session identifier for context tracking
+            selected_agencies: List of agencies to use (None = use context default)
+            model: OpenAI model to use
+            
+        Returns:
+            Dictionary with answer and metadata
+        """
+        return asyncio.run(
+            self.aprocess_query(
+                query=query,
+                session_id=session_id,
+                selected_agencies=selected_agencies,
+                model=model
+            )
+        )
+    
+    async def aprocess_queries(self, requests: List[Dict]) -> List[Dict]:
+        """
+        Process several queries concurrently, embedding them with a single API call.
+        
+        Queries of different sessions run concurrently; queries of the same
+        session run one after another, in order, since each reads and updates
+        that session's conversation context.
+        
+        Args:
+            requests: Keyword arguments for aprocess_query, one dict per query
+            
+        Returns:
+            Results in the same order as the requests
+        """
+        queries = [request['query'] for request in requests]
+        embeddings = await asyncio.to_thread(self._embed_queries_for_cache, queries)
+        
+        positions_by_session: Dict[str, List[int]] = {}
+        for position, request in enumerate(requests):
+            positions_by_session.setdefault(request.get('session_id', "default"), []).append(position)
+        
+        results: List[Optional[Dict]] = [None] * len(requests)
+        
+        async def run_session(positions: List[int]):
+            for position in positions:
+                results[position] = await self.aprocess_query(
+                    **{**requests[position], 'query_embedding': embeddings[position]}
+                )
+        
+        await asyncio.gather(*(run_session(positions) for positions in positions_by_session.values()))
+        return results
+    
+    def astream_query(
+        self,
+        query: str,
+        session_id: str = "default",
+        selected_agencies: Optional[List[str]] = None,
+        model: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, object]]:
+        """
+        Process a query, streaming the answer as it is generated.
+        
+        Comparative answers arrive token by token; other answers (single agency,
+        cached, errors) only come with the final result.
+        
+        Args:
+            query: User's query
+            session_id: Session identifier for context tracking
+            selected_agencies: List of agencies to use (None = use context default)
+            model: OpenAI model to use
+            
+        Returns:
+            Async iterator of ('token', text) events followed by ('result', result)
+        """
+        return stream_tokens(
+            lambda on_token: self.aprocess_query(
+                query=query,
+                session_id=session_id,
+                selected_agencies=selected_agencies,
+                model=model,
+                on_token=on_token
+            )
+        )
+    
+    async def aprocess_query(
+        self,
+        query: str,
+        session_id: str = "default",
+        selected_agencies: Optional[List[str]] = None,
+        model: Optional[str] = None,
+        query_embedding: Optional[List[float]] = None,
+        on_token: Optional[Callable[[str], None]] = None
     ) -> Dict:
         """
         Process a user query autonomously.
@@ -67,14 +225,17 @@ class AutonomousOrchestrator:
             session_id: Session identifier for context tracking
             selected_agencies: List of agencies to use (None = use context default)
             model: OpenAI model to use
+            query_embedding: Precomputed query embedding (embedded here if omitted)
+            on_token: Called with each piece of the answer as it streams
             
         Returns:
             Dictionary with answer and metadata
         """
         try:
-            logger.info(f"\n{'='*70}")
-            logger.info(f"Processing query: {query}")
-            logger.info(f"{'='*70}\n")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("\n%s", BANNER)
+                logger.info("Processing query: %s", query)
+                logger.info("%s\n", BANNER)
             
             # Get conversation context
             context = self.context_manager.get_context(session_id)
@@ -83,9 +244,17 @@ class AutonomousOrchestrator:
             if selected_agencies:
                 context.set_agencies(selected_agencies)
             
+            if query_embedding is None:
+                query_embedding = await self._embed_for_cache(query)
+            
             # Step 1: Analyze query
             logger.info("Step 1: Analyzing query...")
-            analysis = self.query_analyzer.analyze_query(query, context.to_dict())
+            analysis = await asyncio.to_thread(
+                self.query_analyzer.analyze_query,
+                query,
+                context.to_dict(),
+                self.vector_store.indexed_drugs()
+            )
             
             # Step 2: Check if clarification needed
             if analysis['clarification_needed']:
@@ -96,12 +265,21 @@ class AutonomousOrchestrator:
                     'analysis': analysis
                 }
             
+            # Short-circuit on a semantically equivalent query asked before
+            # (with the same analysis, so near-identical wordings that ask
+            # for different things don't share answers)
+            cache_scope = self._cache_scope(context, model, analysis)
+            if query_embedding is not None:
+                cached = self.semantic_cache.lookup(query_embedding, cache_scope)
+                if cached is not None:
+                    return self._replay_cached_answer(query, context, cached)
+            
             # Step 3: Extract drug name
             drug_names = analysis.get('drug_names', [])
             if not drug_names and context.current_drug:
                 # Use drug from context
                 drug_names = [context.current_drug]
-                logger.info(f"Using drug from context: {context.current_drug}")
+                logger.info("Using drug from context: %s", context.current_drug)
             
             if not drug_names:
                 return {
@@ -121,9 +299,9 @@ class AutonomousOrchestrator:
             if not agencies_to_use:
                 agencies_to_use = context.agencies  # Use context default
             
-            logger.info(f"Drug: {drug_name}")
-            logger.info(f"Agencies: {', '.join(agencies_to_use)}")
-            logger.info(f"Topics: {', '.join(analysis.get('topics', []))}")
+            logger.info("Drug: %s", drug_name)
+            logger.info("Agencies: %s", ', '.join(agencies_to_use))
+            logger.info("Topics: %s", ', '.join(analysis.get('topics', [])))
             
             # Step 5: Check if documents need to be retrieved
             needs_docs = analysis.get('needs_documents', False)
@@ -135,9 +313,9 @@ class AutonomousOrchestrator:
             
             # Step 6: Retrieve and index documents if needed
             if needs_docs:
-                logger.info(f"\nStep 2: Retrieving documents for {drug_name}...")
+                logger.info("\nStep 2: Retrieving documents for %s...", drug_name)
                 
-                retrieval_result = self._retrieve_and_index(
+                retrieval_result = await self._retrieve_and_index(
                     drug_name=drug_name,
                     agencies=agencies_to_use,
                     max_docs_per_agency=3
@@ -150,54 +328,132 @@ class AutonomousOrchestrator:
                 for doc_path in retrieval_result.get('documents_downloaded', []):
                     context.add_document(doc_path)
                 
-                logger.info(f"✓ Indexed {retrieval_result['documents_indexed']} documents")
+                # Answers cached for this drug predate the new documents
+                self.semantic_cache.invalidate(drug_name.lower())
+                
+                logger.info("✓ Indexed %d documents", retrieval_result['documents_indexed'])
             else:
                 logger.info("\nStep 2: Using existing indexed documents")
             
             # Step 7: Generate answer
-            logger.info(f"\nStep 3: Generating answer...")
+            logger.info("\nStep 3: Generating answer...")
             
             # Check if comparative analysis is needed
             if len(agencies_to_use) > 1:
                 logger.info("Multiple agencies selected - generating comparative analysis")
-                answer_result = self._generate_comparative_answer(
+                answer_result = await self._generate_comparative_answer(
                     query=query,
                     drug_name=drug_name,
                     agencies=agencies_to_use,
-                    model=model
+                    model=model,
+                    on_token=on_token
                 )
             else:
                 logger.info("Single agency - generating standard answer")
-                answer_result = self.rag_service.generate_answer(
+                answer_result = await self._generate_standard_answer(
                     query=query,
                     model=model,
-                    k=5
+                    on_token=on_token
                 )
             
             # Step 8: Update context with query and response
             context.add_query(query, answer_result.get('answer', ''), analysis)
             
+            if query_embedding is not None and answer_result.get('status') == 'success':
+                self.semantic_cache.add(
+                    query_embedding,
+                    {
+                        'answer_result': dict(answer_result),
+                        'analysis': analysis,
+                        'drug_name': drug_name,
+                        'documents': list(context.documents_indexed)
+                    },
+                    scope=cache_scope,
+                    tags=[drug_name.lower()]
+                )
+            
             # Add context summary to result
             answer_result['context_summary'] = context.get_context_summary()
             answer_result['analysis'] = analysis
             
-            logger.info(f"\n{'='*70}")
-            logger.info(f"Query processing complete")
-            logger.info(f"{'='*70}\n")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("\n%s", BANNER)
+                logger.info("Query processing complete")
+                logger.info("%s\n", BANNER)
             
             return answer_result
             
         except Exception as e:
-            logger.error(f"Error processing query: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error processing query: %s", e)
             return {
                 'status': 'error',
                 'error': str(e),
                 'answer': f"I encountered an error while processing your query: {str(e)}"
             }
     
-    def _retrieve_and_index(
+    def _cache_scope(self, context, model: Optional[str], analysis: Dict) -> tuple:
+        """Build the semantic cache scope for a query in the given context, given its analysis."""
+        current_drug = context.current_drug.lower() if context.current_drug else None
+        return (
+            current_drug,
+            tuple(sorted(context.agencies)),
+            model or self.settings.chat_model,
+            tuple(sorted(name.lower() for name in analysis.get('drug_names', []))),
+            tuple(sorted(agency.upper() for agency in analysis.get('agencies', []))),
+            analysis.get('query_type'),
+            tuple(sorted(topic.lower() for topic in analysis.get('topics', [])))
+        )
+    
+    async def _embed_for_cache(self, query: str) -> Optional[List[float]]:
+        """Embed a query for the semantic cache (None if embedding fails)."""
+        try:
+            return await self.vector_store.agenerate_embedding(query)
+        except Exception as e:
+            logger.warning("Semantic cache disabled for this query: %s", e)
+            return None
+    
+    def _embed_queries_for_cache(self, queries: List[str]) -> List[Optional[List[float]]]:
+        """
+        Embed several queries for the semantic cache in one call (Nones if it fails).
+        
+        The embeddings go into the vector store's query embedding cache, so
+        the answer cache lookup and search for each query reuse them.
+        """
+        try:
+            return self.vector_store.generate_query_embeddings(queries)
+        except Exception as e:
+            logger.warning("Semantic cache disabled for these queries: %s", e)
+            return [None] * len(queries)
+    
+    def _replay_cached_answer(self, query: str, context, cached: Dict) -> Dict:
+        """
+        Return a cached answer and apply its effects to the conversation context.
+        
+        Args:
+            query: User's query
+            context: Conversation context
+            cached: Cached entry from the semantic cache
+            
+        Returns:
+            Answer result with a refreshed context summary
+        """
+        analysis = cached['analysis']
+        answer_result = dict(cached['answer_result'])
+        
+        context.update_drug(cached['drug_name'])
+        context.add_topics(analysis.get('topics', []))
+        for doc_path in cached['documents']:
+            context.add_document(doc_path)
+        context.add_query(query, answer_result.get('answer', ''), analysis)
+        
+        answer_result['context_summary'] = context.get_context_summary()
+        answer_result['analysis'] = analysis
+        answer_result['cached'] = True
+        
+        logger.info("Answered from semantic cache")
+        return answer_result
+    
+    async def _retrieve_and_index(
         self,
         drug_name: str,
         agencies: List[str],
@@ -225,72 +481,227 @@ class AutonomousOrchestrator:
         
         try:
             # Use AI navigator to retrieve documents from all agencies
-            logger.info(f"Using AI navigator to retrieve documents for {drug_name}")
-            logger.info(f"Agencies: {', '.join(agencies)}")
-            
-            # Run async retrieval
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            agency_files = loop.run_until_complete(
-                self.ai_navigator.retrieve_documents(
-                    drug_name=drug_name,
-                    agencies=agencies
+            logger.info("Using AI navigator to retrieve documents for %s", drug_name)
+            logger.info("Agencies: %s", ', '.join(agencies))
+            
+            # Each agency is scraped concurrently (one browser each) and its
+            # files are indexed as soon as it finishes, while the rest keep going
+            finished_agencies: asyncio.Queue = asyncio.Queue()
+            producers = [
+                asyncio.ensure_future(
+                    self._retrieve_agency_into(finished_agencies, drug_name, agency, max_docs_per_agency)
                 )
-            )
-            
-            loop.close()
-            
-            # Process results from each agency
-            for agency, downloaded_files in agency_files.items():
-                results['agencies_searched'].append(agency)
-                
-                if not downloaded_files:
-                    logger.warning(f"No documents from {agency}")
-                    results['errors'].append(f"{agency}: No documents found")
-                    continue
-                
-                logger.info(f"Retrieved {len(downloaded_files)} files from {agency}")
-                results['documents_downloaded'].extend(downloaded_files)
-                
-                # Index documents
-                for file_path in downloaded_files:
-                    try:
-                        chunks, metadata = self.doc_processor.process_document(file_path)
-                        
-                        # Add agency to metadata
-                        metadata['agency'] = agency
-                        metadata['drug_name'] = drug_name
-                        
-                        self.vector_store.add_documents(chunks, metadata)
-                        results['documents_indexed'] += 1
-                        
-                        logger.info(f"✓ Indexed {file_path}")
-                        
-                    except Exception as e:
-                        logger.error(f"Error indexing {file_path}: {str(e)}")
-                        results['errors'].append(f"Indexing error: {str(e)}")
+                for agency in agencies
+            ]
+            
+            # The navigator reports every PDF in the shared download directory,
+            # so make sure each file is only indexed once across agencies
+            claimed_files = set()
+            
+            try:
+                for _ in producers:
+                    agency, agency_files = await finished_agencies.get()
+                    
+                    downloaded_files = [f for f in agency_files if f not in claimed_files]
+                    claimed_files.update(downloaded_files)
+                    results['agencies_searched'].append(agency)
+                    
+                    if not downloaded_files:
+                        logger.warning("No documents from %s", agency)
+                        results['errors'].append(f"{agency}: No documents found")
+                        continue
+                    
+                    logger.info("Retrieved %d files from %s", len(downloaded_files), agency)
+                    results['documents_downloaded'].extend(downloaded_files)
+                    
+                    await self._index_agency_documents(drug_name, agency, downloaded_files, results)
+            finally:
+                for producer in producers:
+                    producer.cancel()
             
             if results['documents_indexed'] == 0:
                 results['status'] = 'error'
                 results['error'] = 'No documents were successfully indexed'
                 
         except Exception as e:
-            logger.error(f"Error in document retrieval: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error in document retrieval: %s", e)
             results['status'] = 'error'
             results['error'] = str(e)
             results['errors'].append(f"Retrieval error: {str(e)}")
         
         return results
     
-    def _generate_comparative_answer(
+    async def _retrieve_agency_into(
+        self,
+        finished_agencies: asyncio.Queue,
+        drug_name: str,
+        agency: str,
+        max_documents: int
+    ):
+        """
+        Retrieve documents from one agency and queue them for indexing.
+        
+        Args:
+            finished_agencies: Queue receiving (agency, file paths) once done
+            drug_name: Name of the drug
+            agency: Agency name
+            max_documents: Maximum documents to retrieve
+        """
+        try:
+            agency_files = await self.ai_navigator.retrieve_documents(
+                drug_name=drug_name,
+                agencies=[agency],
+                max_documents=max_documents
+            )
+            files = agency_files.get(agency, [])
+        except Exception as e:
+            logger.error("Error retrieving from %s: %s", agency, e)
+            files = []
+        
+        await finished_agencies.put((agency, files))
+    
+    async def _index_agency_documents(
+        self,
+        drug_name: str,
+        agency: str,
+        file_paths: List[str],
+        results: Dict
+    ):
+        """
+        Parse one agency's documents in parallel, then embed and index them together.
+        
+        Args:
+            drug_name: Name of the drug
+            agency: Agency the documents came from
+            file_paths: Paths of the downloaded documents
+            results: Retrieval summary to update
+        """
+        processed = await self._process_documents(file_paths)
+        
+        batched_chunks = []
+        batched_metadata = []
+        
+        for file_path in file_paths:
+            outcome = processed[file_path]
+            if isinstance(outcome, Exception):
+                logger.error("Error indexing %s: %s", file_path, outcome)
+                results['errors'].append(f"Indexing error: {str(outcome)}")
+                continue
+            
+            chunks, metadata = outcome
+            
+            # Add agency to metadata
+            metadata['agency'] = agency
+            metadata['drug_name'] = drug_name
+            
+            batched_chunks.append(chunks)
+            batched_metadata.append(metadata)
+        
+        if not batched_chunks:
+            return
+        
+        try:
+            documents_indexed = await self.vector_store.add_documents_bulk_async(
+                batched_chunks,
+                batched_metadata
+            )
+            results['documents_indexed'] += documents_indexed
+            logger.info("✓ Indexed %d documents from %s", documents_indexed, agency)
+        except Exception as e:
+            logger.error("Error indexing documents from %s: %s", agency, e)
+            results['errors'].append(f"Indexing error: {str(e)}")
+    
+    async def _process_documents(self, file_paths: List[str]) -> Dict:
+        """
+        Parse and chunk documents, spreading the PDF work across processes.
+        
+        Args:
+            file_paths: Paths of the documents to process
+            
+        Returns:
+            Dictionary mapping each path to its (chunks, metadata) tuple,
+            or to the exception raised while processing it
+        """
+        # Documents parsed before are served from the cache without starting
+        # workers. Looking a document up hashes the whole file; file reads and
+        # hashing release the GIL, so the batch's files are read concurrently
+        cached = await asyncio.gather(
+            *(asyncio.to_thread(self.doc_processor.load_cached, path) for path in file_paths)
+        )
+        processed = {path: result for path, result in zip(file_paths, cached) if result is not None}
+        file_paths = [path for path in file_paths if path not in processed]
+        
+        if len(file_paths) <= 1:
+            # A single document gets the cores instead, split by page range
+            outcomes = await asyncio.gather(
+                *(asyncio.to_thread(
+                    self.doc_processor.process_document,
+                    file_path,
+                    workers=os.cpu_count() or 1
+                ) for file_path in file_paths),
+                return_exceptions=True
+            )
+            processed.update(zip(file_paths, outcomes))
+            return processed
+        
+        loop = asyncio.get_running_loop()
+        max_workers = min(len(file_paths), os.cpu_count() or 1)
+        
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            outcomes = await asyncio.gather(
+                *(loop.run_in_executor(executor, self.doc_processor.process_document, file_path)
+                  for file_path in file_paths),
+                return_exceptions=True
+            )
+        
+        processed.update(zip(file_paths, outcomes))
+        return processed
+    
+    async def _generate_standard_answer(
+        self,
+        query: str,
+        model: Optional[str] = None,
+        agencies: Optional[List[str]] = None,
+        drug_name: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict:
+        """
+        Generate a standard RAG answer, streaming it if a callback is given.
+        
+        Args:
+            query: User's query
+            model: OpenAI model
+            agencies: Only use chunks from these agencies
+            drug_name: Only use chunks for this drug
+            on_token: Called with each piece of the answer as it streams
+            
+        Returns:
+            Answer with sources and metadata
+        """
+        if on_token is None:
+            return await self.rag_service.agenerate_answer(
+                query=query,
+                model=model,
+                k=5,
+                agencies=agencies,
+                drug_name=drug_name
+            )
+        
+        async for kind, payload in self.rag_service.agenerate_answer_stream(
+            query, model, 5, agencies, drug_name
+        ):
+            if kind == 'token':
+                on_token(payload)
+            else:
+                return payload
+    
+    async def _generate_comparative_answer(
         self,
         query: str,
         drug_name: str,
         agencies: List[str],
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None
     ) -> Dict:
         """
         Generate a comparative answer across multiple agencies.
@@ -300,13 +711,20 @@ class AutonomousOrchestrator:
             drug_name: Drug name
             agencies: List of agencies
             model: OpenAI model
+            on_token: Called with each piece of the answer (streams the analysis)
             
         Returns:
             Answer with comparative analysis
         """
         try:
             # Retrieve contexts
-            contexts = self.vector_store.search(query, k=10)  # Get more for comparison
+            contexts = await self.vector_store.search_async(
+                query,
+                k=10,  # Get more for comparison
+                agencies=agencies,
+                drug_name=drug_name,
+                with_embeddings=True  # Lets the comparison pick diverse excerpts
+            )
             
             if not contexts:
                 return {
@@ -314,13 +732,40 @@ class AutonomousOrchestrator:
                     'answer': f"No documents found for {drug_name}. Please try retrieving documents first."
                 }
             
+            # Nothing to compare if only one agency has matching documents
+            agency_contexts = self.comparative_service.organize_by_agency(contexts)
+            present = self.comparative_service.agencies_with_contexts(agency_contexts, agencies)
+            if len(present) < 2:
+                logger.info("Only %s has documents - generating standard answer", present)
+                return await self._generate_standard_answer(
+                    query=query,
+                    model=model,
+                    agencies=present,
+                    drug_name=drug_name,
+                    on_token=on_token
+                )
+            
             # Generate comparative analysis
-            result = self.comparative_service.generate_comparative_analysis(
-                query=query,
-                contexts=contexts,
-                agencies=agencies,
-                model=model
-            )
+            if on_token is None:
+                result = await self.comparative_service.agenerate_comparative_analysis(
+                    query=query,
+                    contexts=contexts,
+                    agencies=agencies,
+                    model=model,
+                    agency_contexts=agency_contexts
+                )
+            else:
+                parts = []
+                async for text in self.comparative_service.astream_comparative_analysis(
+                    query=query,
+                    contexts=contexts,
+                    agencies=agencies,
+                    model=model,
+                    agency_contexts=agency_contexts
+                ):
+                    parts.append(text)
+                    on_token(text)
+                result = {'analysis': ''.join(parts), 'model_used': model or self.settings.chat_model}
             
             return {
                 'status': 'success',
@@ -332,17 +777,46 @@ class AutonomousOrchestrator:
             }
             
         except Exception as e:
-            logger.error(f"Error generating comparative answer: {str(e)}")
+            logger.error("Error generating comparative answer: %s", e)
             return {
                 'status': 'error',
                 'error': str(e),
                 'answer': f"Error generating comparative analysis: {str(e)}"
             }
     
+    async def aretrieve_and_index(
+        self,
+        drug_name: str,
+        agencies: Optional[List[str]] = None,
+        max_docs_per_agency: int = 3
+    ) -> Dict:
+        """
+        Retrieve and index documents for a drug outside of a conversation.
+        
+        Args:
+            drug_name: Name of the drug
+            agencies: List of agencies (None = default agencies)
+            max_docs_per_agency: Maximum documents per agency
+            
+        Returns:
+            Summary of retrieval results
+        """
+        result = await self._retrieve_and_index(
+            drug_name=drug_name,
+            agencies=list(agencies or DEFAULT_AGENCIES),
+            max_docs_per_agency=max_docs_per_agency
+        )
+        
+        if result['documents_indexed']:
+            # Answers cached for this drug predate the new documents
+            self.semantic_cache.invalidate(drug_name.lower())
+        
+        return result
+    
     def reset_context(self, session_id: str = "default"):
         """Reset conversation context for a session."""
         self.context_manager.reset_context(session_id)
-        logger.info(f"Reset context for session: {session_id}")
+        logger.info("Reset context for session: %s", session_id)
     
     def get_system_status(self) -> Dict:
         """Get system status."""
@@ -356,7 +830,7 @@ class AutonomousOrchestrator:
                     'unique_documents': stats['unique_documents'],
                     'dimension': stats['dimension']
                 },
-                'available_agencies': list(self.scrapers.keys()),
+                'available_agencies': list(self.AVAILABLE_AGENCIES),
                 'models': {
                     'embedding': self.settings.embedding_model,
                     'chat': self.settings.chat_model
@@ -368,7 +842,7 @@ class AutonomousOrchestrator:
                 }
             }
         except Exception as e:
-            logger.error(f"Error getting system status: {str(e)}")
+            logger.error("Error getting system status: %s", e)
             return {
                 'status': 'error',
                 'error': str(e)
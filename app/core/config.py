@@ -19,17 +19,44 @@ class Settings(BaseSettings):
     openai_api_key: str
     embedding_model: str = "text-embedding-ada-002"
     chat_model: str = "gpt-4"
+    validation_model: str = "gpt-4o-mini"  # Classifies downloaded documents (needs JSON mode)
+    answer_batch_concurrency: int = 8  # Answer completions in flight at once (generate_answer_batch)
     
     # FAISS Configuration
     faiss_index_path: str = "./data/faiss_index/regulatory_docs.index"
     faiss_metadata_path: str = "./data/faiss_index/metadata.json"
+    faiss_pq_threshold: int = 10000
+    faiss_large_index: str = "hnsw_pq"  # Encoding past the threshold: "hnsw_pq", "hnsw_sq", "hnsw_sq8", "ivf" or "ivf_pq"
+    faiss_ef_search: int = 64
+    faiss_nprobe: int = 16
+    faiss_mmap: bool = False
+    
+    # Semantic Cache Configuration
+    semantic_cache_threshold: float = 0.98
+    semantic_cache_ttl: int = 3600
+    answer_cache_path: str = "./data/qa_cache/answers.jsonl"  # RAG answers, kept across restarts
     
     # Document Storage
     download_dir: str = "./data/downloaded_docs/"
+    document_cache_dir: str = "./data/document_cache/"
+    analysis_cache_dir: str = "./data/analysis_cache/"
+    embedding_cache_dir: str = "./data/embedding_cache/"
+    embedding_cache_max_files: int = 10000  # Least recently used query embeddings are pruned beyond this
+    
+    # Web Automation
+    browser_warmup: bool = True
+    browser_executable_path: str = ""  # Chrome/Chromium binary (empty = detect the installed one)
+    retrieval_cache_ttl: int = 86400  # Seconds to reuse an agency's documents for a drug
+    
+    # GUI Configuration
+    chat_history_max_turns: int = 50
     
     # Server Configuration
     host: str = "0.0.0.0"
     port: int = 8000
+    # Each worker process loads its own index and browsers, and indexing from
+    # several workers would race on the index files; raise for query-only serving
+    workers: int = 1
     
     class Config:
         env_file = ".env"
@@ -42,7 +69,7 @@ def get_settings() -> Settings:
     return Settings()
 
 
-# Ensure data directories exist
+# Ensure data directories exist (called once by the entry points)
 def ensure_directories():
     """Create necessary directories if they don't exist."""
     settings = get_settings()
@@ -53,8 +80,10 @@ def ensure_directories():
     # Create download directory
     Path(settings.download_dir).mkdir(parents=True, exist_ok=True)
     
+    # Create parsed document, query analysis, embedding and answer cache directories
+    Path(settings.document_cache_dir).mkdir(parents=True, exist_ok=True)
+    Path(settings.analysis_cache_dir).mkdir(parents=True, exist_ok=True)
+    Path(settings.embedding_cache_dir).mkdir(parents=True, exist_ok=True)
+    Path(settings.answer_cache_path).parent.mkdir(parents=True, exist_ok=True)
+    
     print(f"✓ Data directories initialized")
-
-
-# Initialize directories on import
-ensure_directories()
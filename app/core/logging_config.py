@@ -0,0 +1,39 @@
+"""
+Logging setup for scripts that log heavily from their critical path.
+"""
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import atexit
+import logging
+import queue
+
+# Listener writing the queued records, started by the first configure_queue_logging call
+_listener: Optional[QueueListener] = None
+
+
+def configure_queue_logging(level: int = logging.INFO, format: str = logging.BASIC_FORMAT):
+    """
+    Send root log records through a queue to a background writer thread.
+
+    Logging calls only enqueue the record; formatting and the blocking write
+    to stderr happen on the listener thread, which is flushed at exit.
+
+    Args:
+        level: Root logger level
+        format: Format of the written records
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(format))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
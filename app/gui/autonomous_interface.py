@@ -1,25 +1,240 @@
 """
 Enhanced autonomous Gradio interface with intelligent query processing.
 """
-import gradio as gr
+import asyncio
+import html
 import sys
+import time
+from collections import deque
+from functools import lru_cache
 from pathlib import Path
+from markdown_it import MarkdownIt
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from app.core.autonomous_orchestrator import AutonomousOrchestrator
+from app.core.config import get_settings
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize autonomous orchestrator
-orchestrator = AutonomousOrchestrator()
+# Static page text, defined once at import rather than inside the layout
+HEADER_MARKDOWN = """
+# 🔬 Regulatory Search Agent (Autonomous)
 
+**Ask any question about drug regulatory reviews - the system will automatically:**
+- Extract drug names from your query
+- Search and download relevant documents from regulatory agencies
+- Generate comprehensive answers with comparative analysis
+- Track conversation context across multiple queries
 
-def autonomous_chat(message: str, history: list, agencies: list, model: str) -> tuple:
+**Example queries:**
+- *"What were the differences in safety issues between FDA and EMA reviews for Tezspire?"*
+- *"Tell me about the efficacy data for Keytruda"*
+- *"Compare the dosage recommendations across agencies for Humira"*
+"""
+
+HOW_IT_WORKS_MARKDOWN = """
+1. **Ask your question** - Just type naturally
+2. **System analyzes** - Extracts drug names and intent
+3. **Auto-retrieves** - Downloads documents if needed
+4. **Generates answer** - Comprehensive response with sources
+5. **Comparative analysis** - When multiple agencies selected
+
+The system remembers context, so follow-up questions work seamlessly!
+"""
+
+EXAMPLE_QUERIES_MARKDOWN = """
+**Specific Comparative Queries:**
+- "What were the differences in safety issues and drug dosage between the FDA and EMA reviews for Tezspire?"
+- "Compare the efficacy endpoints used by FDA and EMA for Keytruda approval"
+- "How did the adverse event profiles differ between FDA and EMA reviews for Humira?"
+
+**General Queries:**
+- "What is Keytruda indicated for?"
+- "Tell me about the safety profile of Opdivo"
+- "What were the clinical trial results for Tezspire?"
+
+**Follow-up Queries (after initial query):**
+- "What about the dosing regimen?"
+- "Were there any black box warnings?"
+- "How does this compare to similar drugs?"
+"""
+
+# Chat answers are rendered to HTML once, off the event loop, instead of being
+# re-rendered by the Chatbot on every update; raw HTML in answers is escaped
+_MD = MarkdownIt("commonmark", {"html": False}).enable("table")
+
+# Seconds for which a system status snapshot is shared between page loads
+STATUS_TTL_SECONDS = 2
+
+STATUS_TEMPLATE = """**System Status: {status}**
+
+**Vector Store:**
+- Total Vectors: {total_vectors}
+- Unique Documents: {unique_documents}
+- Dimension: {dimension}
+
+**Available Agencies:** {agencies}
+
+**Models:**
+- Embedding: {embedding_model}
+- Chat: {chat_model}
+
+**Features:**
+- ✅ Autonomous Query Processing
+- ✅ Comparative Analysis
+- ✅ Context Tracking
+- ✅ Intelligent Drug Name Extraction
+"""
+
+
+@lru_cache()
+def get_orchestrator():
+    """
+    Get the orchestrator shared by the interface's handlers.
+    
+    The orchestrator (and the index, clients and browsers behind it) is only
+    built when the first handler runs, so importing this module stays cheap.
+    
+    Returns:
+        AutonomousOrchestrator instance
+    """
+    from app.core.autonomous_orchestrator import AutonomousOrchestrator
+    
+    return AutonomousOrchestrator()
+
+
+def _status_key() -> int:
+    """Get the current status cache window."""
+    return int(time.monotonic() // STATUS_TTL_SECONDS)
+
+
+@lru_cache(maxsize=4)
+def _cached_status(key: int) -> dict:
+    """Get the orchestrator status, computed once per cache window."""
+    return get_orchestrator().get_system_status()
+
+
+class QueryBatcher:
+    """
+    Collects chat queries arriving within a short window and processes them
+    together, so their embeddings are requested in a single API call.
+    """
+    
+    def __init__(self, window_seconds: float = 0.05):
+        self.window_seconds = window_seconds
+        self._pending: deque = deque()
+        self._flush_task: asyncio.Task = None
+    
+    async def submit(self, **request) -> dict:
+        """
+        Queue a query for the next batch and wait for its result.
+        
+        Args:
+            **request: Keyword arguments for orchestrator.aprocess_query
+            
+        Returns:
+            Query result
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((request, future))
+        
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_after_window())
+        
+        return await future
+    
+    async def _flush_after_window(self):
+        """Wait for the batching window to close, then process the batch."""
+        await asyncio.sleep(self.window_seconds)
+        
+        batch = list(self._pending)
+        self._pending.clear()
+        self._flush_task = None
+        
+        try:
+            results = await get_orchestrator().aprocess_queries([request for request, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+query_batcher = QueryBatcher()
+
+
+def format_answer(result: dict, model: str) -> str:
+    """
+    Format an orchestrator result as a chat message.
+    
+    Args:
+        result: Result from the orchestrator
+        model: Selected model
+        
+    Returns:
+        Markdown message for the chat history
+    """
+    # Handle clarification needed
+    if result.get('status') == 'clarification_needed':
+        return f"🤔 **Clarification Needed**\n\n{result['question']}"
+    
+    # Handle errors
+    if result.get('status') == 'error':
+        return f"❌ **Error**\n\n{result.get('answer', result.get('error', 'Unknown error'))}"
+    
+    # Format successful answer
+    answer = result.get('answer', 'No answer generated')
+    
+    # Add metadata
+    answer_type = result.get('type', 'standard')
+    
+    if answer_type == 'comparative':
+        answer = f"📊 **Comparative Analysis**\n\n{answer}"
+        agencies_compared = result.get('agencies_compared', [])
+        answer += f"\n\n*Agencies compared: {', '.join(agencies_compared)}*"
+    
+    # Add context summary
+    context = result.get('context_summary', {})
+    if context.get('current_drug'):
+        answer += f"\n\n*Current drug: {context['current_drug']} | Documents indexed: {context.get('documents_indexed', 0)}*"
+    
+    # Add model info
+    answer += f"\n\n*Model: {result.get('model_used', model)}*"
+    
+    return answer
+
+
+def _streaming_html(text: str) -> str:
+    """
+    Format a partially streamed answer for display.
+    
+    Args:
+        text: Answer text received so far
+        
+    Returns:
+        HTML showing the text with its line breaks preserved
+    """
+    return f'<div style="white-space: pre-wrap">{html.escape(text)}</div>'
+
+
+def _session_id(request) -> str:
+    """Get the conversation session of a Gradio request (one per browser tab)."""
+    return getattr(request, 'session_hash', None) or "default"
+
+
+async def autonomous_chat(
+    message: str,
+    history: list,
+    agencies: list,
+    model: str,
+    session_id: str = "default"
+):
     """
     Process a chat message autonomously.
     
@@ -27,80 +242,73 @@ def autonomous_chat(message: str, history: list, agencies: list, model: str) ->
     1. Analyze the query
     2. Extract drug names
     3. Retrieve documents if needed
-    4. Generate comprehensive answer
+    4. Generate comprehensive answer (streamed into the chat as it arrives)
     
     Args:
         message: User's message
         history: Chat history
         agencies: Selected agencies
         model: Selected model
+        session_id: Conversation session whose context the query uses
         
-    Returns:
-        Tuple of (empty string, updated history)
+    Yields:
+        Tuples of (empty string, updated history)
     """
+    from app.core.autonomous_orchestrator import stream_tokens
+    
+    # Keep only the most recent turns so the payload sent to the browser stays bounded
+    history = deque(history or [], maxlen=get_settings().chat_history_max_turns)
+    
+    if not message or not message.strip():
+        yield "", list(history)
+        return
+    
+    # The Chatbot displays HTML as-is, so escape what the user typed
+    user_html = html.escape(message)
+    history.append((user_html, ""))
+    
     try:
-        if not message or not message.strip():
-            return "", history
-        
         logger.info(f"Processing autonomous query: {message[:100]}...")
         
-        # Process query autonomously
-        result = orchestrator.process_query(
+        # Process query autonomously, showing the answer while it streams
+        run_query = lambda on_token: query_batcher.submit(
             query=message.strip(),
-            session_id="default",
+            session_id=session_id,
             selected_agencies=agencies if agencies else None,
-            model=model
+            model=model,
+            on_token=on_token
         )
         
-        # Handle clarification needed
-        if result.get('status') == 'clarification_needed':
-            answer = f"🤔 **Clarification Needed**\n\n{result['question']}"
-            history.append((message, answer))
-            return "", history
-        
-        # Handle errors
-        if result.get('status') == 'error':
-            answer = f"❌ **Error**\n\n{result.get('answer', result.get('error', 'Unknown error'))}"
-            history.append((message, answer))
-            return "", history
-        
-        # Format successful answer
-        answer = result.get('answer', 'No answer generated')
-        
-        # Add metadata
-        answer_type = result.get('type', 'standard')
-        
-        if answer_type == 'comparative':
-            answer = f"📊 **Comparative Analysis**\n\n{answer}"
-            agencies_compared = result.get('agencies_compared', [])
-            answer += f"\n\n*Agencies compared: {', '.join(agencies_compared)}*"
+        partial_answer = ""
+        result = {}
         
-        # Add context summary
-        context = result.get('context_summary', {})
-        if context.get('current_drug'):
-            answer += f"\n\n*Current drug: {context['current_drug']} | Documents indexed: {context.get('documents_indexed', 0)}*"
+        async for kind, payload in stream_tokens(run_query):
+            if kind == 'token':
+                # Show streamed text verbatim; Markdown is rendered once at the end
+                partial_answer += payload
+                history[-1] = (user_html, _streaming_html(partial_answer))
+                yield "", list(history)
+            else:
+                result = payload
         
-        # Add model info
-        answer += f"\n\n*Model: {result.get('model_used', model)}*"
+        # The query may have indexed new documents
+        _cached_status.cache_clear()
         
-        # Update history
-        history.append((message, answer))
-        
-        return "", history
+        answer_html = await asyncio.to_thread(_MD.render, format_answer(result, model))
+        history[-1] = (user_html, answer_html)
+        yield "", list(history)
         
     except Exception as e:
-        logger.error(f"Error in autonomous_chat: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error in autonomous_chat: {str(e)}")
         error_msg = f"❌ **Error**: {str(e)}"
-        history.append((message, error_msg))
-        return "", history
+        history[-1] = (user_html, _MD.render(error_msg))
+        yield "", list(history)
 
 
-def reset_conversation():
-    """Reset the conversation context."""
+def reset_conversation(session_id: str = "default"):
+    """Reset the conversation context of a session."""
     try:
-        orchestrator.reset_context("default")
+        get_orchestrator().reset_context(session_id)
         return None, "✅ Conversation reset. You can start a new query."
     except Exception as e:
         return None, f"❌ Error resetting conversation: {str(e)}"
@@ -109,164 +317,151 @@ def reset_conversation():
 def get_system_status() -> str:
     """Get current system status."""
     try:
-        status = orchestrator.get_system_status()
+        status = _cached_status(_status_key())
         
-        message = f"""**System Status: {status['status'].upper()}**
-
-**Vector Store:**
-- Total Vectors: {status['vector_store']['total_vectors']}
-- Unique Documents: {status['vector_store']['unique_documents']}
-- Dimension: {status['vector_store']['dimension']}
-
-**Available Agencies:** {', '.join(status['available_agencies'])}
-
-**Models:**
-- Embedding: {status['models']['embedding']}
-- Chat: {status['models']['chat']}
-
-**Features:**
-- ✅ Autonomous Query Processing
-- ✅ Comparative Analysis
-- ✅ Context Tracking
-- ✅ Intelligent Drug Name Extraction
-"""
-        return message
+        return STATUS_TEMPLATE.format_map({
+            'status': status['status'].upper(),
+            'total_vectors': status['vector_store']['total_vectors'],
+            'unique_documents': status['vector_store']['unique_documents'],
+            'dimension': status['vector_store']['dimension'],
+            'agencies': ', '.join(status['available_agencies']),
+            'embedding_model': status['models']['embedding'],
+            'chat_model': status['models']['chat']
+        })
         
     except Exception as e:
         return f"❌ Error getting status: {str(e)}"
 
 
-# Build Gradio interface
-with gr.Blocks(
-    title="Regulatory Search Agent - Autonomous",
-    theme=gr.themes.Soft()
-) as demo:
+def build_demo():
+    """
+    Build the Gradio interface.
     
-    gr.Markdown("""
-    # 🔬 Regulatory Search Agent (Autonomous)
+    Gradio is imported here rather than at module level so that importing the
+    handlers (e.g. from scripts) does not pay for it.
     
-    **Ask any question about drug regulatory reviews - the system will automatically:**
-    - Extract drug names from your query
-    - Search and download relevant documents from regulatory agencies
-    - Generate comprehensive answers with comparative analysis
-    - Track conversation context across multiple queries
+    Returns:
+        Gradio Blocks app with its queue configured
+    """
+    import gradio as gr
     
-    **Example queries:**
-    - *"What were the differences in safety issues between FDA and EMA reviews for Tezspire?"*
-    - *"Tell me about the efficacy data for Keytruda"*
-    - *"Compare the dosage recommendations across agencies for Humira"*
-    """)
+    # Each browser session keeps its own conversation context, so concurrent
+    # users don't overwrite each other's drug, topics and history
+    async def chat(message: str, history: list, agencies: list, model: str, request: gr.Request):
+        async for update in autonomous_chat(message, history, agencies, model, _session_id(request)):
+            yield update
     
-    with gr.Row():
-        with gr.Column(scale=3):
-            chatbot = gr.Chatbot(
-                label="Conversation",
-                height=500,
-                show_label=True
-            )
-            
-            with gr.Row():
-                msg = gr.Textbox(
-                    label="Your Question",
-                    placeholder="Ask anything about drug regulatory reviews...",
-                    lines=2,
-                    scale=4
+    def reset(request: gr.Request):
+        return reset_conversation(_session_id(request))
+    
+    with gr.Blocks(
+        title="Regulatory Search Agent - Autonomous",
+        theme=gr.themes.Soft()
+    ) as demo:
+        
+        gr.Markdown(HEADER_MARKDOWN)
+        
+        with gr.Row():
+            with gr.Column(scale=3):
+                chatbot = gr.Chatbot(
+                    label="Conversation",
+                    height=500,
+                    show_label=True,
+                    render_markdown=False
                 )
-                submit_btn = gr.Button("Send", variant="primary", scale=1)
+                
+                with gr.Row():
+                    msg = gr.Textbox(
+                        label="Your Question",
+                        placeholder="Ask anything about drug regulatory reviews...",
+                        lines=2,
+                        scale=4
+                    )
+                    submit_btn = gr.Button("Send", variant="primary", scale=1)
+                
+                with gr.Row():
+                    clear_btn = gr.Button("Clear Chat")
+                    reset_btn = gr.Button("Reset Context", variant="secondary")
             
-            with gr.Row():
-                clear_btn = gr.Button("Clear Chat")
-                reset_btn = gr.Button("Reset Context", variant="secondary")
+            with gr.Column(scale=1):
+                gr.Markdown("### ⚙️ Settings")
+                
+                agencies_checkbox = gr.CheckboxGroup(
+                    choices=["FDA", "EMA"],
+                    value=["FDA", "EMA"],
+                    label="Agencies",
+                    info="Select agencies to search (default: all)"
+                )
+                
+                model_dropdown = gr.Dropdown(
+                    choices=["gpt-4", "gpt-4-turbo", "gpt-3.5-turbo"],
+                    value="gpt-4",
+                    label="Model",
+                    info="Select the OpenAI model"
+                )
+                
+                gr.Markdown("### 💡 How It Works")
+                gr.Markdown(HOW_IT_WORKS_MARKDOWN)
         
-        with gr.Column(scale=1):
-            gr.Markdown("### ⚙️ Settings")
-            
-            agencies_checkbox = gr.CheckboxGroup(
-                choices=["FDA", "EMA"],
-                value=["FDA", "EMA"],
-                label="Agencies",
-                info="Select agencies to search (default: all)"
-            )
-            
-            model_dropdown = gr.Dropdown(
-                choices=["gpt-4", "gpt-4-turbo", "gpt-3.5-turbo"],
-                value="gpt-4",
-                label="Model",
-                info="Select the OpenAI model"
-            )
-            
-            gr.Markdown("### 💡 How It Works")
-            gr.Markdown("""
-            1. **Ask your question** - Just type naturally
-            2. **System analyzes** - Extracts drug names and intent
-            3. **Auto-retrieves** - Downloads documents if needed
-            4. **Generates answer** - Comprehensive response with sources
-            5. **Comparative analysis** - When multiple agencies selected
-            
-            The system remembers context, so follow-up questions work seamlessly!
-            """)
-    
-    with gr.Accordion("📊 System Status", open=False):
-        status_output = gr.Markdown(value="*Loading status...*")
-        refresh_btn = gr.Button("🔄 Refresh Status")
-    
-    with gr.Accordion("📖 Example Queries", open=False):
-        gr.Markdown("""
-        **Specific Comparative Queries:**
-        - "What were the differences in safety issues and drug dosage between the FDA and EMA reviews for Tezspire?"
-        - "Compare the efficacy endpoints used by FDA and EMA for Keytruda approval"
-        - "How did the adverse event profiles differ between FDA and EMA reviews for Humira?"
+        with gr.Accordion("📊 System Status", open=False):
+            status_output = gr.Markdown(value="*Loading status...*")
+            refresh_btn = gr.Button("🔄 Refresh Status")
         
-        **General Queries:**
-        - "What is Keytruda indicated for?"
-        - "Tell me about the safety profile of Opdivo"
-        - "What were the clinical trial results for Tezspire?"
+        with gr.Accordion("📖 Example Queries", open=False):
+            gr.Markdown(EXAMPLE_QUERIES_MARKDOWN)
         
-        **Follow-up Queries (after initial query):**
-        - "What about the dosing regimen?"
-        - "Were there any black box warnings?"
-        - "How does this compare to similar drugs?"
-        """)
-    
-    # Event handlers
-    submit_btn.click(
-        autonomous_chat,
-        inputs=[msg, chatbot, agencies_checkbox, model_dropdown],
-        outputs=[msg, chatbot]
-    )
-    
-    msg.submit(
-        autonomous_chat,
-        inputs=[msg, chatbot, agencies_checkbox, model_dropdown],
-        outputs=[msg, chatbot]
-    )
-    
-    clear_btn.click(
-        lambda: None,
-        None,
-        chatbot,
-        queue=False
-    )
-    
-    reset_btn.click(
-        reset_conversation,
-        outputs=[chatbot, msg]
-    )
-    
-    refresh_btn.click(
-        get_system_status,
-        outputs=status_output
-    )
+        # Event handlers
+        submit_btn.click(
+            chat,
+            inputs=[msg, chatbot, agencies_checkbox, model_dropdown],
+            outputs=[msg, chatbot]
+        )
+        
+        msg.submit(
+            chat,
+            inputs=[msg, chatbot, agencies_checkbox, model_dropdown],
+            outputs=[msg, chatbot]
+        )
+        
+        clear_btn.click(
+            lambda: None,
+            None,
+            chatbot,
+            queue=False
+        )
+        
+        reset_btn.click(
+            reset,
+            outputs=[chatbot, msg]
+        )
+        
+        refresh_btn.click(
+            get_system_status,
+            outputs=status_output
+        )
+        
+        # Load status on startup
+        demo.load(
+            get_system_status,
+            outputs=status_output
+        )
+
+    # Let several users' queries run at once instead of one at a time
+    demo.queue(default_concurrency_limit=8, max_size=64)
     
-    # Load status on startup
-    demo.load(
-        get_system_status,
-        outputs=status_output
-    )
+    return demo
 
 
 if __name__ == "__main__":
+    from app.core.config import ensure_directories
+    from app.core.logging_config import configure_queue_logging
+    
+    # Set up as the run_autonomous.py launcher does
+    configure_queue_logging()
+    ensure_directories()
+    
     logger.info("Starting Autonomous Gradio interface...")
+    demo = build_demo()
     demo.launch(
         server_name="0.0.0.0",
         server_port=7860,
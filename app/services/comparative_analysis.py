@@ -1,33 +1,147 @@
 """
 Comparative analysis service for synthesizing findings across multiple agencies.
 """
-from typing import Dict, List
-from openai import OpenAI
+from typing import AsyncIterator, Dict, List, Optional
+from collections import defaultdict
+from functools import lru_cache
+from openai import AsyncOpenAI
+import hashlib
 import logging
+import re
+
+import numpy as np
+import tiktoken
 
 from app.core.config import get_settings
+from app.services.openai_client import get_async_openai_client, get_openai_client
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = """You are an expert regulatory affairs analyst specializing in comparative analysis across international regulatory agencies (FDA, EMA, Health Canada, TGA, etc.).
+
+Your task is to:
+1. Summarize findings from each agency separately
+2. Identify key similarities across agencies
+3. Highlight important differences or discrepancies
+4. Provide an integrated synthesis
+5. Note any gaps or areas where agencies diverge
+
+Be precise, cite specific documents, and maintain scientific rigor."""
+
+PROMPT_HEADER = "**User Question:** {query}\n\n**Regulatory Documents by Agency:**\n\n"
+
+COMPARATIVE_INSTRUCTIONS = """
+**Instructions:**
+
+Please provide a comprehensive comparative analysis with the following structure:
+
+1. **Individual Agency Summaries:**
+   - Summarize key findings from each agency separately
+   - Include specific data points, conclusions, and recommendations
+
+2. **Similarities Across Agencies:**
+   - Identify areas of consensus
+   - Note common findings or conclusions
+
+3. **Differences and Discrepancies:**
+   - Highlight where agencies diverge
+   - Explain potential reasons for differences
+   - Note any conflicting data or conclusions
+
+4. **Integrated Synthesis:**
+   - Provide an overall assessment based on the totality of evidence
+   - Reconcile differences where possible
+   - Identify the most reliable or comprehensive findings
+
+5. **Key Takeaways:**
+   - Summarize the most important points
+   - Note any gaps in the available information
+
+Use specific citations from the documents provided.
+"""
+
+# Agency markers in document names, mapped to the agency they identify
+_AGENCY_RE = re.compile(r"FDA|EMA|EPAR|CHMP|HEALTH CANADA|HPFB|TGA|SWISSMEDIC|NHRA")
+_AGENCY_MAP = {
+    'FDA': 'FDA',
+    'EMA': 'EMA',
+    'EPAR': 'EMA',
+    'CHMP': 'EMA',
+    'HEALTH CANADA': 'Health Canada',
+    'HPFB': 'Health Canada',
+    'TGA': 'TGA',
+    'SWISSMEDIC': 'Swissmedic',
+    'NHRA': 'NHRA'
+}
+
+
+@lru_cache(maxsize=2048)
+def _doc_agency(doc_name: str) -> str:
+    """Identify the agency from a document name (memoized per distinct name)."""
+    match = _AGENCY_RE.search(doc_name.upper())
+    return _AGENCY_MAP[match.group()] if match else 'Unknown'
+
+
+@lru_cache()
+def _get_encoding() -> tiktoken.Encoding:
+    """Get the tokenizer used to bound document excerpts (loaded on first use)."""
+    return tiktoken.encoding_for_model("gpt-4")
+
+
+def _mmr_select(embeddings: np.ndarray, relevance: np.ndarray, k: int, lam: float) -> List[int]:
+    """
+    Pick rows by maximal marginal relevance.
+    
+    Args:
+        embeddings: One embedding per candidate (rows)
+        relevance: Relevance of each candidate to the query
+        k: Number of candidates to pick
+        lam: Weight of relevance against redundancy with already picked rows
+        
+    Returns:
+        Indices of the picked candidates, in pick order
+    """
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.maximum(norms, 1e-12)
+    similarity = normalized @ normalized.T
+    
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    
+    while len(selected) < min(k, len(relevance)):
+        scores = lam * relevance - (1 - lam) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    
+    return selected
+
 
 class ComparativeAnalysisService:
     """Service for generating comparative analyses across regulatory agencies."""
     
+    # Prompt size limits for document excerpts
+    MAX_CONTEXTS_PER_AGENCY = 5
+    MMR_LAMBDA = 0.7  # Relevance vs. diversity when more contexts are retrieved than fit
+    MAX_TOKENS_PER_CONTEXT = 250
+    PROMPT_TOKEN_BUDGET = 6000  # Shared evenly between the compared agencies
+    
     def __init__(self):
         self.settings = get_settings()
-        self.client = OpenAI(
-            api_key=self.settings.openai_api_key,
-            base_url='https://api.openai.com/v1'
-        )
+        self.client = get_openai_client()
+    
+    def _get_async_client(self) -> AsyncOpenAI:
+        """Get the shared async OpenAI client for the running event loop."""
+        return get_async_openai_client()
     
     def generate_comparative_analysis(
         self,
         query: str,
         contexts: List[Dict],
         agencies: List[str],
-        model: str = None
+        model: str = None,
+        agency_contexts: Optional[Dict[str, List[Dict]]] = None
     ) -> Dict:
         """
         Generate a comparative analysis across multiple agencies.
@@ -37,6 +151,7 @@ class ComparativeAnalysisService:
             contexts: List of context chunks from different agencies
             agencies: List of agencies being compared
             model: OpenAI model to use
+            agency_contexts: Contexts already organized by organize_by_agency
             
         Returns:
             Dictionary with comparative analysis
@@ -45,51 +160,66 @@ class ComparativeAnalysisService:
             if model is None:
                 model = self.settings.chat_model
             
-            logger.info(f"Generating comparative analysis across {len(agencies)} agencies")
-            
-            # Organize contexts by agency
-            agency_contexts = self._organize_by_agency(contexts)
+            if agency_contexts is None:
+                agency_contexts = self.organize_by_agency(contexts)
+            present = self.agencies_with_contexts(agency_contexts, agencies)
+            if len(present) < 2:
+                return self._fallback_result(present)
             
-            # Build comparative prompt
-            prompt = self._build_comparative_prompt(query, agency_contexts, agencies)
+            logger.info(f"Generating comparative analysis across {len(agencies)} agencies")
             
-            # Generate analysis
             response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are an expert regulatory affairs analyst specializing in comparative analysis across international regulatory agencies (FDA, EMA, Health Canada, TGA, etc.).
-
-Your task is to:
-1. Summarize findings from each agency separately
-2. Identify key similarities across agencies
-3. Highlight important differences or discrepancies
-4. Provide an integrated synthesis
-5. Note any gaps or areas where agencies diverge
-
-Be precise, cite specific documents, and maintain scientific rigor."""
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=2000
+                **self._build_request(query, agency_contexts, agencies, model)
             )
             
-            analysis = response.choices[0].message.content
-            
-            logger.info(f"✓ Generated comparative analysis ({len(analysis)} characters)")
+            return self._build_result(response, contexts, agencies, model)
             
+        except Exception as e:
+            logger.error(f"Error generating comparative analysis: {str(e)}")
             return {
-                'status': 'success',
-                'analysis': analysis,
-                'agencies_compared': agencies,
-                'num_contexts': len(contexts),
-                'model_used': model
+                'status': 'error',
+                'error': str(e),
+                'analysis': f"Error generating comparative analysis: {str(e)}"
             }
+    
+    async def agenerate_comparative_analysis(
+        self,
+        query: str,
+        contexts: List[Dict],
+        agencies: List[str],
+        model: str = None,
+        agency_contexts: Optional[Dict[str, List[Dict]]] = None
+    ) -> Dict:
+        """
+        Generate a comparative analysis without blocking the event loop.
+        
+        Args:
+            query: User's query
+            contexts: List of context chunks from different agencies
+            agencies: List of agencies being compared
+            model: OpenAI model to use
+            agency_contexts: Contexts already organized by organize_by_agency
+            
+        Returns:
+            Dictionary with comparative analysis
+        """
+        try:
+            if model is None:
+                model = self.settings.chat_model
+            
+            if agency_contexts is None:
+                agency_contexts = self.organize_by_agency(contexts)
+            present = self.agencies_with_contexts(agency_contexts, agencies)
+            if len(present) < 2:
+                return self._fallback_result(present)
+            
+            logger.info(f"Generating comparative analysis across {len(agencies)} agencies")
+            
+            response = await self._get_async_client().chat.completions.create(
+                **self._build_request(query, agency_contexts, agencies, model)
+            )
+            
+            return self._build_result(response, contexts, agencies, model)
             
         except Exception as e:
             logger.error(f"Error generating comparative analysis: {str(e)}")
@@ -99,9 +229,134 @@ Be precise, cite specific documents, and maintain scientific rigor."""
                 'analysis': f"Error generating comparative analysis: {str(e)}"
             }
     
-    def _organize_by_agency(self, contexts: List[Dict]) -> Dict[str, List[Dict]]:
+    async def astream_comparative_analysis(
+        self,
+        query: str,
+        contexts: List[Dict],
+        agencies: List[str],
+        model: str = None,
+        agency_contexts: Optional[Dict[str, List[Dict]]] = None
+    ) -> AsyncIterator[str]:
         """
-        Organize context chunks by agency.
+        Stream a comparative analysis as it is generated.
+        
+        Args:
+            query: User's query
+            contexts: List of context chunks from different agencies
+            agencies: List of agencies being compared
+            model: OpenAI model to use
+            agency_contexts: Contexts already organized by organize_by_agency
+            
+        Yields:
+            Pieces of the analysis text, in order
+        """
+        if model is None:
+            model = self.settings.chat_model
+        
+        if agency_contexts is None:
+            agency_contexts = self.organize_by_agency(contexts)
+        
+        logger.info(f"Streaming comparative analysis across {len(agencies)} agencies")
+        
+        stream = await self._get_async_client().chat.completions.create(
+            **self._build_request(query, agency_contexts, agencies, model),
+            stream=True
+        )
+        
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    def agencies_with_contexts(
+        self,
+        agency_contexts: Dict[str, List[Dict]],
+        agencies: List[str]
+    ) -> List[str]:
+        """
+        List the requested agencies that have at least one context chunk.
+        
+        Args:
+            agency_contexts: Contexts organized by organize_by_agency
+            agencies: Agencies requested for comparison
+            
+        Returns:
+            Agencies with contexts, in request order
+        """
+        return [agency for agency in agencies if agency_contexts.get(agency)]
+    
+    def _fallback_result(self, present: List[str]) -> Dict:
+        """
+        Build the result returned when there is nothing to compare.
+        
+        Args:
+            present: Agencies that do have contexts (at most one)
+            
+        Returns:
+            Dictionary flagging that a single-agency answer should be used
+        """
+        logger.info(f"Only {present or 'no agencies'} returned contexts - skipping comparative analysis")
+        return {
+            'status': 'success',
+            'analysis': None,
+            'agencies_compared': present,
+            'fallback': True
+        }
+    
+    def _build_request(
+        self,
+        query: str,
+        agency_contexts: Dict[str, List[Dict]],
+        agencies: List[str],
+        model: str
+    ) -> Dict:
+        """
+        Build the chat completion request for a comparative analysis.
+        
+        Args:
+            query: User's query
+            agency_contexts: Context chunks organized by agency
+            agencies: List of agencies being compared
+            model: OpenAI model to use
+            
+        Returns:
+            Keyword arguments for chat.completions.create
+        """
+        # Build comparative prompt
+        prompt = self._build_comparative_prompt(query, agency_contexts, agencies)
+        
+        return {
+            'model': model,
+            'messages': [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            'temperature': 0.3,
+            'max_tokens': 2000
+        }
+    
+    def _build_result(
+        self,
+        response,
+        contexts: List[Dict],
+        agencies: List[str],
+        model: str
+    ) -> Dict:
+        """Convert a chat completion response into an analysis result."""
+        analysis = response.choices[0].message.content
+        
+        logger.info(f"✓ Generated comparative analysis ({len(analysis)} characters)")
+        
+        return {
+            'status': 'success',
+            'analysis': analysis,
+            'agencies_compared': agencies,
+            'num_contexts': len(contexts),
+            'model_used': model
+        }
+    
+    def organize_by_agency(self, contexts: List[Dict]) -> Dict[str, List[Dict]]:
+        """
+        Organize context chunks by agency, dropping duplicate chunks.
         
         Args:
             contexts: List of context chunks
@@ -109,18 +364,49 @@ Be precise, cite specific documents, and maintain scientific rigor."""
         Returns:
             Dictionary mapping agency names to their contexts
         """
-        agency_contexts = {}
+        agency_contexts = defaultdict(list)
+        seen = set()
         
         for context in contexts:
-            # Extract agency from document name or metadata
-            agency = self._extract_agency(context)
+            # Skip chunks whose text was already included (e.g. the same
+            # passage indexed from two copies of a document), ignoring
+            # whitespace differences
+            text = context.get('text') or context.get('chunk_text', '')
+            normalized = ' '.join(text.split())
+            digest = hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
             
-            if agency not in agency_contexts:
-                agency_contexts[agency] = []
+            # Extract agency from document name or metadata
+            agency_contexts[self._extract_agency(context)].append(context)
+        
+        # Keep a diverse set of excerpts when an agency has more than fit the prompt
+        for agency, group in agency_contexts.items():
+            if len(group) > self.MAX_CONTEXTS_PER_AGENCY and all('embedding' in c for c in group):
+                agency_contexts[agency] = self._diversify(group)
+        
+        return dict(agency_contexts)
+    
+    def _diversify(self, contexts: List[Dict]) -> List[Dict]:
+        """
+        Rerank an agency's contexts by maximal marginal relevance.
+        
+        Args:
+            contexts: Context chunks carrying their 'embedding'
             
-            agency_contexts[agency].append(context)
+        Returns:
+            The MAX_CONTEXTS_PER_AGENCY most relevant, least redundant contexts
+        """
+        embeddings = np.vstack([context['embedding'] for context in contexts]).astype('float32')
+        # Embeddings are unit length, so squared L2 distance d maps to cosine 1 - d/2
+        relevance = np.array(
+            [1 - context.get('distance', 0.0) / 2 for context in contexts],
+            dtype='float32'
+        )
         
-        return agency_contexts
+        picked = _mmr_select(embeddings, relevance, self.MAX_CONTEXTS_PER_AGENCY, self.MMR_LAMBDA)
+        return [contexts[i] for i in picked]
     
     def _extract_agency(self, context: Dict) -> str:
         """
@@ -133,26 +419,12 @@ Be precise, cite specific documents, and maintain scientific rigor."""
             Agency name
         """
         # Check metadata for agency
-        if 'agency' in context:
+        if context.get('agency'):
             return context['agency']
         
         # Try to extract from document name
-        doc_name = context.get('document', '').upper()
-        
-        if 'FDA' in doc_name:
-            return 'FDA'
-        elif 'EMA' in doc_name or 'EPAR' in doc_name or 'CHMP' in doc_name:
-            return 'EMA'
-        elif 'HEALTH CANADA' in doc_name or 'HPFB' in doc_name:
-            return 'Health Canada'
-        elif 'TGA' in doc_name:
-            return 'TGA'
-        elif 'SWISSMEDIC' in doc_name:
-            return 'Swissmedic'
-        elif 'NHRA' in doc_name:
-            return 'NHRA'
-        
-        return 'Unknown'
+        doc_name = context.get('document') or context.get('source_document', '')
+        return _doc_agency(doc_name)
     
     def _build_comparative_prompt(
         self,
@@ -171,51 +443,93 @@ Be precise, cite specific documents, and maintain scientific rigor."""
         Returns:
             Formatted prompt
         """
-        prompt = f"**User Question:** {query}\n\n"
-        prompt += "**Regulatory Documents by Agency:**\n\n"
+        agency_budget = self.PROMPT_TOKEN_BUDGET // max(len(agencies), 1)
+        excerpts = self._encode_excerpts(agency_contexts, agencies)
+        
+        sections = ''.join(
+            self._format_agency_section(
+                agency, agency_contexts.get(agency), excerpts[agency], agency_budget
+            )
+            for agency in agencies
+        )
+        
+        return PROMPT_HEADER.format(query=query) + sections + COMPARATIVE_INSTRUCTIONS
+    
+    def _encode_excerpts(
+        self,
+        agency_contexts: Dict[str, List[Dict]],
+        agencies: List[str]
+    ) -> Dict[str, List[List[int]]]:
+        """
+        Tokenize every excerpt that can appear in the prompt in one batch.
+        
+        tiktoken encodes a batch on its own thread pool with the GIL released,
+        so all agencies' excerpts are tokenized in parallel.
+        
+        Args:
+            agency_contexts: Contexts organized by agency
+            agencies: List of agencies
+            
+        Returns:
+            Dictionary mapping each agency to the tokens of its excerpts, in order
+        """
+        counts = []
+        texts = []
         
         for agency in agencies:
-            if agency in agency_contexts:
-                prompt += f"### {agency} Documents:\n\n"
-                
-                for i, context in enumerate(agency_contexts[agency][:5], 1):  # Limit to 5 per agency
-                    doc_name = context.get('document', 'Unknown')
-                    text = context.get('text', '')
-                    
-                    prompt += f"**{agency} Document {i}:** {doc_name}\n"
-                    prompt += f"```\n{text[:1000]}...\n```\n\n"
-            else:
-                prompt += f"### {agency} Documents:\n\n"
-                prompt += "*No documents available from this agency.*\n\n"
-        
-        prompt += """
-**Instructions:**
-
-Please provide a comprehensive comparative analysis with the following structure:
-
-1. **Individual Agency Summaries:**
-   - Summarize key findings from each agency separately
-   - Include specific data points, conclusions, and recommendations
-
-2. **Similarities Across Agencies:**
-   - Identify areas of consensus
-   - Note common findings or conclusions
-
-3. **Differences and Discrepancies:**
-   - Highlight where agencies diverge
-   - Explain potential reasons for differences
-   - Note any conflicting data or conclusions
-
-4. **Integrated Synthesis:**
-   - Provide an overall assessment based on the totality of evidence
-   - Reconcile differences where possible
-   - Identify the most reliable or comprehensive findings
-
-5. **Key Takeaways:**
-   - Summarize the most important points
-   - Note any gaps in the available information
-
-Use specific citations from the documents provided.
-"""
+            contexts = (agency_contexts.get(agency) or [])[:self.MAX_CONTEXTS_PER_AGENCY]
+            counts.append(len(contexts))
+            texts.extend(context.get('text') or context.get('chunk_text', '') for context in contexts)
+        
+        tokens = _get_encoding().encode_ordinary_batch(texts) if texts else []
+        
+        excerpts = {}
+        start = 0
+        for agency, count in zip(agencies, counts):
+            excerpts[agency] = tokens[start:start + count]
+            start += count
+        
+        return excerpts
+    
+    def _format_agency_section(
+        self,
+        agency: str,
+        contexts: Optional[List[Dict]],
+        excerpt_tokens: List[List[int]],
+        token_budget: int
+    ) -> str:
+        """
+        Format one agency's documents for the comparative prompt.
+        
+        Args:
+            agency: Agency name
+            contexts: The agency's context chunks (None if it has none)
+            excerpt_tokens: Tokens of the agency's excerpts (see _encode_excerpts)
+            token_budget: Maximum number of excerpt tokens for this agency
+            
+        Returns:
+            Prompt section for the agency
+        """
+        parts = [f"### {agency} Documents:\n\n"]
+        
+        if not contexts:
+            parts.append("*No documents available from this agency.*\n\n")
+            return ''.join(parts)
+        
+        encoding = _get_encoding()
+        remaining = token_budget
+        
+        for i, (context, tokens) in enumerate(zip(contexts, excerpt_tokens), 1):
+            if remaining <= 0:
+                break
+            
+            doc_name = context.get('document') or context.get('source_document', 'Unknown')
+            
+            # Bound excerpts by tokens rather than characters
+            tokens = tokens[:min(self.MAX_TOKENS_PER_CONTEXT, remaining)]
+            remaining -= len(tokens)
+            
+            parts.append(f"**{agency} Document {i}:** {doc_name}\n")
+            parts.append(f"```\n{encoding.decode(tokens)}...\n```\n\n")
         
-        return prompt
+        return ''.join(parts)
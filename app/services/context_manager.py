@@ -1,26 +1,47 @@
 """
 Conversational context manager for tracking drug, topics, and conversation state.
 """
-from typing import Dict, List, Optional
+from typing import Deque, Dict, List, Optional
+from collections import deque
 import logging
 from datetime import datetime
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Agencies searched when the user hasn't selected any
+DEFAULT_AGENCIES = ['FDA', 'EMA']
+
 
 class ConversationContext:
     """Manages conversation context across multiple queries."""
     
+    # Queries kept in the history; older ones are dropped as new ones arrive
+    MAX_HISTORY = 200
+    
     def __init__(self):
         self.current_drug: Optional[str] = None
-        self.agencies: List[str] = ['FDA', 'EMA']  # Default agencies
+        self.agencies: List[str] = list(DEFAULT_AGENCIES)
         self.topics: List[str] = []
         self.documents_indexed: List[str] = []
-        self.query_history: List[Dict] = []
+        self.query_history: Deque[Dict] = deque(maxlen=self.MAX_HISTORY)
+        self.queries_asked = 0
         self.created_at = datetime.now()
         self.last_updated = datetime.now()
+        
+        # Set mirrors of topics/documents_indexed for constant-time membership checks
+        self._topic_set: set = set()
+        self._document_set: set = set()
+        self._current_drug_lower: Optional[str] = None
+        
+        # Memoized snapshots, cleared by every mutator
+        self._dict_cache: Optional[Dict] = None
+        self._summary_cache: Optional[Dict] = None
+    
+    def _touch(self):
+        """Record a modification and drop the memoized snapshots."""
+        self.last_updated = datetime.now()
+        self._dict_cache = None
+        self._summary_cache = None
     
     def update_drug(self, drug_name: str):
         """
@@ -32,8 +53,10 @@ class ConversationContext:
         if self.current_drug != drug_name:
             logger.info(f"Switching drug context from '{self.current_drug}' to '{drug_name}'")
             self.current_drug = drug_name
+            self._current_drug_lower = drug_name.lower() if drug_name else None
             self.topics = []  # Reset topics for new drug
-            self.last_updated = datetime.now()
+            self._topic_set = set()
+            self._touch()
     
     def add_topics(self, topics: List[str]):
         """
@@ -43,10 +66,11 @@ class ConversationContext:
             topics: List of topics discussed
         """
         for topic in topics:
-            if topic not in self.topics:
+            if topic not in self._topic_set:
+                self._topic_set.add(topic)
                 self.topics.append(topic)
                 logger.info(f"Added topic: {topic}")
-        self.last_updated = datetime.now()
+        self._touch()
     
     def set_agencies(self, agencies: List[str]):
         """
@@ -57,7 +81,7 @@ class ConversationContext:
         """
         self.agencies = agencies
         logger.info(f"Updated agencies: {', '.join(agencies)}")
-        self.last_updated = datetime.now()
+        self._touch()
     
     def add_document(self, document_path: str):
         """
@@ -66,10 +90,11 @@ class ConversationContext:
         Args:
             document_path: Path to the indexed document
         """
-        if document_path not in self.documents_indexed:
+        if document_path not in self._document_set:
+            self._document_set.add(document_path)
             self.documents_indexed.append(document_path)
             logger.info(f"Recorded indexed document: {document_path}")
-        self.last_updated = datetime.now()
+        self._touch()
     
     def add_query(self, query: str, response: str, analysis: Dict):
         """
@@ -86,7 +111,8 @@ class ConversationContext:
             'response': response,
             'analysis': analysis
         })
-        self.last_updated = datetime.now()
+        self.queries_asked += 1
+        self._touch()
     
     def has_documents_for_drug(self, drug_name: str) -> bool:
         """
@@ -103,7 +129,7 @@ class ConversationContext:
         
         # Check if current drug matches and documents exist
         return (
-            self.current_drug.lower() == drug_name.lower() and 
+            self._current_drug_lower == drug_name.lower() and 
             len(self.documents_indexed) > 0
         )
     
@@ -125,7 +151,7 @@ class ConversationContext:
         if not self.current_drug:
             return True
         
-        if self.current_drug.lower() != drug_name.lower():
+        if self._current_drug_lower != drug_name.lower():
             return True
         
         if len(self.documents_indexed) == 0:
@@ -140,24 +166,32 @@ class ConversationContext:
         Returns:
             Dictionary with context information
         """
-        return {
-            'current_drug': self.current_drug,
-            'agencies': self.agencies,
-            'topics': self.topics,
-            'documents_indexed': len(self.documents_indexed),
-            'queries_asked': len(self.query_history),
-            'session_duration': (datetime.now() - self.created_at).total_seconds()
-        }
+        if self._summary_cache is None:
+            self._summary_cache = {
+                'current_drug': self.current_drug,
+                'agencies': list(self.agencies),
+                'topics': list(self.topics),
+                'documents_indexed': len(self.documents_indexed),
+                'queries_asked': self.queries_asked
+            }
+        
+        summary = dict(self._summary_cache)
+        summary['session_duration'] = (datetime.now() - self.created_at).total_seconds()
+        return summary
     
     def reset(self):
         """Reset the conversation context."""
         logger.info("Resetting conversation context")
         self.current_drug = None
+        self._current_drug_lower = None
         self.topics = []
+        self._topic_set = set()
         self.documents_indexed = []
-        self.query_history = []
-        self.agencies = ['FDA', 'EMA']  # Reset to defaults
-        self.last_updated = datetime.now()
+        self._document_set = set()
+        self.query_history.clear()
+        self.queries_asked = 0
+        self.agencies = list(DEFAULT_AGENCIES)  # Reset to defaults
+        self._touch()
     
     def to_dict(self) -> Dict:
         """
@@ -166,12 +200,15 @@ class ConversationContext:
         Returns:
             Dictionary representation of context
         """
-        return {
-            'current_drug': self.current_drug,
-            'agencies': self.agencies,
-            'topics': self.topics,
-            'has_documents': len(self.documents_indexed) > 0
-        }
+        if self._dict_cache is None:
+            self._dict_cache = {
+                'current_drug': self.current_drug,
+                'agencies': list(self.agencies),
+                'topics': list(self.topics),
+                'has_documents': len(self.documents_indexed) > 0
+            }
+        
+        return dict(self._dict_cache)
 
 
 class ContextManager:
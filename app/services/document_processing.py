@@ -2,25 +2,153 @@
 Document processing services for PDF parsing and text chunking.
 """
 import fitz  # PyMuPDF
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import Iterable, Iterator, List, Tuple, Dict, Optional
+import hashlib
 import logging
+import os
+import threading
+
+import orjson
+import tiktoken
+
+from app.core.config import get_settings
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _file_version(file_path: str) -> Optional[Tuple[int, int]]:
+    """
+    Get a file's (mtime_ns, size), which identifies its current content.
+    
+    The file is stat'ed on every call: a cached result would miss files
+    created or rewritten since it was taken.
+    
+    Args:
+        file_path: Path to the file
+        
+    Returns:
+        (mtime_ns, size), or None if the file does not exist
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> str:
+    """
+    Extract the text of a range of pages (runs in a worker process).
+    
+    Each worker opens its own document: PyMuPDF documents cannot be shared
+    between threads or processes.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        start: First page index
+        stop: Page index after the last page
+        
+    Returns:
+        Text of the pages, in order
+    """
+    with fitz.open(pdf_path) as doc:
+        return "".join(doc[i].get_text("text", sort=False) for i in range(start, stop))
+
+
 class PDFParserService:
     """Service for extracting text from PDF documents."""
     
+    # Below this many pages, starting worker processes costs more than it saves
+    PARALLEL_MIN_PAGES = 64
+    
+    # Idle opened documents, most recently used last:
+    # (thread id, path) -> (mtime_ns, size, document). PyMuPDF documents aren't
+    # thread-safe, so each is only reused by the thread that opened it, and is
+    # taken out of the pool while in use
+    MAX_OPEN_DOCUMENTS = 8
+    _documents: "OrderedDict[Tuple[int, str], Tuple[int, int, fitz.Document]]" = OrderedDict()
+    _documents_lock = threading.Lock()
+    
+    @staticmethod
+    @contextmanager
+    def open_document(pdf_path: str) -> Iterator[fitz.Document]:
+        """
+        Open a PDF, reusing a document opened earlier if the file is unchanged.
+        
+        Opening parses the cross-reference table and catalog, which is slow for
+        large PDFs; validating and then processing a download opens it twice.
+        Only documents opened earlier on the calling thread are reused.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            
+        Yields:
+            Opened document (owned by the pool; do not close it)
+        """
+        pdf_path = str(pdf_path)
+        version = _file_version(pdf_path)
+        if version is None:
+            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+        key = (threading.get_ident(), pdf_path)
+        doc = None
+        
+        with PDFParserService._documents_lock:
+            cached = PDFParserService._documents.pop(key, None)
+        if cached is not None:
+            if cached[:2] == version:
+                doc = cached[2]
+            else:
+                cached[2].close()
+        
+        if doc is None:
+            doc = fitz.open(pdf_path)
+        
+        try:
+            yield doc
+        finally:
+            PDFParserService._return_document(key, version, doc)
+    
+    @staticmethod
+    def _return_document(key: Tuple[int, str], version: Tuple[int, int], doc: fitz.Document):
+        """Put a document back in the pool, closing whatever no longer fits."""
+        to_close = []
+        
+        with PDFParserService._documents_lock:
+            documents = PDFParserService._documents
+            if key in documents:
+                # Opened again meanwhile (nested use on this thread); keep one copy
+                to_close.append(doc)
+            else:
+                documents[key] = (*version, doc)
+            while len(documents) > PDFParserService.MAX_OPEN_DOCUMENTS:
+                to_close.append(documents.popitem(last=False)[1][2])
+        
+        for stale in to_close:
+            stale.close()
+    
+    @staticmethod
+    def close_all():
+        """Close every pooled document (e.g. at shutdown)."""
+        with PDFParserService._documents_lock:
+            documents = [entry[2] for entry in PDFParserService._documents.values()]
+            PDFParserService._documents.clear()
+        
+        for doc in documents:
+            doc.close()
+    
     @staticmethod
-    def extract_text(pdf_path: str) -> str:
+    def extract_text(pdf_path: str, workers: int = 1) -> str:
         """
         Extract text content from a PDF file.
         
         Args:
             pdf_path: Path to the PDF file
+            workers: Number of processes to split the pages of large PDFs across
             
         Returns:
             Extracted text as a single string
@@ -29,56 +157,104 @@ class PDFParserService:
             FileNotFoundError: If PDF file doesn't exist
             Exception: If PDF extraction fails
         """
-        pdf_file = Path(pdf_path)
-        
-        if not pdf_file.exists():
-            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
-        
-        if not pdf_file.suffix.lower() == '.pdf':
-            raise ValueError(f"File is not a PDF: {pdf_path}")
-        
         try:
-            doc = fitz.open(pdf_path)
-            text = ""
-            
-            for page_num, page in enumerate(doc, 1):
-                page_text = page.get_text()
-                text += page_text
-                logger.debug(f"Extracted page {page_num}/{len(doc)}")
-            
-            doc.close()
+            # Join once instead of growing the string page by page
+            text = "".join(PDFParserService.iter_page_texts(pdf_path, workers=workers))
             
             if not text.strip():
                 raise ValueError("No text content extracted from PDF")
             
-            logger.info(f"✓ Extracted {len(text)} characters from {pdf_file.name}")
+            logger.info(f"✓ Extracted {len(text)} characters from {Path(pdf_path).name}")
             return text
             
+        except FileNotFoundError:
+            raise
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {str(e)}")
             raise Exception(f"Failed to extract text from PDF: {str(e)}")
+    
+    @staticmethod
+    def iter_page_texts(pdf_path: str, workers: int = 1) -> Iterator[str]:
+        """
+        Extract a PDF's text page by page, without holding the whole document's text.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            workers: Number of processes to split the pages of large PDFs across
+                (each then yields a contiguous page range instead of one page)
+            
+        Yields:
+            Text of each page (or page range), in page order
+            
+        Raises:
+            FileNotFoundError: If PDF file doesn't exist
+            ValueError: If the file is not a PDF
+        """
+        pdf_file = Path(pdf_path)
+        
+        if _file_version(pdf_path) is None:
+            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+        
+        if not pdf_file.suffix.lower() == '.pdf':
+            raise ValueError(f"File is not a PDF: {pdf_path}")
+        
+        with PDFParserService.open_document(pdf_path) as doc:
+            page_count = len(doc)
+            
+            if workers <= 1 or page_count < PDFParserService.PARALLEL_MIN_PAGES:
+                debug = logger.isEnabledFor(logging.DEBUG)
+                for page_num, page in enumerate(doc, 1):
+                    yield page.get_text("text", sort=False)
+                    if debug:
+                        logger.debug("Extracted page %d/%d", page_num, page_count)
+                return
+        
+        yield from PDFParserService._extract_parallel(pdf_path, page_count, workers)
+    
+    @staticmethod
+    def _extract_parallel(pdf_path: str, page_count: int, workers: int) -> Iterator[str]:
+        """
+        Extract a PDF's pages in contiguous ranges across worker processes.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            page_count: Number of pages in the PDF
+            workers: Number of worker processes
+            
+        Yields:
+            Text of each page range, in page order
+        """
+        workers = min(workers, page_count)
+        bounds = [page_count * i // workers for i in range(workers + 1)]
+        
+        logger.info(f"Extracting {page_count} pages with {workers} processes")
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(
+                _extract_page_range,
+                [pdf_path] * workers,
+                bounds[:-1],
+                bounds[1:]
+            )
+
+
+@lru_cache()
+def _get_encoding(model: str) -> tiktoken.Encoding:
+    """Get the tokenizer of an embedding model (loaded on first use)."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
 
 
 class TextChunkingService:
     """Service for chunking text into smaller segments."""
     
     @staticmethod
-    def chunk_text(
-        text: str, 
-        chunk_size: int = 1000, 
-        overlap: int = 100
-    ) -> List[str]:
+    def _validate_window(chunk_size: int, overlap: int):
         """
-        Split text into overlapping chunks.
+        Check chunk size and overlap.
         
-        Args:
-            text: The text to chunk
-            chunk_size: Maximum size of each chunk in characters
-            overlap: Number of characters to overlap between chunks
-            
-        Returns:
-            List of text chunks
-            
         Raises:
             ValueError: If parameters are invalid
         """
@@ -90,48 +266,194 @@ class TextChunkingService:
         
         if overlap >= chunk_size:
             raise ValueError("overlap must be less than chunk_size")
+    
+    @staticmethod
+    def chunk_stream(
+        texts: Iterable[str],
+        chunk_size: int = 250,
+        overlap: int = 25,
+        model: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        Split a stream of texts (e.g. PDF pages) into overlapping token chunks.
         
-        if not text or not text.strip():
-            raise ValueError("Text cannot be empty")
-        
-        chunks = []
-        start = 0
-        text_length = len(text)
+        Each text is tokenized as it arrives and only the tokens of the chunk
+        being filled are kept, so memory stays proportional to one page rather
+        than the whole document. Chunks span text boundaries; each text is
+        tokenized on its own, so no token straddles two texts.
         
-        while start < text_length:
-            end = start + chunk_size
-            chunk = text[start:end]
+        Args:
+            texts: Consecutive pieces of the text to chunk
+            chunk_size: Maximum size of each chunk in tokens
+            overlap: Number of tokens to overlap between chunks
+            model: Embedding model whose tokenizer to use (defaults to settings)
             
-            # Only add non-empty chunks
-            if chunk.strip():
-                chunks.append(chunk)
+        Yields:
+            Non-empty text chunks, in order
             
-            start += chunk_size - overlap
+        Raises:
+            ValueError: If parameters are invalid
+        """
+        TextChunkingService._validate_window(chunk_size, overlap)
         
-        logger.info(f"✓ Created {len(chunks)} chunks from {text_length} characters")
-        return chunks
+        encoding = _get_encoding(model or get_settings().embedding_model)
+        step = chunk_size - overlap
+        buffer: List[int] = []
+        num_tokens = 0
+        num_chunks = 0
+        
+        for text in texts:
+            tokens = encoding.encode_ordinary(text)
+            num_tokens += len(tokens)
+            buffer.extend(tokens)
+            
+            # Windows that fit in the buffer are sliced at their token offsets,
+            # and the consumed tokens are dropped once per text
+            starts = range(0, len(buffer) - chunk_size + 1, step)
+            for start in starts:
+                chunk = encoding.decode(buffer[start:start + chunk_size])
+                # Only yield non-empty chunks
+                if chunk and not chunk.isspace():
+                    num_chunks += 1
+                    yield chunk
+            if starts:
+                del buffer[:starts[-1] + step]
+        
+        # Windows that start in the remaining tail (shorter than chunk_size)
+        for start in range(0, len(buffer), step):
+            chunk = encoding.decode(buffer[start:start + chunk_size])
+            if chunk and not chunk.isspace():
+                num_chunks += 1
+                yield chunk
+        
+        logger.info(f"✓ Created {num_chunks} chunks from {num_tokens} tokens")
+
+
+@lru_cache(maxsize=1024)
+def _content_hash(file_path: str, mtime_ns: int, size: int) -> str:
+    """
+    Hash a file's content (cached while its modification time and size are unchanged).
+    
+    Args:
+        file_path: Path to the file
+        mtime_ns: File modification time, part of the cache key
+        size: File size in bytes, part of the cache key
+        
+    Returns:
+        Hex SHA-256 digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _tally_lengths(texts: Iterable[str], lengths: List[int]) -> Iterator[str]:
+    """Pass texts through unchanged, recording each one's length."""
+    for text in texts:
+        lengths.append(len(text))
+        yield text
 
 
 class DocumentProcessor:
     """Main document processing pipeline."""
     
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None):
         self.pdf_parser = PDFParserService()
         self.text_chunker = TextChunkingService()
+        
+        # Parsed chunks are cached on disk by file content, so re-ingesting a
+        # document (e.g. downloaded again for another query) skips PDF parsing
+        self.cache_dir = Path(cache_dir or get_settings().document_cache_dir)
+    
+    def _cache_path(self, file_path: str, chunk_size: int, overlap: int) -> Path:
+        """Get the cache file for a document's content, tokenizer and chunking parameters."""
+        version = _file_version(file_path)
+        if version is None:
+            raise FileNotFoundError(f"File not found: {file_path}")
+        content_hash = _content_hash(str(file_path), *version)
+        model = get_settings().embedding_model
+        return self.cache_dir / f"{content_hash}_{model}_{chunk_size}t_{overlap}t.json"
+    
+    def load_cached(
+        self,
+        file_path: str,
+        chunk_size: int = 250,
+        overlap: int = 25
+    ) -> Optional[Tuple[List[str], Dict]]:
+        """
+        Get a document's chunks and metadata from the cache.
+        
+        Args:
+            file_path: Path to the document
+            chunk_size: Size of text chunks in tokens
+            overlap: Overlap between chunks in tokens
+            
+        Returns:
+            Tuple of (chunks, metadata), or None if the document is not cached
+        """
+        try:
+            cached = orjson.loads(self._cache_path(file_path, chunk_size, overlap).read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        
+        chunks = cached['chunks']
+        logger.info(f"✓ Loaded {len(chunks)} cached chunks for {Path(file_path).name}")
+        return chunks, self._build_metadata(file_path, chunks, cached['total_length'], chunk_size, overlap)
+    
+    def _store_cached(
+        self,
+        file_path: str,
+        chunks: List[str],
+        total_length: int,
+        chunk_size: int,
+        overlap: int
+    ):
+        """Write a document's chunks to the cache (atomically, so readers never see partial files)."""
+        try:
+            cache_path = self._cache_path(file_path, chunk_size, overlap)
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(orjson.dumps({'chunks': chunks, 'total_length': total_length}))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not cache chunks for {file_path}: {str(e)}")
+    
+    def _build_metadata(
+        self,
+        file_path: str,
+        chunks: List[str],
+        total_length: int,
+        chunk_size: int,
+        overlap: int
+    ) -> Dict:
+        """Build the metadata returned alongside a document's chunks."""
+        return {
+            "file_path": str(file_path),
+            "file_name": Path(file_path).name,
+            "num_chunks": len(chunks),
+            "total_length": total_length,
+            "chunk_size": chunk_size,
+            "overlap": overlap
+        }
     
     def process_document(
         self, 
         file_path: str, 
-        chunk_size: int = 1000, 
-        overlap: int = 100
+        chunk_size: int = 250, 
+        overlap: int = 25,
+        workers: int = 1
     ) -> Tuple[List[str], Dict]:
         """
         Process a document and return chunks with metadata.
         
         Args:
             file_path: Path to the document
-            chunk_size: Size of text chunks
-            overlap: Overlap between chunks
+            chunk_size: Size of text chunks in tokens
+            overlap: Overlap between chunks in tokens
+            workers: Number of processes to parse a large PDF's pages with
             
         Returns:
             Tuple of (chunks, metadata)
@@ -142,24 +464,28 @@ class DocumentProcessor:
         try:
             logger.info(f"Processing document: {file_path}")
             
-            # Extract text
-            text = self.pdf_parser.extract_text(file_path)
+            if _file_version(file_path) is not None:
+                cached = self.load_cached(file_path, chunk_size, overlap)
+                if cached is not None:
+                    return cached
             
-            # Chunk text
-            chunks = self.text_chunker.chunk_text(text, chunk_size, overlap)
+            # Extract and chunk page by page, so the full text is never held at once
+            page_lengths = []
+            pages = self.pdf_parser.iter_page_texts(file_path, workers=workers)
+            chunks = list(self.text_chunker.chunk_stream(
+                _tally_lengths(pages, page_lengths), chunk_size, overlap
+            ))
+            
+            if not chunks:
+                raise ValueError("No text content extracted from PDF")
+            
+            total_length = sum(page_lengths)
+            self._store_cached(file_path, chunks, total_length, chunk_size, overlap)
             
             # Create metadata
-            file_path_obj = Path(file_path)
-            metadata = {
-                "file_path": str(file_path),
-                "file_name": file_path_obj.name,
-                "num_chunks": len(chunks),
-                "total_length": len(text),
-                "chunk_size": chunk_size,
-                "overlap": overlap
-            }
-            
-            logger.info(f"✓ Successfully processed {file_path_obj.name}: {len(chunks)} chunks")
+            metadata = self._build_metadata(file_path, chunks, total_length, chunk_size, overlap)
+            
+            logger.info(f"✓ Successfully processed {metadata['file_name']}: {len(chunks)} chunks")
             return chunks, metadata
             
         except Exception as e:
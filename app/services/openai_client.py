@@ -0,0 +1,57 @@
+"""
+Shared OpenAI clients for all services.
+"""
+from functools import lru_cache
+from typing import Optional, Tuple
+import asyncio
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from app.core.config import get_settings
+
+OPENAI_BASE_URL = 'https://api.openai.com/v1'
+
+# Keep as many idle connections as may be in use at once, so bursts of
+# parallel calls (per-agency retrieval, batched queries) reuse warm TLS sessions
+CONNECTION_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=100)
+
+
+@lru_cache()
+def get_openai_client() -> OpenAI:
+    """
+    Get the OpenAI client shared by all services.
+
+    Returns:
+        OpenAI client with a single connection pool
+    """
+    return OpenAI(
+        api_key=get_settings().openai_api_key,
+        base_url=OPENAI_BASE_URL,
+        http_client=httpx.Client(limits=CONNECTION_LIMITS)
+    )
+
+
+# Async clients hold connections bound to the event loop that created them
+_async_client: Optional[AsyncOpenAI] = None
+_async_client_key: Optional[Tuple[str, asyncio.AbstractEventLoop]] = None
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """
+    Get the async OpenAI client shared by all services on the running event loop.
+
+    Returns:
+        AsyncOpenAI client for the running loop
+    """
+    global _async_client, _async_client_key
+    api_key = get_settings().openai_api_key
+    key = (api_key, asyncio.get_running_loop())
+    if _async_client is None or _async_client_key != key:
+        _async_client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=OPENAI_BASE_URL,
+            http_client=httpx.AsyncClient(limits=CONNECTION_LIMITS)
+        )
+        _async_client_key = key
+    return _async_client
@@ -1,35 +1,315 @@
 """
 Intelligent query analyzer for extracting drug names and intent from user queries.
 """
-from typing import Dict, List, Optional
-from openai import OpenAI
+from typing import AbstractSet, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
 import logging
+import copy
+import hashlib
 import json
+import os
+import re
+import threading
+
+import orjson
 
 from app.core.config import get_settings
+from app.services.openai_client import get_openai_client
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9\-]*")
+
+# "about X", "for X", ... where X is the first word after the phrase; the
+# phrases are tried in this order
+_DRUG_EXTRACT_PHRASES = ("about ", "for ", "regarding ", "concerning ")
+
+# Words that need the model's judgement (comparisons, agencies, explicit
+# retrieval requests), so queries containing them skip the fast path
+_MODEL_TERMS = frozenset({
+    'compare', 'comparison', 'comparative', 'vs', 'versus', 'difference', 'differences',
+    'differ', 'between', 'fda', 'ema', 'canada', 'tga', 'swissmedic', 'nhra',
+    'agency', 'agencies', 'research', 'additional', 'new',
+    'than', 'or', 'alternative', 'alternatives', 'other', 'others'
+})
+
+# Endings of generic drug names (USAN/INN stems), for spotting drugs that
+# aren't indexed yet
+_DRUG_STEM_RE = re.compile(
+    r"(?:mab|nib|pril|sartan|olol|statin|parin|farin|azole|cillin|mycin|cycline|"
+    r"floxacin|vir|glutide|gliptin|gliflozin|afil|dipine|oxetine|triptan|profen|"
+    r"platin|taxel|rubicin|limus|semide|thiazide|lukast|zepam|zolam|caine)$"
+)
+
+# Development codes such as "MK-3475" or "BNT162b2"
+_DRUG_CODE_RE = re.compile(r"[a-z]+-?\d")
+
+# Capitalized words that don't start a sentence (e.g. brand names)
+_CAPITALIZED_RE = re.compile(r"(?<![.?!]\s)(?<!^)\b[A-Z][A-Za-z0-9\-]+")
+
+# Keyword patterns for the topics the analysis prompt asks for
+_TOPIC_PATTERNS = (
+    ('safety', re.compile(r"\bsafe(ty)?\b|warning|risk|toxicit|contraindicat")),
+    ('efficacy', re.compile(r"efficac|effective|endpoint|outcome")),
+    ('dosage', re.compile(r"\bdos(e|es|age|ing)\b|regimen")),
+    ('approval', re.compile(r"approv|authori[sz]")),
+    ('mechanism', re.compile(r"mechanism|mode of action|\bmoa\b")),
+    ('indications', re.compile(r"indicat|\bused for\b|\btreat")),
+    ('adverse_events', re.compile(r"adverse|side effect")),
+    ('clinical_trials', re.compile(r"trial|stud(y|ies)")),
+)
+
+
+# Finds the JSON object in a reply even when it is wrapped in code fences or prose
+_JSON_DECODER = json.JSONDecoder()
+
+_ANALYSIS_SYSTEM_PROMPT = "You are a precise JSON extraction system. Return only valid JSON."
+
+# Filled with .format(query=..., context_info=...); literal braces are doubled
+_ANALYSIS_PROMPT_TEMPLATE = """You are an expert regulatory affairs analyst. Analyze the following user query and extract key information.
+
+User Query: "{query}"{context_info}
+
+Extract and return the following information in JSON format:
+{{
+    "drug_names": ["list of drug names mentioned (brand or generic)"],
+    "agencies": ["list of regulatory agencies mentioned (FDA, EMA, Health Canada, TGA, Swissmedic, NHRA)"],
+    "needs_documents": true/false (whether new documents need to be retrieved),
+    "query_type": "specific/vague/follow_up",
+    "clarification_needed": true/false,
+    "clarification_question": "question to ask user if clarification needed",
+    "topics": ["list of topics: safety, efficacy, dosage, approval, mechanism, indications, adverse_events, clinical_trials, comparative"]
+}}
+
+Rules:
+1. If no drug name is mentioned and no context exists, set query_type to "vague" and clarification_needed to true
+2. If drug name is in context but not in query, use context drug and set query_type to "follow_up"
+3. If query asks for comparison between agencies, include those agencies in the list
+4. needs_documents is true only if:
+   - A new drug is mentioned (not in context)
+   - User explicitly asks for "deep research" or "additional documents"
+   - Query type is "specific" with a new drug
+5. If agencies are not mentioned, return empty list (system will use defaults)
+6. Extract all relevant topics from the query
+
+Return ONLY valid JSON, no additional text."""
+
+
+@lru_cache(maxsize=8)
+def _drug_lexicon(known_drugs: frozenset) -> Tuple[Dict[Tuple[str, ...], str], int]:
+    """
+    Index drug names by their words, for matching against query words.
+    
+    Args:
+        known_drugs: Lowercased drug names
+        
+    Returns:
+        Tuple of (word tuple -> drug name, most words in any name)
+    """
+    lexicon = {}
+    for name in known_drugs:
+        words = tuple(_WORD_RE.findall(name))
+        if words:
+            lexicon[words] = name
+    return lexicon, max((len(words) for words in lexicon), default=0)
+
 
 class QueryAnalyzer:
     """Analyzes user queries to extract drug names, agencies, and intent."""
     
+    # Maximum number of analyses kept in the LRU cache
+    CACHE_SIZE = 512
+    
     def __init__(self):
         self.settings = get_settings()
-        self.client = OpenAI(
-            api_key=self.settings.openai_api_key,
-            base_url='https://api.openai.com/v1'
+        self.client = get_openai_client()
+        self._analysis_cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
+        # Analyses are also kept on disk so they survive restarts
+        self.cache_dir = Path(self.settings.analysis_cache_dir)
+    
+    def _cache_key(self, query: str, conversation_context: Optional[Dict]) -> tuple:
+        """
+        Build the cache key for a query.
+        
+        Only the parts of the context that end up in the analysis prompt
+        (current drug and topics) are part of the key.
+        """
+        normalized_query = " ".join(query.lower().split())
+        
+        if not conversation_context or not conversation_context.get('current_drug'):
+            return (normalized_query, None, ())
+        
+        return (
+            normalized_query,
+            conversation_context['current_drug'].lower(),
+            tuple(conversation_context.get('topics', []))
         )
     
-    def analyze_query(self, query: str, conversation_context: Optional[Dict] = None) -> Dict:
+    def _persisted_path(self, cache_key: tuple) -> Path:
+        """Get the on-disk cache file for a cache key."""
+        digest = hashlib.sha256(orjson.dumps(cache_key)).hexdigest()
+        return self.cache_dir / f"{digest}.json"
+    
+    def _load_persisted(self, cache_key: tuple) -> Optional[Dict]:
+        """
+        Get an analysis stored on disk by an earlier session.
+        
+        Args:
+            cache_key: Cache key of the query
+            
+        Returns:
+            Stored analysis or None if there is none
+        """
+        try:
+            return orjson.loads(self._persisted_path(cache_key).read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+    
+    def _persist(self, cache_key: tuple, analysis: Dict):
+        """Store an analysis on disk (atomically, so readers never see partial files)."""
+        try:
+            path = self._persisted_path(cache_key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(orjson.dumps(analysis))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not persist query analysis: {str(e)}")
+    
+    def _remember(self, cache_key: tuple, analysis: Dict):
+        """Add an analysis to the in-memory LRU cache."""
+        with self._cache_lock:
+            self._analysis_cache[cache_key] = copy.deepcopy(analysis)
+            if len(self._analysis_cache) > self.CACHE_SIZE:
+                self._analysis_cache.popitem(last=False)
+    
+    def _fast_analysis(
+        self,
+        query: str,
+        conversation_context: Optional[Dict],
+        known_drugs: AbstractSet[str]
+    ) -> Optional[Dict]:
+        """
+        Analyze a simple query about one already indexed drug without the model.
+        
+        Args:
+            query: User's query
+            conversation_context: Previous conversation context
+            known_drugs: Lowercased names of drugs with indexed documents
+            
+        Returns:
+            Analysis dictionary, or None if the query needs the model
+        """
+        words = _WORD_RE.findall(query.lower())
+        if not words or not _MODEL_TERMS.isdisjoint(words):
+            return None
+        
+        drugs = set(self.extract_all_drugs(query, known_drugs))
+        if len(drugs) != 1:
+            return None
+        
+        drug = drugs.pop()
+        if self._mentions_other_drug(query, drug):
+            return None
+        
+        current_drug = (conversation_context or {}).get('current_drug') or ''
+        is_follow_up = current_drug.lower() == drug
+        query_lower = query.lower()
+        
+        return {
+            'drug_names': [current_drug if is_follow_up else drug.title()],
+            'agencies': [],
+            'needs_documents': False,
+            'query_type': 'follow_up' if is_follow_up else 'specific',
+            'clarification_needed': False,
+            'clarification_question': '',
+            'topics': [topic for topic, pattern in _TOPIC_PATTERNS if pattern.search(query_lower)]
+        }
+    
+    @staticmethod
+    def _mentions_other_drug(query: str, drug: str) -> bool:
+        """
+        Check whether a query may name a drug besides the one found.
+        
+        Words that look like generic names or development codes, and
+        capitalized words inside a sentence, count as possible drugs.
+        
+        Args:
+            query: User's query
+            drug: Lowercased name of the drug found in the query
+            
+        Returns:
+            True if the query needs the model to tell which drugs it means
+        """
+        drug_words = set(_WORD_RE.findall(drug))
+        
+        for word in _WORD_RE.findall(query.lower()):
+            if word not in drug_words and (_DRUG_STEM_RE.search(word) or _DRUG_CODE_RE.match(word)):
+                return True
+        
+        for word in _CAPITALIZED_RE.findall(query.strip()):
+            if word.lower() not in drug_words:
+                return True
+        
+        return False
+    
+    def extract_all_drugs(self, query: str, known_drugs: AbstractSet[str]) -> List[str]:
+        """
+        Find every known drug mentioned in a query, in a single pass.
+        
+        Names may span several words ("insulin glargine"); at each position the
+        longest matching name wins. The work grows with the query length and
+        the longest name, not with the number of known drugs.
+        
+        Args:
+            query: User's query
+            known_drugs: Lowercased drug names to look for
+            
+        Returns:
+            Sorted lowercased names of the drugs mentioned
+        """
+        if not isinstance(known_drugs, frozenset):
+            known_drugs = frozenset(known_drugs)
+        lexicon, max_words = _drug_lexicon(known_drugs)
+        
+        words = _WORD_RE.findall(query.lower())
+        found = set()
+        i = 0
+        
+        while i < len(words):
+            for n in range(min(max_words, len(words) - i), 0, -1):
+                name = lexicon.get(tuple(words[i:i + n]))
+                if name is not None:
+                    found.add(name)
+                    i += n
+                    break
+            else:
+                i += 1
+        
+        return sorted(found)
+    
+    def analyze_query(
+        self,
+        query: str,
+        conversation_context: Optional[Dict] = None,
+        known_drugs: Optional[AbstractSet[str]] = None
+    ) -> Dict:
         """
         Analyze a user query to extract key information.
         
+        Queries that name exactly one drug from known_drugs and nothing that
+        needs interpretation (comparisons, agencies, retrieval requests) are
+        analyzed locally without calling the model.
+        
         Args:
             query: User's query
             conversation_context: Previous conversation context
+            known_drugs: Lowercased names of drugs with indexed documents
             
         Returns:
             Dictionary with extracted information:
@@ -43,6 +323,28 @@ class QueryAnalyzer:
                 'topics': List[str]  # safety, efficacy, dosage, etc.
             }
         """
+        if known_drugs:
+            analysis = self._fast_analysis(query, conversation_context, known_drugs)
+            if analysis is not None:
+                logger.info(f"✓ Query analyzed without the model: {analysis}")
+                return analysis
+        
+        cache_key = self._cache_key(query, conversation_context)
+        with self._cache_lock:
+            cached = self._analysis_cache.get(cache_key)
+            if cached is not None:
+                self._analysis_cache.move_to_end(cache_key)
+        
+        if cached is not None:
+            logger.info(f"✓ Using cached query analysis: {cached}")
+            return copy.deepcopy(cached)
+        
+        persisted = self._load_persisted(cache_key)
+        if persisted is not None:
+            logger.info(f"✓ Using stored query analysis: {persisted}")
+            self._remember(cache_key, persisted)
+            return persisted
+        
         try:
             logger.info(f"Analyzing query: {query[:100]}...")
             
@@ -52,56 +354,29 @@ class QueryAnalyzer:
                 context_info = f"\n\nCurrent conversation context:\n- Drug being discussed: {conversation_context['current_drug']}\n- Topics covered: {', '.join(conversation_context.get('topics', []))}"
             
             # Create analysis prompt
-            prompt = f"""You are an expert regulatory affairs analyst. Analyze the following user query and extract key information.
-
-User Query: "{query}"{context_info}
-
-Extract and return the following information in JSON format:
-{{
-    "drug_names": ["list of drug names mentioned (brand or generic)"],
-    "agencies": ["list of regulatory agencies mentioned (FDA, EMA, Health Canada, TGA, Swissmedic, NHRA)"],
-    "needs_documents": true/false (whether new documents need to be retrieved),
-    "query_type": "specific/vague/follow_up",
-    "clarification_needed": true/false,
-    "clarification_question": "question to ask user if clarification needed",
-    "topics": ["list of topics: safety, efficacy, dosage, approval, mechanism, indications, adverse_events, clinical_trials, comparative"]
-}}
-
-Rules:
-1. If no drug name is mentioned and no context exists, set query_type to "vague" and clarification_needed to true
-2. If drug name is in context but not in query, use context drug and set query_type to "follow_up"
-3. If query asks for comparison between agencies, include those agencies in the list
-4. needs_documents is true only if:
-   - A new drug is mentioned (not in context)
-   - User explicitly asks for "deep research" or "additional documents"
-   - Query type is "specific" with a new drug
-5. If agencies are not mentioned, return empty list (system will use defaults)
-6. Extract all relevant topics from the query
-
-Return ONLY valid JSON, no additional text."""
+            prompt = _ANALYSIS_PROMPT_TEMPLATE.format(query=query, context_info=context_info)
 
             # Call GPT-4 for analysis
             response = self.client.chat.completions.create(
                 model="gpt-4",
                 messages=[
-                    {"role": "system", "content": "You are a precise JSON extraction system. Return only valid JSON."},
+                    {"role": "system", "content": _ANALYSIS_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.1,
                 max_tokens=500
             )
             
-            # Parse response
-            analysis_text = response.choices[0].message.content.strip()
-            
-            # Remove markdown code blocks if present
-            if analysis_text.startswith("```"):
-                analysis_text = analysis_text.split("```")[1]
-                if analysis_text.startswith("json"):
-                    analysis_text = analysis_text[4:]
-                analysis_text = analysis_text.strip()
+            # Parse the first JSON object in the response
+            analysis_text = response.choices[0].message.content
+            start = analysis_text.find('{')
+            if start < 0:
+                raise json.JSONDecodeError("No JSON object in response", analysis_text, 0)
+            analysis, _ = _JSON_DECODER.raw_decode(analysis_text, start)
             
-            analysis = json.loads(analysis_text)
+            # Only successful analyses are cached so errors are retried
+            self._remember(cache_key, analysis)
+            self._persist(cache_key, analysis)
             
             logger.info(f"✓ Query analysis complete: {analysis}")
             return analysis
@@ -141,24 +416,18 @@ Return ONLY valid JSON, no additional text."""
         Returns:
             Extracted drug name or None
         """
-        # Common patterns
-        patterns = [
-            "about ",
-            "for ",
-            "regarding ",
-            "concerning ",
-        ]
-        
         query_lower = query.lower()
         
-        for pattern in patterns:
-            if pattern in query_lower:
-                # Extract text after pattern
-                parts = query_lower.split(pattern)
-                if len(parts) > 1:
-                    # Get first word after pattern
-                    words = parts[1].split()
-                    if words:
-                        return words[0].strip('.,?!').title()
+        for phrase in _DRUG_EXTRACT_PHRASES:
+            start = query_lower.find(phrase)
+            if start < 0:
+                continue
+            
+            # First word between this occurrence of the phrase and the next one
+            start += len(phrase)
+            end = query_lower.find(phrase, start)
+            words = query_lower[start:end if end >= 0 else None].split()
+            if words:
+                return words[0].strip('.,?!').title()
         
         return None
@@ -1,157 +1,608 @@
 """
 Retrieval-Augmented Generation (RAG) service for question answering.
 """
-from typing import List, Dict, Optional
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import hashlib
 import logging
+import re
+
+import numpy as np
 
 from app.core.config import get_settings
+from app.services.openai_client import get_async_openai_client, get_openai_client
+from app.services.semantic_cache import SemanticCache
 from app.services.vector_store import VectorStoreService
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_WORD_RE = re.compile(r"\w+")
+_VAGUE_TERMS = ("this", "that", "it", "thing", "stuff")
+
+SYSTEM_PROMPT = """You are a helpful regulatory affairs assistant specializing in drug product regulation. 
+You have access to regulatory documents from major health agencies including FDA, EMA, Health Canada, TGA, NHRA, and Swissmedic.
+
+Your task is to answer questions based on the provided regulatory documents. Always:
+1. Base your answer on the provided context
+2. Cite specific documents when making claims (use the document names provided in brackets)
+3. If the context doesn't contain enough information to fully answer the question, say so clearly
+4. Provide clear, professional responses suitable for regulatory professionals
+5. When appropriate, note any differences between regulatory agencies
+6. Be precise about regulatory requirements and guidelines
+7. If you're uncertain about something, acknowledge it
+
+Remember: Accuracy is critical in regulatory matters. Never make up information."""
+
+
+def _simhash(text: str) -> int:
+    """
+    Compute a 128-bit SimHash of a text over 3-word shingles.
+    
+    Texts that share most of their shingles get hashes a few bits apart.
+    
+    Args:
+        text: Text to hash
+        
+    Returns:
+        SimHash as an integer
+    """
+    words = _WORD_RE.findall(text.lower())
+    shingles = [' '.join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))]
+    digests = b''.join(hashlib.blake2b(shingle.encode(), digest_size=16).digest() for shingle in shingles)
+    
+    # Majority vote per bit across the shingle hashes
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(shingles), 128)
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority).tobytes(), 'big')
+
 
 class RAGService:
     """Service for Retrieval-Augmented Generation."""
     
-    def __init__(self):
+    # Prompt context limits. Chunks whose SimHashes differ in at most
+    # NEAR_DUPLICATE_BITS bits count as the same passage (copies with a word
+    # or two changed land within ~16 bits; unrelated chunks ~64 bits apart)
+    MAX_CONTEXT_CHARS = 12000
+    NEAR_DUPLICATE_BITS = 16
+    
+    def __init__(self, vector_store: Optional[VectorStoreService] = None):
+        """
+        Initialize the RAG service.
+        
+        Args:
+            vector_store: Vector store to search (a new one is loaded if omitted)
+        """
         self.settings = get_settings()
-        self.client = OpenAI(
-            api_key=self.settings.openai_api_key,
-            base_url='https://api.openai.com/v1'
+        self.client = get_openai_client()
+        self.vector_store = vector_store or VectorStoreService()
+        
+        # Answers to earlier questions, reused for paraphrases (and across
+        # restarts) while the index holds the same chunks
+        self.answer_cache = SemanticCache(
+            dimension=self.vector_store.dimension,
+            threshold=self.settings.semantic_cache_threshold,
+            ttl_seconds=self.settings.semantic_cache_ttl,
+            persist_path=self.settings.answer_cache_path
         )
-        self.vector_store = VectorStoreService()
     
     def generate_answer(
         self, 
         query: str, 
         model: Optional[str] = None,
-        k: int = 5
+        k: int = 5,
+        agencies: Optional[List[str]] = None,
+        drug_name: Optional[str] = None
     ) -> Dict:
         """
         Generate an answer to a query using RAG.
         
+        Answers are cached as in generate_answer_stream().
+        
         Args:
             query: User's question
             model: OpenAI model to use (defaults to settings)
             k: Number of context chunks to retrieve
+            agencies: Only use chunks from these agencies
+            drug_name: Only use chunks for this drug
             
         Returns:
             Dictionary with answer, sources, and metadata
+        """
+        for kind, payload in self.generate_answer_stream(query, model, k, agencies, drug_name):
+            if kind == 'result':
+                return payload
+    
+    def generate_answer_stream(
+        self, 
+        query: str, 
+        model: Optional[str] = None,
+        k: int = 5,
+        agencies: Optional[List[str]] = None,
+        drug_name: Optional[str] = None
+    ) -> Iterator[Tuple[str, object]]:
+        """
+        Generate an answer to a query using RAG, yielding it as it is written.
+        
+        A question semantically equivalent to one answered before (same model,
+        filters and index contents) gets the earlier answer, marked 'cached',
+        without retrieval or a completion; it is yielded as a single token.
+        
+        Args:
+            query: User's question
+            model: OpenAI model to use (defaults to settings)
+            k: Number of context chunks to retrieve
+            agencies: Only use chunks from these agencies
+            drug_name: Only use chunks for this drug
             
-        Raises:
-            Exception: If answer generation fails
+        Yields:
+            ('token', text) for each piece of the answer, then ('result', result)
+            where result is a dictionary with answer, sources, and metadata
         """
+        scope = self._answer_cache_scope(model, k, agencies, drug_name)
+        query_embedding = self._answer_cache_embeddings([query])[0]
+        cached = self._cached_answer(query_embedding, scope)
+        if cached is not None:
+            yield 'token', cached['answer']
+            yield 'result', cached
+            return
+        
         try:
-            if not query or not query.strip():
-                raise ValueError("Query cannot be empty")
+            model = self._prepare(query, model)
             
-            if model is None:
-                model = self.settings.chat_model
+            # Check if index has documents
+            if self.vector_store.total_vectors == 0:
+                yield 'result', self._no_documents_result(model)
+                return
+            
+            # Retrieve relevant context
+            search_results = self.vector_store.search(
+                query, k=k, agencies=agencies, drug_name=drug_name
+            )
             
-            logger.info(f"Generating answer for query: {query[:100]}...")
+            if not search_results:
+                yield 'result', self._no_results_result(model)
+                return
+            
+            for kind, payload in self._stream_completion(query, model, search_results):
+                if kind == 'result':
+                    self._remember_answer(query_embedding, payload, scope)
+                yield kind, payload
+            
+        except Exception as e:
+            logger.error(f"Error generating answer: {str(e)}")
+            yield 'result', self._error_result(e, model)
+    
+    def generate_answer_batch(
+        self,
+        queries: List[str],
+        model: Optional[str] = None,
+        k: int = 5,
+        agencies: Optional[List[str]] = None,
+        drug_name: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Generate answers to several queries using RAG.
+        
+        Answers are cached as in generate_answer_stream(). Context for the other
+        queries is retrieved with one batched search, and their completions are
+        requested concurrently (up to settings.answer_batch_concurrency at once).
+        
+        Args:
+            queries: User's questions
+            model: OpenAI model to use (defaults to settings)
+            k: Number of context chunks to retrieve per query
+            agencies: Only use chunks from these agencies
+            drug_name: Only use chunks for this drug
             
+        Returns:
+            Dictionary with answer, sources, and metadata for each query, in order
+        """
+        if not queries:
+            return []
+        
+        model = model or self.settings.chat_model
+        scope = self._answer_cache_scope(model, k, agencies, drug_name)
+        query_embeddings = self._answer_cache_embeddings(queries)
+        answers = [self._cached_answer(embedding, scope) for embedding in query_embeddings]
+        pending = [i for i, answer in enumerate(answers) if answer is None]
+        if not pending:
+            return answers
+        
+        try:
             # Check if index has documents
-            stats = self.vector_store.get_stats()
-            if stats['total_vectors'] == 0:
-                return {
-                    "answer": "I don't have any regulatory documents indexed yet. Please retrieve and index documents first using the 'Retrieve Documents' section.",
-                    "sources": [],
-                    "model_used": model,
-                    "num_chunks_retrieved": 0,
-                    "status": "no_documents"
-                }
+            if self.vector_store.total_vectors == 0:
+                return [self._no_documents_result(model) for _ in queries]
+            
+            all_results = self.vector_store.search_many(
+                [queries[i] for i in pending], k=k, agencies=agencies, drug_name=drug_name
+            )
+        except Exception as e:
+            logger.error(f"Error generating answers: {str(e)}")
+            return [self._error_result(e, model) for _ in queries]
+        
+        def answer(query: str, search_results: List[Dict]) -> Dict:
+            try:
+                model_name = self._prepare(query, model)
+                if not search_results:
+                    return self._no_results_result(model_name)
+                for kind, payload in self._stream_completion(query, model_name, search_results):
+                    if kind == 'result':
+                        return payload
+            except Exception as e:
+                logger.error(f"Error generating answer: {str(e)}")
+                return self._error_result(e, model)
+        
+        max_workers = max(1, min(len(pending), self.settings.answer_batch_concurrency))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            generated = executor.map(answer, [queries[i] for i in pending], all_results)
+            for i, result in zip(pending, generated):
+                self._remember_answer(query_embeddings[i], result, scope)
+                answers[i] = result
+        
+        return answers
+    
+    def _answer_cache_scope(
+        self,
+        model: Optional[str],
+        k: int,
+        agencies: Optional[List[str]],
+        drug_name: Optional[str]
+    ) -> tuple:
+        """Build the answer cache scope (any change to the index changes it)."""
+        return (
+            model or self.settings.chat_model,
+            k,
+            tuple(sorted(agencies)) if agencies else None,
+            drug_name.lower() if drug_name else None,
+            self.vector_store.total_vectors
+        )
+    
+    def _answer_cache_embeddings(self, queries: List[str]) -> List[Optional[List[float]]]:
+        """
+        Embed queries for the answer cache.
+        
+        Args:
+            queries: User's questions
+            
+        Returns:
+            Embedding of each query, or None for queries that can't be answered
+            from the index (empty query or index, or embedding failed)
+        """
+        embeddings: List[Optional[List[float]]] = [None] * len(queries)
+        answerable = [i for i, query in enumerate(queries) if query and query.strip()]
+        if not answerable or self.vector_store.total_vectors == 0:
+            return embeddings
+        
+        try:
+            for i, embedding in zip(
+                answerable,
+                self.vector_store.generate_query_embeddings([queries[i] for i in answerable])
+            ):
+                embeddings[i] = embedding
+        except Exception as e:
+            logger.warning(f"Could not embed queries for the answer cache: {str(e)}")
+        return embeddings
+    
+    async def _aanswer_cache_embedding(self, query: str) -> Optional[List[float]]:
+        """Embed a query for the answer cache without blocking the event loop (see _answer_cache_embeddings)."""
+        if not query or not query.strip() or self.vector_store.total_vectors == 0:
+            return None
+        
+        try:
+            return await self.vector_store.agenerate_embedding(query)
+        except Exception as e:
+            logger.warning(f"Could not embed query for the answer cache: {str(e)}")
+            return None
+    
+    def _cached_answer(self, query_embedding: Optional[List[float]], scope: tuple) -> Optional[Dict]:
+        """Get the cached answer to an equivalent earlier question, if any."""
+        if query_embedding is None:
+            return None
+        cached = self.answer_cache.lookup(query_embedding, scope)
+        return None if cached is None else {**cached, 'cached': True}
+    
+    def _remember_answer(self, query_embedding: Optional[List[float]], result: Dict, scope: tuple):
+        """Cache a successful answer."""
+        if query_embedding is not None and result['status'] == 'success':
+            self.answer_cache.add(query_embedding, result, scope)
+    
+    def _stream_completion(
+        self,
+        query: str,
+        model: str,
+        search_results: List[Dict]
+    ) -> Iterator[Tuple[str, object]]:
+        """
+        Answer a query from retrieved chunks, yielding the answer as it is written.
+        
+        Args:
+            query: User's question
+            model: OpenAI model to use
+            search_results: Retrieved chunks, most relevant first
+            
+        Yields:
+            ('token', text) for each piece of the answer, then ('result', result)
+        """
+        messages, sources = self._build_messages(query, self._select_contexts(search_results))
+        
+        # Generate response
+        logger.info(f"Calling OpenAI API with model: {model}")
+        
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0.3,
+            max_tokens=2000,
+            stream=True
+        )
+        
+        parts = []
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield 'token', parts[-1]
+        
+        yield 'result', self._answer_result(''.join(parts), sources, model, len(search_results))
+    
+    async def agenerate_answer(
+        self, 
+        query: str, 
+        model: Optional[str] = None,
+        k: int = 5,
+        agencies: Optional[List[str]] = None,
+        drug_name: Optional[str] = None
+    ) -> Dict:
+        """
+        Generate an answer to a query using RAG without blocking the event loop.
+        
+        Answers are cached as in agenerate_answer_stream().
+        
+        Args:
+            query: User's question
+            model: OpenAI model to use (defaults to settings)
+            k: Number of context chunks to retrieve
+            agencies: Only use chunks from these agencies
+            drug_name: Only use chunks for this drug
+            
+        Returns:
+            Dictionary with answer, sources, and metadata
+        """
+        async for kind, payload in self.agenerate_answer_stream(query, model, k, agencies, drug_name):
+            if kind == 'result':
+                return payload
+    
+    async def agenerate_answer_stream(
+        self, 
+        query: str, 
+        model: Optional[str] = None,
+        k: int = 5,
+        agencies: Optional[List[str]] = None,
+        drug_name: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, object]]:
+        """
+        Generate an answer to a query using RAG without blocking the event loop,
+        yielding it as it is written.
+        
+        Embedding, search and completion are all awaited, so one process can
+        serve many concurrent queries. Answers are cached as in
+        generate_answer_stream() (the cache is shared by both).
+        
+        Args:
+            query: User's question
+            model: OpenAI model to use (defaults to settings)
+            k: Number of context chunks to retrieve
+            agencies: Only use chunks from these agencies
+            drug_name: Only use chunks for this drug
+            
+        Yields:
+            ('token', text) for each piece of the answer, then ('result', result)
+            where result is a dictionary with answer, sources, and metadata
+        """
+        scope = self._answer_cache_scope(model, k, agencies, drug_name)
+        query_embedding = await self._aanswer_cache_embedding(query)
+        cached = self._cached_answer(query_embedding, scope)
+        if cached is not None:
+            yield 'token', cached['answer']
+            yield 'result', cached
+            return
+        
+        try:
+            model = self._prepare(query, model)
+            
+            # Check if index has documents
+            if self.vector_store.total_vectors == 0:
+                yield 'result', self._no_documents_result(model)
+                return
             
             # Retrieve relevant context
-            search_results = self.vector_store.search(query, k=k)
+            search_results = await self.vector_store.search_async(
+                query, k=k, agencies=agencies, drug_name=drug_name
+            )
             
             if not search_results:
-                return {
-                    "answer": "I couldn't find relevant information in the indexed documents. Please try rephrasing your question or index more documents.",
-                    "sources": [],
-                    "model_used": model,
-                    "num_chunks_retrieved": 0,
-                    "status": "no_results"
-                }
-            
-            # Build context string
-            context_parts = []
-            sources = []
-            
-            for i, result in enumerate(search_results):
-                context_parts.append(
-                    f"[Document {i+1}: {result['source_document']}]\n"
-                    f"{result['chunk_text']}\n"
-                )
-                sources.append({
-                    "document": result['source_document'],
-                    "chunk_index": result['chunk_index'],
-                    "similarity_score": result.get('similarity_score', 0),
-                    "distance": result.get('distance', 0)
-                })
-            
-            context = "\n".join(context_parts)
-            
-            # Build prompt
-            system_prompt = """You are a helpful regulatory affairs assistant specializing in drug product regulation. 
-You have access to regulatory documents from major health agencies including FDA, EMA, Health Canada, TGA, NHRA, and Swissmedic.
-
-Your task is to answer questions based on the provided regulatory documents. Always:
-1. Base your answer on the provided context
-2. Cite specific documents when making claims (use the document names provided in brackets)
-3. If the context doesn't contain enough information to fully answer the question, say so clearly
-4. Provide clear, professional responses suitable for regulatory professionals
-5. When appropriate, note any differences between regulatory agencies
-6. Be precise about regulatory requirements and guidelines
-7. If you're uncertain about something, acknowledge it
-
-Remember: Accuracy is critical in regulatory matters. Never make up information."""
-
-            user_prompt = f"""Context from regulatory documents:
-
-{context}
-
-Question: {query}
-
-Please provide a detailed answer based on the context above. Cite the specific documents you're referencing."""
-
+                yield 'result', self._no_results_result(model)
+                return
+            
+            messages, sources = self._build_messages(query, self._select_contexts(search_results))
+            
             # Generate response
             logger.info(f"Calling OpenAI API with model: {model}")
             
-            response = self.client.chat.completions.create(
+            stream = await get_async_openai_client().chat.completions.create(
                 model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=messages,
                 temperature=0.3,
-                max_tokens=2000
+                max_tokens=2000,
+                stream=True
             )
             
-            answer = response.choices[0].message.content
+            parts = []
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield 'token', parts[-1]
             
-            logger.info(f"✓ Generated answer ({len(answer)} characters)")
-            
-            return {
-                "answer": answer,
-                "sources": sources,
-                "model_used": model,
-                "num_chunks_retrieved": len(search_results),
-                "status": "success"
-            }
+            result = self._answer_result(''.join(parts), sources, model, len(search_results))
+            self._remember_answer(query_embedding, result, scope)
+            yield 'result', result
             
         except Exception as e:
             logger.error(f"Error generating answer: {str(e)}")
-            return {
-                "answer": f"Error generating answer: {str(e)}",
-                "sources": [],
-                "model_used": model or "unknown",
-                "num_chunks_retrieved": 0,
-                "status": "error",
-                "error": str(e)
+            yield 'result', self._error_result(e, model)
+    
+    def _prepare(self, query: str, model: Optional[str]) -> str:
+        """
+        Validate a query and resolve the model to answer it with.
+        
+        Args:
+            query: User's question
+            model: Requested model (None = settings default)
+            
+        Returns:
+            Model name
+            
+        Raises:
+            ValueError: If the query is empty
+        """
+        if not query or not query.strip():
+            raise ValueError("Query cannot be empty")
+        
+        logger.info(f"Generating answer for query: {query[:100]}...")
+        return model or self.settings.chat_model
+    
+    def _select_contexts(self, search_results: List[Dict]) -> List[Dict]:
+        """
+        Drop duplicate and near-duplicate chunks and cap the prompt context size.
+        
+        Copies of a passage (e.g. the same label indexed from two downloads)
+        would otherwise be sent, and billed, once per copy.
+        
+        Args:
+            search_results: Retrieved chunks, most relevant first
+            
+        Returns:
+            Chunks to put in the prompt, in relevance order
+        """
+        selected = []
+        seen = set()
+        fingerprints = []
+        total_chars = 0
+        
+        for result in search_results:
+            text = result['chunk_text']
+            digest = hashlib.blake2b(text.encode(), digest_size=16).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+            
+            fingerprint = _simhash(text)
+            if any(bin(fingerprint ^ kept).count('1') <= self.NEAR_DUPLICATE_BITS for kept in fingerprints):
+                continue
+            
+            # The most relevant chunk is always kept, however long
+            if selected and total_chars + len(text) > self.MAX_CONTEXT_CHARS:
+                break
+            
+            selected.append(result)
+            fingerprints.append(fingerprint)
+            total_chars += len(text)
+        
+        if len(selected) < len(search_results):
+            logger.info(f"Using {len(selected)} of {len(search_results)} retrieved chunks after deduplication")
+        return selected
+    
+    def _build_messages(self, query: str, search_results: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Build the chat messages and source list for retrieved chunks.
+        
+        Chunks go into the prompt in document order rather than relevance
+        order, so questions retrieving overlapping chunks produce prompts with
+        a long common prefix, which the API's prompt cache can reuse. Sources
+        are listed in the same order, so "[Document i]" in the answer refers
+        to sources[i-1].
+        
+        Args:
+            query: User's question
+            search_results: Retrieved chunks, most relevant first
+            
+        Returns:
+            Tuple of (chat messages, sources in prompt order)
+        """
+        ordered_results = sorted(
+            search_results,
+            key=lambda result: (result['source_document'], result['chunk_index'])
+        )
+        sources = [
+            {
+                "document": result['source_document'],
+                "chunk_index": result['chunk_index'],
+                "similarity_score": result.get('similarity_score', 0),
+                "distance": result.get('distance', 0)
             }
+            for result in ordered_results
+        ]
+        
+        context = "\n".join(
+            f"[Document {i+1}: {result['source_document']}]\n"
+            f"{result['chunk_text']}\n"
+            for i, result in enumerate(ordered_results)
+        )
+        
+        user_prompt = f"""Context from regulatory documents:
+
+{context}
+
+Question: {query}
+
+Please provide a detailed answer based on the context above. Cite the specific documents you're referencing."""
+        
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
+        return messages, sources
+    
+    def _answer_result(self, answer: str, sources: List[Dict], model: str, num_chunks: int) -> Dict:
+        """Build the result for a generated answer."""
+        logger.info(f"✓ Generated answer ({len(answer)} characters)")
+        return {
+            "answer": answer,
+            "sources": sources,
+            "model_used": model,
+            "num_chunks_retrieved": num_chunks,
+            "status": "success"
+        }
+    
+    def _no_documents_result(self, model: str) -> Dict:
+        """Build the result for an empty index."""
+        return {
+            "answer": "I don't have any regulatory documents indexed yet. Please retrieve and index documents first using the 'Retrieve Documents' section.",
+            "sources": [],
+            "model_used": model,
+            "num_chunks_retrieved": 0,
+            "status": "no_documents"
+        }
+    
+    def _no_results_result(self, model: str) -> Dict:
+        """Build the result for a search without matches."""
+        return {
+            "answer": "I couldn't find relevant information in the indexed documents. Please try rephrasing your question or index more documents.",
+            "sources": [],
+            "model_used": model,
+            "num_chunks_retrieved": 0,
+            "status": "no_results"
+        }
+    
+    def _error_result(self, error: Exception, model: Optional[str]) -> Dict:
+        """Build the result for a failed answer."""
+        return {
+            "answer": f"Error generating answer: {str(error)}",
+            "sources": [],
+            "model_used": model or "unknown",
+            "num_chunks_retrieved": 0,
+            "status": "error",
+            "error": str(error)
+        }
     
     def ask_for_clarification(self, query: str) -> Dict:
         """
@@ -174,8 +625,8 @@ Please provide a detailed answer based on the context above. Cite the specific d
                 suggestions.append("Your question seems quite brief. Could you provide more details?")
             
             # Check if query is too vague
-            vague_terms = ["this", "that", "it", "thing", "stuff"]
-            if any(term in query.lower() for term in vague_terms):
+            query_lower = query.lower()
+            if any(term in query_lower for term in _VAGUE_TERMS):
                 clarification_needed = True
                 suggestions.append("Your question contains vague terms. Could you be more specific?")
             
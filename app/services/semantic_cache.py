@@ -0,0 +1,285 @@
+"""
+Semantic cache for reusing results of semantically equivalent queries.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import os
+import threading
+import time
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+import faiss
+import numpy as np
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    Embedding-keyed cache backed by a small HNSW index.
+
+    Entries are matched by cosine similarity and only returned when they were
+    stored under the same scope (e.g. drug in context, agencies, model).
+    Given a persist_path, entries are also appended to a JSONL file and
+    reloaded from it, so they survive restarts. Several processes may share
+    the file: writes hold an exclusive lock on a sidecar .lock file, and
+    rewrites filter what is on disk rather than replacing it with this
+    process's entries.
+    """
+
+    def __init__(
+        self,
+        dimension: int = 1536,
+        threshold: float = 0.95,
+        ttl_seconds: float = 3600,
+        max_entries: int = 1024,
+        search_width: int = 8,
+        persist_path: Optional[str] = None
+    ):
+        self.dimension = dimension
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.search_width = search_width
+        self.persist_path = Path(persist_path) if persist_path else None
+        self._lock = threading.Lock()
+        self._reset_index()
+        if self.persist_path:
+            self._load()
+
+    def _reset_index(self):
+        """Create an empty inner-product HNSW index (cosine on normalized vectors)."""
+        self.index = faiss.IndexHNSWFlat(self.dimension, 32, faiss.METRIC_INNER_PRODUCT)
+        self.entries: List[Optional[Dict]] = []
+
+    def _normalize(self, embedding) -> np.ndarray:
+        """Convert an embedding to a normalized float32 row vector."""
+        vector = np.array(embedding, dtype='float32').reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, embedding, scope: Tuple) -> Optional[Any]:
+        """
+        Find a cached value for a semantically equivalent query.
+
+        Args:
+            embedding: Query embedding
+            scope: Key that must match the scope the value was stored under
+
+        Returns:
+            Cached value or None on a miss
+        """
+        with self._lock:
+            if self.index.ntotal == 0:
+                return None
+
+            k = min(self.search_width, self.index.ntotal)
+            similarities, indices = self.index.search(self._normalize(embedding), k)
+            now = time.time()
+
+            for similarity, idx in zip(similarities[0], indices[0]):
+                if idx < 0 or similarity < self.threshold:
+                    continue
+
+                entry = self.entries[idx]
+                if entry is None:
+                    continue
+
+                if now - entry['created_at'] > self.ttl_seconds:
+                    self.entries[idx] = None
+                    continue
+
+                if entry['scope'] == scope:
+                    logger.info(f"✓ Semantic cache hit (similarity {similarity:.3f})")
+                    return entry['value']
+
+        return None
+
+    def add(self, embedding, value: Any, scope: Tuple, tags: Iterable[str] = ()):
+        """
+        Store a value for a query embedding.
+
+        Args:
+            embedding: Query embedding
+            value: Value to cache
+            scope: Scope the value is valid for
+            tags: Labels used for invalidation (e.g. drug names)
+        """
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            if len(self.entries) >= self.max_entries:
+                self._compact()
+
+            entry = {
+                'vector': vector,
+                'value': value,
+                'scope': scope,
+                'tags': frozenset(tags),
+                'created_at': time.time()
+            }
+            self.index.add(vector)
+            self.entries.append(entry)
+
+            if self.persist_path:
+                self._append(entry)
+
+    def invalidate(self, tag: str) -> int:
+        """
+        Drop every entry carrying a tag.
+
+        Args:
+            tag: Tag to invalidate
+
+        Returns:
+            Number of entries dropped
+        """
+        dropped = 0
+
+        with self._lock:
+            for i, entry in enumerate(self.entries):
+                if entry is not None and tag in entry['tags']:
+                    self.entries[i] = None
+                    dropped += 1
+
+            if self.persist_path:
+                self._rewrite(lambda record: tag not in record['tags'])
+
+        if dropped:
+            logger.info(f"Invalidated {dropped} semantic cache entries for '{tag}'")
+        return dropped
+
+    def clear(self):
+        """Remove all entries, including those persisted by other processes."""
+        with self._lock:
+            self._reset_index()
+            if self.persist_path:
+                self._rewrite(lambda record: False)
+
+    def _live_entries(self) -> List[Dict]:
+        """Get the entries that are neither dropped nor expired, oldest first."""
+        now = time.time()
+        return [
+            entry for entry in self.entries
+            if entry is not None and now - entry['created_at'] <= self.ttl_seconds
+        ]
+
+    def _compact(self):
+        """Rebuild the index from live entries, keeping the newest half."""
+        live = self._live_entries()[-(self.max_entries // 2):]
+
+        self._reset_index()
+        if live:
+            self.index.add(np.vstack([entry['vector'] for entry in live]))
+            self.entries = live
+
+        if self.persist_path:
+            self._rewrite(lambda record: True)
+
+    def _load(self):
+        """Read the entries persisted by earlier sessions, skipping expired ones."""
+        try:
+            with self._file_lock():
+                records = self._read_records()
+        except OSError:
+            return
+
+        for record in records:
+            self.entries.append({
+                'vector': np.array([record['vector']], dtype='float32'),
+                'value': record['value'],
+                'scope': _freeze(record['scope']),
+                'tags': frozenset(record['tags']),
+                'created_at': record['created_at']
+            })
+
+        self.entries = self.entries[-self.max_entries:]
+        if self.entries:
+            self.index.add(np.vstack([entry['vector'] for entry in self.entries]))
+            logger.info(f"✓ Loaded {len(self.entries)} semantic cache entries from {self.persist_path}")
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Hold an exclusive lock on the persisted cache, shared with other processes."""
+        self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.persist_path.with_name(self.persist_path.name + '.lock')
+        with open(lock_path, 'ab') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_records(self) -> List[Dict]:
+        """Read the unexpired persisted records, oldest first (call with the file lock held)."""
+        try:
+            lines = self.persist_path.read_bytes().splitlines()
+        except FileNotFoundError:
+            return []
+
+        now = time.time()
+        records = []
+        for line in lines:
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # Partially written line
+            if now - record['created_at'] <= self.ttl_seconds:
+                records.append(record)
+        return records
+
+    def _append(self, entry: Dict):
+        """Append an entry to the persisted cache with a single write."""
+        try:
+            line = orjson.dumps({
+                'vector': entry['vector'][0],
+                'value': entry['value'],
+                'scope': entry['scope'],
+                'tags': sorted(entry['tags']),
+                'created_at': entry['created_at']
+            }, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE)
+
+            with self._file_lock():
+                with open(self.persist_path, 'ab') as f:
+                    f.write(line)
+        except (OSError, TypeError) as e:
+            logger.warning(f"Could not persist semantic cache: {str(e)}")
+
+    def _rewrite(self, keep: Callable[[Dict], bool]):
+        """
+        Rewrite the persisted cache with the records on disk that pass a filter.
+
+        Expired records are dropped and at most max_entries are kept. The
+        file is replaced atomically, so readers see either version in full.
+
+        Args:
+            keep: Returns whether to keep a persisted record
+        """
+        try:
+            with self._file_lock():
+                records = [record for record in self._read_records() if keep(record)]
+                records = records[-self.max_entries:]
+
+                tmp_path = self.persist_path.with_name(f"{self.persist_path.name}.{os.getpid()}.tmp")
+                tmp_path.write_bytes(b''.join(
+                    orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE) for record in records
+                ))
+                os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            logger.warning(f"Could not persist semantic cache: {str(e)}")
+
+
+def _freeze(value: Any) -> Any:
+    """Turn JSON lists back into the tuples scopes are built from."""
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
@@ -3,35 +3,182 @@ FAISS vector store service for document indexing and similarity search.
 """
 import faiss
 import numpy as np
-import json
+import orjson
+from openai import BadRequestError, RateLimitError
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Tuple, Dict, Optional
-from openai import OpenAI
+from typing import Iterator, List, Tuple, Dict, Optional
+import asyncio
+import hashlib
 import logging
+import os
+import threading
 
 from app.core.config import get_settings
+from app.services.openai_client import get_async_openai_client, get_openai_client
+from app.services.semantic_cache import SemanticCache
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class _ReadWriteLock:
+    """Lock shared by any number of readers or held by one writer (waiting writers go first)."""
+    
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+    
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        """Hold the lock shared with other readers."""
+        with self._condition:
+            while self._writer or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+    
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        """Hold the lock exclusively."""
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
 class VectorStoreService:
     """Service for managing FAISS vector index."""
     
+    # HNSW graph parameters (neighbors per node, build beam width); the search
+    # beam width comes from settings.faiss_ef_search
+    HNSW_M = 32
+    HNSW_EF_CONSTRUCTION = 200
+    
+    # Product quantization (sub-vectors per embedding, bits per code)
+    PQ_SUBQUANTIZERS = 64
+    PQ_BITS = 8
+    PQ_MIN_TRAINING_VECTORS = 2 ** PQ_BITS
+    
+    # 8-bit scalar quantization learns each dimension's value range, so it is
+    # trained on enough vectors for later ones to rarely fall outside it
+    SQ8_MIN_TRAINING_VECTORS = 1000
+    
+    # Inverted file lists (4 * sqrt(N) lists, trained on at least 10 vectors
+    # per list); lists probed per query come from settings.faiss_nprobe
+    IVF_LISTS_PER_SQRT_N = 4
+    IVF_MIN_TRAINING_PER_LIST = 10
+    
+    # Embedding API limits (~8000 tokens per input, 2048 inputs per request,
+    # and a conservative character budget for the per-request token limit)
+    MAX_EMBEDDING_CHARS = 30000
+    MAX_EMBEDDING_BATCH = 2048
+    MAX_EMBEDDING_BATCH_CHARS = 600000
+    
+    # Embedding requests in flight at once when indexing asynchronously (inputs
+    # are spread over that many batches of at least MIN_CONCURRENT_BATCH), and
+    # attempts per request when rate limited (waiting 1s, 2s, 4s, ... between)
+    EMBEDDING_CONCURRENCY = 8
+    MIN_CONCURRENT_BATCH = 64
+    EMBEDDING_RATE_LIMIT_ATTEMPTS = 5
+    
+    # Query caches: embeddings of recent texts (every query embedding is also
+    # stored on disk), and search results reused for near-identical queries
+    # (cosine >= threshold) until the index changes
+    EMBEDDING_CACHE_SIZE = 256
+    RESULT_CACHE_THRESHOLD = 0.99
+    RESULT_CACHE_TTL = 300
+    RESULT_CACHE_SIZE = 1000
+    
     def __init__(self):
         self.settings = get_settings()
-        self.client = OpenAI(
-            api_key=self.settings.openai_api_key,
-            base_url='https://api.openai.com/v1'
-        )
+        self.client = get_openai_client()
         self.index: Optional[faiss.Index] = None
+        self._index_mapped = False  # Index memory-mapped read-only from disk
         self.metadata: List[Dict] = []
+        self._metadata_saved = 0  # Metadata entries already written to disk
         self.dimension = 1536  # Dimension for text-embedding-ada-002
         
+        # Vector ids per agency / lowercased drug name, for filtered search
+        self._ids_by_agency: Dict[str, List[int]] = {}
+        self._ids_by_drug: Dict[str, List[int]] = {}
+        self._source_documents = set()
+        
+        # Guards the index and metadata: searches share it (FAISS searches run
+        # in parallel), adding or replacing vectors holds it exclusively
+        self._lock = _ReadWriteLock()
+        
+        self._embedding_cache: OrderedDict = OrderedDict()
+        self._embedding_cache_lock = threading.Lock()
+        # Query embeddings are also kept on disk so they survive restarts, up to
+        # embedding_cache_max_files (least recently used files are pruned)
+        self.embedding_cache_dir = Path(self.settings.embedding_cache_dir)
+        self._embeddings_persisted = 0  # Files written since the last prune
+        self._prune_embedding_cache()
+        self.result_cache = SemanticCache(
+            dimension=self.dimension,
+            threshold=self.RESULT_CACHE_THRESHOLD,
+            ttl_seconds=self.RESULT_CACHE_TTL,
+            max_entries=self.RESULT_CACHE_SIZE
+        )
+        
         # Load existing index if available
         self._load_index()
     
+    def _create_index(self) -> faiss.Index:
+        """Create an empty HNSW index for approximate nearest-neighbor search."""
+        index = faiss.IndexHNSWFlat(self.dimension, self.HNSW_M)
+        index.hnsw.efConstruction = self.HNSW_EF_CONSTRUCTION
+        self._apply_search_settings(index)
+        return index
+    
+    def _apply_search_settings(self, index: faiss.Index):
+        """Set the configured search breadth (index files keep the one they were saved with)."""
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = self.settings.faiss_ef_search
+        elif isinstance(index, faiss.IndexIVF):
+            index.nprobe = self.settings.faiss_nprobe
+            # Lets search(with_embeddings=True) reconstruct vectors by id
+            index.make_direct_map()
+    
+    @property
+    def ef_search(self) -> Optional[int]:
+        """HNSW search beam width (higher = better recall, slower search); None for IVF."""
+        return self.index.hnsw.efSearch if isinstance(self.index, faiss.IndexHNSW) else None
+    
+    @ef_search.setter
+    def ef_search(self, value: int):
+        with self._lock.write():
+            if isinstance(self.index, faiss.IndexHNSW):
+                self.index.hnsw.efSearch = value
+    
+    @property
+    def nprobe(self) -> Optional[int]:
+        """Inverted lists visited per IVF query (higher = better recall, slower search); None for HNSW."""
+        return self.index.nprobe if isinstance(self.index, faiss.IndexIVF) else None
+    
+    @nprobe.setter
+    def nprobe(self, value: int):
+        with self._lock.write():
+            if isinstance(self.index, faiss.IndexIVF):
+                self.index.nprobe = value
+    
     def _load_index(self):
         """Load existing FAISS index and metadata from disk."""
         index_path = Path(self.settings.faiss_index_path)
@@ -39,21 +186,191 @@ class VectorStoreService:
         
         try:
             if index_path.exists() and metadata_path.exists():
-                self.index = faiss.read_index(str(index_path))
-                with open(metadata_path, 'r') as f:
-                    self.metadata = json.load(f)
+                self.index = self._read_index(index_path)
+                self.metadata = self._read_metadata(metadata_path)
                 logger.info(f"✓ Loaded existing index with {len(self.metadata)} vectors")
+                
+                if isinstance(self.index, faiss.IndexFlat):
+                    self._migrate_flat_index()
+                else:
+                    self._apply_search_settings(self.index)
             else:
                 # Create new index
-                self.index = faiss.IndexFlatL2(self.dimension)
+                self.index = self._create_index()
                 self.metadata = []
+                self._metadata_saved = 0
                 logger.info("✓ Created new FAISS index")
         except Exception as e:
             logger.error(f"Error loading index: {str(e)}")
             # Create new index on error
-            self.index = faiss.IndexFlatL2(self.dimension)
+            self.index = self._create_index()
             self.metadata = []
+            self._metadata_saved = 0
             logger.info("✓ Created new FAISS index (after load error)")
+        
+        self._ids_by_agency = {}
+        self._ids_by_drug = {}
+        self._source_documents = set()
+        for entry in self.metadata:
+            self._register_filters(entry)
+    
+    def _read_metadata(self, metadata_path: Path) -> List[Dict]:
+        """
+        Read chunk metadata, stored as JSON Lines (one chunk per line).
+        
+        Files from older versions hold a single JSON array; they are read as-is
+        and rewritten as JSON Lines on the next save.
+        
+        Args:
+            metadata_path: Path to the metadata file
+            
+        Returns:
+            Metadata of each vector, in id order
+        """
+        with open(metadata_path, 'rb') as f:
+            data = f.read()
+        
+        if data.lstrip().startswith(b'['):
+            self._metadata_saved = 0
+            return orjson.loads(data)
+        
+        metadata = [orjson.loads(line) for line in data.splitlines() if line.strip()]
+        self._metadata_saved = len(metadata)
+        return metadata
+    
+    def _read_index(self, index_path: Path) -> faiss.Index:
+        """
+        Read the index file, memory-mapping it read-only if settings.faiss_mmap is set.
+        
+        A mapped index loads almost instantly and its pages are shared by all
+        processes serving the same file; it is read into memory on first write.
+        
+        Args:
+            index_path: Path to the index file
+            
+        Returns:
+            Loaded index
+        """
+        self._index_mapped = False
+        
+        if self.settings.faiss_mmap:
+            try:
+                index = faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                self._index_mapped = True
+                return index
+            except Exception as e:
+                logger.warning(f"Could not memory-map index, reading it into memory: {str(e)}")
+        
+        return faiss.read_index(str(index_path))
+    
+    def _ensure_in_memory(self):
+        """Replace a memory-mapped index with an in-memory copy before modifying it."""
+        if not self._index_mapped:
+            return
+        
+        self.index = faiss.read_index(self.settings.faiss_index_path)
+        self._apply_search_settings(self.index)
+        self._index_mapped = False
+        logger.info("Read memory-mapped index into memory for writing")
+    
+    def _register_filters(self, entry: Dict):
+        """Record a chunk's vector id under its agency and drug name."""
+        chunk_id = entry["chunk_id"]
+        self._source_documents.add(entry.get("source_document", ""))
+        if entry.get("agency"):
+            self._ids_by_agency.setdefault(entry["agency"], []).append(chunk_id)
+        if entry.get("drug_name"):
+            self._ids_by_drug.setdefault(entry["drug_name"].lower(), []).append(chunk_id)
+    
+    def _migrate_flat_index(self):
+        """Re-add the vectors of a legacy flat index into an HNSW index."""
+        self._ensure_in_memory()
+        flat_index = self.index
+        self.index = self._create_index()
+        
+        if flat_index.ntotal > 0:
+            self.index.add(flat_index.reconstruct_n(0, flat_index.ntotal))
+        
+        self._save_index()
+        logger.info(f"✓ Migrated flat index to HNSW ({self.index.ntotal} vectors)")
+    
+    def quantize_index(self, force: bool = False) -> bool:
+        """
+        Re-encode the index for a large corpus, as set by `faiss_large_index`.
+        
+        "hnsw_pq" compresses vectors with product quantization (IndexHNSWPQ);
+        "hnsw_sq" stores them as float16 (IndexHNSWSQ, half the bytes, near
+        lossless) and "hnsw_sq8" as one byte per dimension (a quarter of the
+        bytes); "ivf" partitions them into inverted lists (IndexIVFFlat) so
+        a query only scans `faiss_nprobe` lists, and "ivf_pq" also stores the
+        lists as PQ codes (IndexIVFPQ). Codebooks / centroids are trained on
+        the vectors already in the index and persisted inside the index file.
+        Runs automatically once the corpus reaches `faiss_pq_threshold` vectors.
+        
+        Args:
+            force: Re-encode even if the corpus is below the threshold
+            
+        Returns:
+            True if the index was re-encoded
+        """
+        if isinstance(self.index, (faiss.IndexHNSWPQ, faiss.IndexHNSWSQ, faiss.IndexIVF)):
+            return False
+        
+        ntotal = self.index.ntotal
+        encoding = self.settings.faiss_large_index
+        use_ivf = encoding in ("ivf", "ivf_pq")
+        nlist = int(self.IVF_LISTS_PER_SQRT_N * ntotal ** 0.5)
+        if use_ivf:
+            min_training = max(self.IVF_MIN_TRAINING_PER_LIST * nlist, self.PQ_MIN_TRAINING_VECTORS)
+        elif encoding == "hnsw_sq":
+            min_training = 1  # float16 needs no training
+        elif encoding == "hnsw_sq8":
+            min_training = self.SQ8_MIN_TRAINING_VECTORS
+        else:
+            min_training = self.PQ_MIN_TRAINING_VECTORS
+        if ntotal == 0 or ntotal < min_training:
+            if force:
+                logger.warning(f"Need at least {min_training} vectors to train the index, have {ntotal}")
+            return False
+        if not force and ntotal < self.settings.faiss_pq_threshold:
+            return False
+        
+        self._ensure_in_memory()  # The index file is about to be rewritten
+        vectors = self.index.reconstruct_n(0, ntotal)
+        
+        if encoding == "ivf_pq":
+            logger.info(f"Training {nlist} inverted lists and product quantizer on {ntotal} vectors...")
+            index = faiss.IndexIVFPQ(
+                faiss.IndexFlatL2(self.dimension), self.dimension, nlist,
+                self.PQ_SUBQUANTIZERS, self.PQ_BITS
+            )
+        elif use_ivf:
+            logger.info(f"Training {nlist} inverted lists on {ntotal} vectors...")
+            index = faiss.IndexIVFFlat(faiss.IndexFlatL2(self.dimension), self.dimension, nlist)
+        elif encoding in ("hnsw_sq", "hnsw_sq8"):
+            fp16 = encoding == "hnsw_sq"
+            logger.info(f"Encoding {ntotal} vectors as {'float16' if fp16 else '8-bit integers'}...")
+            index = faiss.IndexHNSWSQ(
+                self.dimension,
+                faiss.ScalarQuantizer.QT_fp16 if fp16 else faiss.ScalarQuantizer.QT_8bit,
+                self.HNSW_M
+            )
+            index.hnsw.efConstruction = self.HNSW_EF_CONSTRUCTION
+        else:
+            logger.info(f"Training product quantizer on {ntotal} vectors...")
+            index = faiss.IndexHNSWPQ(
+                self.dimension, self.PQ_SUBQUANTIZERS, self.HNSW_M, self.PQ_BITS
+            )
+            index.hnsw.efConstruction = self.HNSW_EF_CONSTRUCTION
+        index.train(vectors)
+        index.add(vectors)
+        self._apply_search_settings(index)
+        
+        self.index = index
+        self.result_cache.clear()
+        self._save_index()
+        logger.info(f"✓ Re-encoded index as {type(index).__name__} ({ntotal} vectors)")
+        return True
     
     def _save_index(self):
         """Save FAISS index and metadata to disk."""
@@ -67,9 +384,13 @@ class VectorStoreService:
             # Save index
             faiss.write_index(self.index, str(index_path))
             
-            # Save metadata
-            with open(metadata_path, 'w') as f:
-                json.dump(self.metadata, f, indent=2)
+            # Save metadata, appending only the chunks added since the last save
+            mode = 'ab' if self._metadata_saved else 'wb'
+            with open(metadata_path, mode) as f:
+                f.writelines(
+                    orjson.dumps(entry) + b"\n" for entry in self.metadata[self._metadata_saved:]
+                )
+            self._metadata_saved = len(self.metadata)
             
             logger.info(f"✓ Saved index with {len(self.metadata)} vectors")
         except Exception as e:
@@ -91,10 +412,11 @@ class VectorStoreService:
         """
         try:
             # Truncate text if too long (max 8191 tokens for ada-002)
-            max_chars = 30000  # Approximate, ~8000 tokens
-            if len(text) > max_chars:
-                text = text[:max_chars]
-                logger.warning(f"Text truncated to {max_chars} characters")
+            text = self._truncate_for_embedding(text)
+            
+            embedding = self._cached_embedding(text)
+            if embedding is not None:
+                return embedding
             
             response = self.client.embeddings.create(
                 model=self.settings.embedding_model,
@@ -102,13 +424,188 @@ class VectorStoreService:
             )
             
             embedding = response.data[0].embedding
-            logger.debug(f"Generated embedding with {len(embedding)} dimensions")
+            logger.debug("Generated embedding with %d dimensions", len(embedding))
+            self._remember_embedding(text, embedding)
+            return embedding
+            
+        except Exception as e:
+            logger.error(f"Error generating embedding: {str(e)}")
+            raise Exception(f"Failed to generate embedding: {str(e)}")
+    
+    async def agenerate_embedding(self, text: str) -> List[float]:
+        """
+        Generate embedding for a text without blocking the event loop.
+        
+        Args:
+            text: Text to embed
+            
+        Returns:
+            Embedding vector
+            
+        Raises:
+            Exception: If embedding generation fails
+        """
+        try:
+            text = self._truncate_for_embedding(text)
+            
+            embedding = self._cached_embedding(text)
+            if embedding is not None:
+                return embedding
+            
+            response = await get_async_openai_client().embeddings.create(
+                model=self.settings.embedding_model,
+                input=text
+            )
+            
+            embedding = response.data[0].embedding
+            self._remember_embedding(text, embedding)
             return embedding
             
         except Exception as e:
             logger.error(f"Error generating embedding: {str(e)}")
             raise Exception(f"Failed to generate embedding: {str(e)}")
     
+    def _cached_embedding(self, text: str) -> Optional[List[float]]:
+        """Get the embedding of a text embedded before (in memory or on disk), if any."""
+        key = (self.settings.embedding_model, text)
+        with self._embedding_cache_lock:
+            embedding = self._embedding_cache.get(key)
+            if embedding is not None:
+                self._embedding_cache.move_to_end(key)
+                return embedding
+        
+        path = self._embedding_path(text)
+        try:
+            embedding = np.load(path).tolist()
+            os.utime(path)  # Marks the file recently used for pruning
+        except (OSError, ValueError):
+            return None
+        
+        self._remember_embedding(text, embedding, persist=False)
+        return embedding
+    
+    def _remember_embedding(self, text: str, embedding: List[float], persist: bool = True):
+        """Add an embedding to the LRU cache of recent texts, and store it on disk."""
+        with self._embedding_cache_lock:
+            self._embedding_cache[(self.settings.embedding_model, text)] = embedding
+            if len(self._embedding_cache) > self.EMBEDDING_CACHE_SIZE:
+                self._embedding_cache.popitem(last=False)
+        
+        if not persist:
+            return
+        
+        # Written atomically, so concurrent readers never see partial files
+        try:
+            path = self._embedding_path(text)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.array(embedding, dtype='float32'))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not persist embedding: {str(e)}")
+            return
+        
+        # Prune again once a tenth of the allowed files has been added
+        with self._embedding_cache_lock:
+            self._embeddings_persisted += 1
+            prune = self._embeddings_persisted >= max(self.settings.embedding_cache_max_files // 10, 1)
+            if prune:
+                self._embeddings_persisted = 0
+        if prune:
+            self._prune_embedding_cache()
+    
+    def _prune_embedding_cache(self):
+        """Delete the least recently used embedding files beyond embedding_cache_max_files."""
+        try:
+            files = [entry for entry in os.scandir(self.embedding_cache_dir) if entry.name.endswith('.npy')]
+        except OSError:
+            return
+        
+        excess = len(files) - self.settings.embedding_cache_max_files
+        if excess <= 0:
+            return
+        
+        def last_used(entry: os.DirEntry) -> float:
+            try:
+                return entry.stat().st_mtime
+            except OSError:
+                return 0.0
+        
+        for entry in sorted(files, key=last_used)[:excess]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+        logger.info(f"✓ Pruned {excess} cached query embeddings")
+    
+    def _embedding_path(self, text: str) -> Path:
+        """Get the on-disk cache file for a text's embedding (keyed by model and text)."""
+        digest = hashlib.sha256(orjson.dumps((self.settings.embedding_model, text))).hexdigest()
+        return self.embedding_cache_dir / f"{digest}.npy"
+    
+    def generate_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for several queries, reusing cached ones.
+        
+        Queries not embedded before share one embedding request, and their
+        embeddings are cached like generate_embedding()'s.
+        
+        Args:
+            queries: Queries to embed
+            
+        Returns:
+            Embedding vectors in query order
+            
+        Raises:
+            Exception: If embedding generation fails
+        """
+        texts = [self._truncate_for_embedding(query) for query in queries]
+        embeddings = [self._cached_embedding(text) for text in texts]
+        
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            new_embeddings = self.generate_embeddings([texts[i] for i in missing])
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+                self._remember_embedding(texts[i], embedding)
+        
+        return embeddings
+    
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for several texts with as few API calls as possible.
+        
+        Texts are sent longest first so similarly sized inputs share a request,
+        and the embeddings are returned in input order.
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            Embedding vectors in input order
+            
+        Raises:
+            Exception: If embedding generation fails
+        """
+        try:
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+            sorted_texts = [self._truncate_for_embedding(texts[i]) for i in order]
+            
+            sorted_embeddings = []
+            for start, end in self._embedding_batches(sorted_texts):
+                sorted_embeddings.extend(self._embed_batch(sorted_texts[start:end]))
+            
+            embeddings = [None] * len(texts)
+            for position, embedding in zip(order, sorted_embeddings):
+                embeddings[position] = embedding
+            return embeddings
+            
+        except Exception as e:
+            logger.error(f"Error generating embeddings: {str(e)}")
+            raise Exception(f"Failed to generate embeddings: {str(e)}")
+    
     def add_documents(
         self, 
         chunks: List[str], 
@@ -124,65 +621,364 @@ class VectorStoreService:
         Raises:
             Exception: If indexing fails
         """
-        try:
-            if not chunks:
-                raise ValueError("No chunks provided")
+        if not chunks:
+            raise ValueError("No chunks provided")
+        
+        self.add_documents_bulk([chunks], [doc_metadata])
+    
+    def add_documents_bulk(
+        self,
+        batched_chunks: List[List[str]],
+        batched_metadata: List[Dict]
+    ) -> int:
+        """
+        Add chunks from several documents, embedding them in as few API calls as possible.
+        
+        Chunks of all documents are embedded together in sub-batches of at most
+        MAX_EMBEDDING_BATCH inputs (and MAX_EMBEDDING_BATCH_CHARS characters),
+        then added to the index and saved once.
+        
+        Args:
+            batched_chunks: Text chunks of each document
+            batched_metadata: Metadata of each document (same order as batched_chunks)
             
-            logger.info(f"Indexing {len(chunks)} chunks from {doc_metadata.get('file_name', 'unknown')}")
+        Returns:
+            Number of documents with at least one chunk indexed
+            
+        Raises:
+            Exception: If no chunk could be indexed
+        """
+        try:
+            texts, chunk_metadata = self._collect_chunks(batched_chunks, batched_metadata)
             
             embeddings = []
+            indexed_metadata = []
             
-            for i, chunk in enumerate(chunks):
+            for start, end in self._embedding_batches(texts):
                 try:
-                    # Generate embedding
-                    embedding = self.generate_embedding(chunk)
-                    embeddings.append(embedding)
-                    
-                    # Store metadata
-                    self.metadata.append({
-                        "chunk_id": len(self.metadata),
-                        "chunk_text": chunk,
-                        "chunk_index": i,
-                        "source_document": doc_metadata.get("file_name", "unknown"),
-                        "file_path": doc_metadata.get("file_path", "unknown"),
-                        "total_chunks": doc_metadata.get("num_chunks", len(chunks))
-                    })
-                    
-                    if (i + 1) % 10 == 0:
-                        logger.info(f"  Processed {i + 1}/{len(chunks)} chunks")
-                        
+                    embedded = self._embed_batch_isolating(texts, start, end)
+                    for i, embedding in embedded:
+                        embeddings.append(embedding)
+                        indexed_metadata.append(chunk_metadata[i])
+                    logger.info(f"  Embedded {end}/{len(texts)} chunks")
                 except Exception as e:
-                    logger.error(f"Error processing chunk {i}: {str(e)}")
-                    # Continue with next chunk
+                    logger.error(f"Error embedding chunks {start}-{end - 1}: {str(e)}")
+                    # Continue with next batch
                     continue
             
-            if not embeddings:
-                raise Exception("No embeddings generated successfully")
+            return self._add_embeddings(embeddings, indexed_metadata)
             
-            # Add to FAISS index
-            embeddings_array = np.array(embeddings).astype('float32')
-            self.index.add(embeddings_array)
+        except Exception as e:
+            logger.error(f"Error adding documents: {str(e)}")
+            raise
+    
+    async def add_documents_bulk_async(
+        self,
+        batched_chunks: List[List[str]],
+        batched_metadata: List[Dict]
+    ) -> int:
+        """
+        Add chunks from several documents, with several embedding requests in flight.
+        
+        Works like add_documents_bulk, but sends up to EMBEDDING_CONCURRENCY
+        batches at once on the async client, backing off when rate limited.
+        Adding to the index and saving run in a worker thread.
+        
+        Args:
+            batched_chunks: Text chunks of each document
+            batched_metadata: Metadata of each document (same order as batched_chunks)
+            
+        Returns:
+            Number of documents with at least one chunk indexed
+            
+        Raises:
+            Exception: If no chunk could be indexed
+        """
+        try:
+            texts, chunk_metadata = self._collect_chunks(batched_chunks, batched_metadata)
+            per_request = -(-len(texts) // self.EMBEDDING_CONCURRENCY)
+            batches = self._embedding_batches(texts, max(per_request, self.MIN_CONCURRENT_BATCH))
+            semaphore = asyncio.Semaphore(self.EMBEDDING_CONCURRENCY)
+            
+            async def embed(start: int, end: int) -> List[Tuple[int, List[float]]]:
+                async with semaphore:
+                    try:
+                        embedded = await self._aembed_batch_isolating(texts, start, end)
+                        logger.info(f"  Embedded chunks {start}-{end - 1} of {len(texts)}")
+                        return embedded
+                    except Exception as e:
+                        logger.error(f"Error embedding chunks {start}-{end - 1}: {str(e)}")
+                        return []
             
-            # Save to disk
-            self._save_index()
+            results = await asyncio.gather(*(embed(start, end) for start, end in batches))
             
-            logger.info(f"✓ Successfully indexed {len(embeddings)} chunks")
+            embeddings = []
+            indexed_metadata = []
+            for embedded in results:
+                for i, embedding in embedded:
+                    embeddings.append(embedding)
+                    indexed_metadata.append(chunk_metadata[i])
+            
+            return await asyncio.to_thread(self._add_embeddings, embeddings, indexed_metadata)
             
         except Exception as e:
             logger.error(f"Error adding documents: {str(e)}")
             raise
     
+    def _collect_chunks(
+        self,
+        batched_chunks: List[List[str]],
+        batched_metadata: List[Dict]
+    ) -> Tuple[List[str], List[Dict]]:
+        """
+        Flatten documents into the texts to embed and the metadata of each chunk.
+        
+        Args:
+            batched_chunks: Text chunks of each document
+            batched_metadata: Metadata of each document
+            
+        Returns:
+            Tuple of (texts truncated for embedding, chunk metadata)
+            
+        Raises:
+            ValueError: If there are no chunks
+        """
+        texts = []
+        chunk_metadata = []
+        
+        for chunks, doc_metadata in zip(batched_chunks, batched_metadata):
+            logger.info(f"Indexing {len(chunks)} chunks from {doc_metadata.get('file_name', 'unknown')}")
+            
+            # Fields shared by every chunk of the document
+            document_fields = {
+                "source_document": doc_metadata.get("file_name", "unknown"),
+                "file_path": doc_metadata.get("file_path", "unknown"),
+                "total_chunks": doc_metadata.get("num_chunks", len(chunks)),
+                "agency": doc_metadata.get("agency"),
+                "drug_name": doc_metadata.get("drug_name")
+            }
+            
+            texts.extend(map(self._truncate_for_embedding, chunks))
+            chunk_metadata.extend(
+                {"chunk_text": chunk, "chunk_index": i, **document_fields}
+                for i, chunk in enumerate(chunks)
+            )
+        
+        if not texts:
+            raise ValueError("No chunks provided")
+        
+        return texts, chunk_metadata
+    
+    def _add_embeddings(self, embeddings: List[List[float]], indexed_metadata: List[Dict]) -> int:
+        """
+        Add embedded chunks to the index and save it.
+        
+        Args:
+            embeddings: Embedding of each chunk
+            indexed_metadata: Metadata of each chunk (same order)
+            
+        Returns:
+            Number of documents with at least one chunk indexed
+            
+        Raises:
+            Exception: If there are no embeddings
+        """
+        if not embeddings:
+            raise Exception("No embeddings generated successfully")
+        
+        # Add to FAISS index (unit length, so squared L2 distance = 2 - 2 * cosine)
+        embeddings_array = np.array(embeddings, dtype='float32')
+        faiss.normalize_L2(embeddings_array)
+        
+        with self._lock.write():
+            self._ensure_in_memory()
+            self.index.add(embeddings_array)
+            
+            base_id = len(self.metadata)
+            for chunk_id, entry in enumerate(indexed_metadata, start=base_id):
+                entry["chunk_id"] = chunk_id
+                self._register_filters(entry)
+            self.metadata.extend(indexed_metadata)
+            self.result_cache.clear()
+            
+            # Save to disk (quantizing re-saves once the corpus is large enough)
+            if not self.quantize_index():
+                self._save_index()
+        
+        documents_indexed = len({entry["file_path"] for entry in indexed_metadata})
+        logger.info(f"✓ Successfully indexed {len(embeddings)} chunks from {documents_indexed} documents")
+        return documents_indexed
+    
+    def _truncate_for_embedding(self, text: str) -> str:
+        """Truncate text to the embedding model's input limit (~8000 tokens)."""
+        if len(text) > self.MAX_EMBEDDING_CHARS:
+            logger.warning(f"Text truncated to {self.MAX_EMBEDDING_CHARS} characters")
+            return text[:self.MAX_EMBEDDING_CHARS]
+        return text
+    
+    def _embedding_batches(self, texts: List[str], max_batch: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Split texts into (start, end) ranges that fit in a single embeddings request.
+        
+        Args:
+            texts: Texts to embed
+            max_batch: Maximum inputs per batch (defaults to MAX_EMBEDDING_BATCH)
+            
+        Returns:
+            List of (start, end) index ranges
+        """
+        max_batch = min(max_batch or self.MAX_EMBEDDING_BATCH, self.MAX_EMBEDDING_BATCH)
+        batches = []
+        start = 0
+        batch_chars = 0
+        
+        for i, text in enumerate(texts):
+            batch_full = (
+                i - start >= max_batch
+                or batch_chars + len(text) > self.MAX_EMBEDDING_BATCH_CHARS
+            )
+            if batch_full and i > start:
+                batches.append((start, i))
+                start = i
+                batch_chars = 0
+            batch_chars += len(text)
+        
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        
+        return batches
+    
+    def _embed_batch_isolating(
+        self,
+        texts: List[str],
+        start: int,
+        end: int
+    ) -> List[Tuple[int, List[float]]]:
+        """
+        Embed texts[start:end], leaving out only the inputs the API rejects.
+        
+        A rejected batch is split in half and each half retried, so one bad
+        chunk costs about 2*log2(batch size) extra requests instead of the
+        whole batch. Other errors (rate limits, network) are raised as is.
+        
+        Args:
+            texts: All texts being embedded (already truncated)
+            start: First index of the batch
+            end: Index after the last text of the batch
+            
+        Returns:
+            (index, embedding) pairs of the texts that were embedded, in order
+            
+        Raises:
+            Exception: If embedding fails for a reason other than bad input
+        """
+        try:
+            return list(zip(range(start, end), self._embed_batch(texts[start:end])))
+        except BadRequestError as e:
+            if end - start == 1:
+                logger.warning(f"Skipping chunk {start} rejected by the embeddings API: {str(e)}")
+                return []
+        
+        middle = (start + end) // 2
+        return (
+            self._embed_batch_isolating(texts, start, middle)
+            + self._embed_batch_isolating(texts, middle, end)
+        )
+    
+    async def _aembed_batch_isolating(
+        self,
+        texts: List[str],
+        start: int,
+        end: int
+    ) -> List[Tuple[int, List[float]]]:
+        """
+        Async version of _embed_batch_isolating, retrying rate-limited requests.
+        
+        Args:
+            texts: All texts being embedded (already truncated)
+            start: First index of the batch
+            end: Index after the last text of the batch
+            
+        Returns:
+            (index, embedding) pairs of the texts that were embedded, in order
+            
+        Raises:
+            Exception: If embedding fails for a reason other than bad input
+        """
+        try:
+            return list(zip(range(start, end), await self._aembed_batch(texts[start:end])))
+        except BadRequestError as e:
+            if end - start == 1:
+                logger.warning(f"Skipping chunk {start} rejected by the embeddings API: {str(e)}")
+                return []
+        
+        middle = (start + end) // 2
+        return (
+            await self._aembed_batch_isolating(texts, start, middle)
+            + await self._aembed_batch_isolating(texts, middle, end)
+        )
+    
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several texts with a single async API call, backing off when rate limited.
+        
+        Args:
+            texts: Texts to embed (already truncated)
+            
+        Returns:
+            Embedding vectors in input order
+        """
+        for attempt in range(self.EMBEDDING_RATE_LIMIT_ATTEMPTS):
+            try:
+                response = await get_async_openai_client().embeddings.create(
+                    model=self.settings.embedding_model,
+                    input=texts
+                )
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except RateLimitError:
+                if attempt == self.EMBEDDING_RATE_LIMIT_ATTEMPTS - 1:
+                    raise
+                logger.warning(f"Rate limited while embedding, retrying in {2 ** attempt}s")
+                await asyncio.sleep(2 ** attempt)
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several texts with a single API call.
+        
+        Args:
+            texts: Texts to embed (already truncated)
+            
+        Returns:
+            Embedding vectors in input order
+        """
+        response = self.client.embeddings.create(
+            model=self.settings.embedding_model,
+            input=texts
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    
     def search(
         self, 
         query: str, 
-        k: int = 5
+        k: int = 5,
+        agencies: Optional[List[str]] = None,
+        drug_name: Optional[str] = None,
+        with_embeddings: bool = False
     ) -> List[Dict]:
         """
         Search for similar chunks given a query.
         
+        When agencies or drug_name are given, only chunks indexed for them are
+        compared against the query. If no chunk matches the filter, the whole
+        index is searched.
+        
         Args:
             query: Search query
             k: Number of results to return
+            agencies: Only return chunks from these agencies
+            drug_name: Only return chunks indexed for this drug
+            with_embeddings: Attach each chunk's stored vector as 'embedding'
+                (approximate once the index is quantized)
             
         Returns:
             List of similar chunks with metadata
@@ -195,37 +991,274 @@ class VectorStoreService:
                 logger.warning("Index is empty, no results to return")
                 return []
             
-            # Ensure k doesn't exceed available vectors
-            k = min(k, len(self.metadata))
-            
             # Generate query embedding
             query_embedding = self.generate_embedding(query)
-            query_vector = np.array([query_embedding]).astype('float32')
+            return self._search_vector(query_embedding, k, agencies, drug_name, with_embeddings)
             
-            # Search FAISS index
-            distances, indices = self.index.search(query_vector, k)
+        except Exception as e:
+            logger.error(f"Error searching index: {str(e)}")
+            raise
+    
+    async def search_async(
+        self, 
+        query: str, 
+        k: int = 5,
+        agencies: Optional[List[str]] = None,
+        drug_name: Optional[str] = None,
+        with_embeddings: bool = False
+    ) -> List[Dict]:
+        """
+        Search for similar chunks without blocking the event loop.
+        
+        The query is embedded with the async client and the FAISS search runs
+        in a worker thread (FAISS releases the GIL), so concurrent queries
+        overlap. Filtering works as in search().
+        
+        Args:
+            query: Search query
+            k: Number of results to return
+            agencies: Only return chunks from these agencies
+            drug_name: Only return chunks indexed for this drug
+            with_embeddings: Attach each chunk's stored vector as 'embedding'
             
-            # Retrieve metadata for results
-            results = []
-            for i, idx in enumerate(indices[0]):
-                if idx < len(self.metadata) and idx >= 0:
-                    result = self.metadata[idx].copy()
-                    result["distance"] = float(distances[0][i])
-                    result["similarity_score"] = 1 / (1 + float(distances[0][i]))  # Convert distance to similarity
-                    results.append(result)
+        Returns:
+            List of similar chunks with metadata
             
-            logger.info(f"✓ Found {len(results)} similar chunks for query")
-            return results
+        Raises:
+            Exception: If search fails
+        """
+        try:
+            if not self.metadata:
+                logger.warning("Index is empty, no results to return")
+                return []
+            
+            query_embedding = await self.agenerate_embedding(query)
+            return await asyncio.to_thread(
+                self._search_vector, query_embedding, k, agencies, drug_name, with_embeddings
+            )
             
         except Exception as e:
             logger.error(f"Error searching index: {str(e)}")
             raise
     
+    def search_many(
+        self,
+        queries: List[str],
+        k: int = 5,
+        agencies: Optional[List[str]] = None,
+        drug_name: Optional[str] = None,
+        with_embeddings: bool = False
+    ) -> List[List[Dict]]:
+        """
+        Search for similar chunks for several queries at once.
+        
+        Queries not embedded recently share one embedding request, and the index
+        is searched with all of them in a single FAISS call. Filtering works as
+        in search().
+        
+        Args:
+            queries: Search queries
+            k: Number of results to return per query
+            agencies: Only return chunks from these agencies
+            drug_name: Only return chunks indexed for this drug
+            with_embeddings: Attach each chunk's stored vector as 'embedding'
+            
+        Returns:
+            List of similar chunks with metadata for each query, in query order
+            
+        Raises:
+            Exception: If search fails
+        """
+        try:
+            if not self.metadata:
+                logger.warning("Index is empty, no results to return")
+                return [[] for _ in queries]
+            
+            query_embeddings = self.generate_query_embeddings(queries)
+            return self._search_vectors(query_embeddings, k, agencies, drug_name, with_embeddings)
+            
+        except Exception as e:
+            logger.error(f"Error searching index: {str(e)}")
+            raise
+    
+    def _search_vector(
+        self,
+        query_embedding: List[float],
+        k: int,
+        agencies: Optional[List[str]],
+        drug_name: Optional[str],
+        with_embeddings: bool
+    ) -> List[Dict]:
+        """
+        Find the chunks nearest to an embedded query.
+        
+        Args:
+            query_embedding: Query embedding
+            k: Number of results to return
+            agencies: Only return chunks from these agencies
+            drug_name: Only return chunks indexed for this drug
+            with_embeddings: Attach each chunk's stored vector as 'embedding'
+            
+        Returns:
+            List of similar chunks with metadata
+        """
+        return self._search_vectors([query_embedding], k, agencies, drug_name, with_embeddings)[0]
+    
+    def _search_vectors(
+        self,
+        query_embeddings: List[List[float]],
+        k: int,
+        agencies: Optional[List[str]],
+        drug_name: Optional[str],
+        with_embeddings: bool
+    ) -> List[List[Dict]]:
+        """
+        Find the chunks nearest to each of several embedded queries.
+        
+        Queries without cached results are searched together in one FAISS call.
+        
+        Args:
+            query_embeddings: Query embeddings
+            k: Number of results to return per query
+            agencies: Only return chunks from these agencies
+            drug_name: Only return chunks indexed for this drug
+            with_embeddings: Attach each chunk's stored vector as 'embedding'
+            
+        Returns:
+            List of similar chunks with metadata for each query
+        """
+        query_vectors = np.array(query_embeddings, dtype='float32')
+        faiss.normalize_L2(query_vectors)
+        scope = (
+            k,
+            tuple(sorted(agencies)) if agencies else None,
+            drug_name.lower() if drug_name else None,
+            with_embeddings
+        )
+        all_results: List[Optional[List[Dict]]] = [None] * len(query_embeddings)
+        
+        # Results of near-identical earlier queries, if the index hasn't changed since
+        uncached = []
+        for i in range(len(query_vectors)):
+            cached = self.result_cache.lookup(query_vectors[i:i + 1], scope)
+            if cached is not None:
+                all_results[i] = [dict(result) for result in cached]
+            else:
+                uncached.append(i)
+        
+        if not uncached:
+            return all_results
+        
+        # Shared with other searches; only indexing waits for it
+        with self._lock.read():
+            candidate_ids = self._filter_ids(agencies, drug_name)
+            
+            # Ensure k doesn't exceed available vectors
+            k = min(k, len(candidate_ids) if candidate_ids is not None else len(self.metadata))
+            
+            # Search FAISS index
+            search_vectors = query_vectors[uncached]
+            if candidate_ids is None:
+                distances, indices = self.index.search(search_vectors, k)
+            else:
+                selector = faiss.IDSelectorBatch(np.array(candidate_ids, dtype='int64'))
+                if isinstance(self.index, faiss.IndexHNSW):
+                    params = faiss.SearchParametersHNSW(
+                        sel=selector, efSearch=self.index.hnsw.efSearch
+                    )
+                elif isinstance(self.index, faiss.IndexIVF):
+                    params = faiss.SearchParametersIVF(sel=selector, nprobe=self.index.nprobe)
+                else:
+                    params = faiss.SearchParameters(sel=selector)
+                distances, indices = self.index.search(search_vectors, k, params=params)
+            
+            # Retrieve metadata for results
+            for row, query_index in enumerate(uncached):
+                results = []
+                for i, idx in enumerate(indices[row]):
+                    if idx < len(self.metadata) and idx >= 0:
+                        result = self.metadata[idx].copy()
+                        result["distance"] = float(distances[row][i])
+                        result["similarity_score"] = 1 - float(distances[row][i]) / 2  # Cosine similarity
+                        if with_embeddings:
+                            result["embedding"] = self.index.reconstruct(int(idx))
+                        results.append(result)
+                
+                self.result_cache.add(
+                    query_vectors[query_index:query_index + 1],
+                    [dict(result) for result in results],
+                    scope
+                )
+                all_results[query_index] = results
+                logger.info(f"✓ Found {len(results)} similar chunks for query")
+        
+        return all_results
+    
+    def indexed_drugs(self) -> frozenset:
+        """
+        Get the drugs that have indexed chunks.
+        
+        Returns:
+            Lowercased drug names
+        """
+        with self._lock.read():
+            return frozenset(self._ids_by_drug)
+    
+    def indexed_documents(self) -> frozenset:
+        """
+        Get the documents that have indexed chunks.
+        
+        Returns:
+            Source document file names
+        """
+        with self._lock.read():
+            return frozenset(self._source_documents)
+    
+    def _filter_ids(
+        self,
+        agencies: Optional[List[str]],
+        drug_name: Optional[str]
+    ) -> Optional[List[int]]:
+        """
+        Get the vector ids matching an agency/drug filter.
+        
+        Args:
+            agencies: Agencies to keep (None = any)
+            drug_name: Drug to keep (None = any)
+            
+        Returns:
+            Sorted matching ids, or None to search the whole index
+        """
+        if not agencies and not drug_name:
+            return None
+        
+        candidates = None
+        
+        if agencies:
+            candidates = set()
+            for agency in agencies:
+                candidates.update(self._ids_by_agency.get(agency, []))
+        
+        if drug_name:
+            drug_ids = set(self._ids_by_drug.get(drug_name.lower(), []))
+            candidates = drug_ids if candidates is None else candidates & drug_ids
+        
+        if not candidates:
+            logger.info("No chunks match the search filter, searching all documents")
+            return None
+        
+        return sorted(candidates)
+    
+    @property
+    def total_vectors(self) -> int:
+        """Number of indexed chunks."""
+        return len(self.metadata)
+    
     def get_stats(self) -> Dict:
         """Get statistics about the vector store."""
         return {
-            "total_vectors": len(self.metadata),
+            "total_vectors": self.total_vectors,
             "dimension": self.dimension,
             "index_type": type(self.index).__name__,
-            "unique_documents": len(set(m.get("source_document", "") for m in self.metadata))
+            "unique_documents": len(self._source_documents)
         }
@@ -4,19 +4,48 @@ Replaces all Selenium-based scrapers with a single intelligent agent.
 """
 
 import asyncio
+import atexit
 import logging
 import os
-from typing import List, Dict, Optional
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Coroutine, List, Dict, Optional
 from pathlib import Path
 
+import orjson
+
 from browser_use import Agent, Browser, ChatBrowserUse
 
 from app.core.config import get_settings
+from app.services.web_automation.http_retrieval import EMADocumentRetriever
 from app.services.web_automation.validation_tools import create_validation_tools_for_browser_use
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1)
+def _browser_executable_path() -> Optional[str]:
+    """
+    Locate the Chrome/Chromium binary once per process, rather than on every launch.
+    
+    Uses settings.browser_executable_path when set. Otherwise asks browser-use's
+    own lookup, which is private API; if it is missing, returns None and
+    browser-use searches at each launch as usual.
+    """
+    configured = get_settings().browser_executable_path
+    if configured:
+        return configured
+    
+    try:
+        from browser_use.browser.watchdogs.local_browser_watchdog import LocalBrowserWatchdog
+        return LocalBrowserWatchdog._find_installed_browser_path()
+    except (ImportError, AttributeError) as e:
+        logger.debug(f"Browser lookup unavailable, leaving it to browser-use: {str(e)}")
+        return None
+
+
 class AIWebNavigator:
     """
     Intelligent web navigator that can autonomously navigate regulatory agency websites
@@ -45,14 +74,34 @@ class AIWebNavigator:
         'NHRA': 'Regulatory approval documents'
     }
     
+    # Extra Chromium flags on top of browser-use's defaults: agency pages are
+    # read for their links and text, so images and audio are never loaded
+    BROWSER_ARGS = [
+        '--blink-settings=imagesEnabled=false',
+        '--disable-default-apps',
+        '--mute-audio'
+    ]
+    
     def __init__(self):
         """Initialize the AI navigator."""
         settings = get_settings()
         self.download_dir = settings.download_dir
         os.makedirs(self.download_dir, exist_ok=True)
         
-        # Initialize browser (will be created per session)
-        self.browser = None
+        # Files retrieved per agency and drug, kept on disk so a drug isn't
+        # scraped again within retrieval_cache_ttl (even across restarts)
+        self.retrieval_cache_ttl = settings.retrieval_cache_ttl
+        self._retrieval_cache_path = Path(self.download_dir) / '.retrieval_cache.json'
+        self._retrieval_cache: Dict[str, Dict] = self._load_retrieval_cache()
+        
+        # Persistent browsers (one per agency) live on a dedicated event loop
+        # so they survive across queries and callers' event loops
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
+        self._browsers: Dict[str, asyncio.Task] = {}
+        # An agency's browser is driven by one agent run at a time
+        self._browser_locks: Dict[str, asyncio.Lock] = {}
         
         # Initialize LLM for the agent
         # Use ChatBrowserUse which is optimized for browser automation
@@ -61,13 +110,218 @@ class AIWebNavigator:
         # Create validation tools
         self.tools = create_validation_tools_for_browser_use()
         
+        # Agencies whose documents can be fetched without a browser
+        self.http_retrievers = {
+            'EMA': EMADocumentRetriever(self.download_dir)
+        }
+        
         logger.info("AI Web Navigator initialized")
     
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the navigator's background event loop if needed."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="ai-navigator-loop",
+                    daemon=True
+                )
+                self._loop_thread.start()
+                # Fallback for navigators that aren't closed explicitly
+                atexit.register(self.close)
+            return self._loop
+    
+    def submit(self, coro: Coroutine) -> Future:
+        """
+        Schedule a coroutine on the navigator's event loop.
+        
+        Args:
+            coro: Coroutine to run
+        
+        Returns:
+            Future resolving to the coroutine's result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+    
+    def warmup(self, agencies: List[str]) -> Future:
+        """
+        Launch browsers for the given agencies in the background.
+        
+        Agencies served over plain HTTP only get a browser if the agent
+        fallback is needed.
+        
+        Args:
+            agencies: Agencies whose browsers should be started
+        
+        Returns:
+            Future that resolves once all browsers are up
+        """
+        return self.submit(self._warmup(agencies))
+    
+    async def _warmup(self, agencies: List[str]):
+        """Start browsers for several agencies concurrently."""
+        agencies = [
+            agency for agency in agencies
+            if agency in self.AGENCY_URLS and agency not in self.http_retrievers
+        ]
+        results = await asyncio.gather(
+            *(self._get_browser(agency) for agency in agencies),
+            return_exceptions=True
+        )
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures:
+            logger.warning(f"Browser warmup failed for {len(failures)} agencies: {failures[0]}")
+        else:
+            logger.info(f"Warmed up browsers for {', '.join(agencies)}")
+    
+    async def _get_browser(self, agency: str) -> Browser:
+        """
+        Get the persistent browser for an agency, launching it on first use.
+        
+        Must run on the navigator's event loop.
+        """
+        if agency not in self._browsers:
+            self._browsers[agency] = asyncio.ensure_future(self._launch_browser())
+        
+        try:
+            return await self._browsers[agency]
+        except Exception:
+            self._browsers.pop(agency, None)
+            raise
+    
+    def _browser_lock(self, agency: str) -> asyncio.Lock:
+        """Get the lock held while an agent run uses an agency's browser."""
+        return self._browser_locks.setdefault(agency, asyncio.Lock())
+    
+    async def _launch_browser(self) -> Browser:
+        """Launch a headless browser that stays alive between agent runs."""
+        browser = Browser(
+            headless=True,  # Run in headless mode
+            disable_security=False,
+            keep_alive=True,
+            executable_path=_browser_executable_path(),
+            args=self.BROWSER_ARGS,
+            # Downloads (and PDFs opened in the viewer) go through the browser's
+            # own session straight into the directory scanned for new files
+            downloads_path=os.path.abspath(self.download_dir),
+            accept_downloads=True,
+            auto_download_pdfs=True
+        )
+        await browser.start()
+        return browser
+    
+    async def _discard_browser(self, agency: str, browser: Optional[Browser] = None):
+        """
+        Shut down an agency's browser so the next run starts a fresh one.
+        
+        Args:
+            agency: Agency whose browser to shut down
+            browser: Only shut it down if it is still this browser (the one the
+                failing run used), not one launched since
+        """
+        task = self._browsers.get(agency)
+        if task is None:
+            return
+        if browser is not None and not (
+            task.done() and not task.cancelled() and task.exception() is None
+            and task.result() is browser
+        ):
+            return
+        self._browsers.pop(agency, None)
+        
+        try:
+            browser = await task
+        except Exception:
+            return
+        
+        try:
+            await browser.kill()
+        except Exception as e:
+            logger.debug(f"Error closing browser for {agency}: {e}")
+    
+    def __enter__(self) -> 'AIWebNavigator':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        """Close all persistent browsers and stop the navigator's event loop."""
+        # Closed deterministically, so there's nothing left to do at exit
+        atexit.unregister(self.close)
+        
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        
+        if loop is None:
+            return
+        
+        async def _close_all():
+            for agency in list(self._browsers):
+                await self._discard_browser(agency)
+            for retriever in self.http_retrievers.values():
+                await retriever.close()
+        
+        try:
+            asyncio.run_coroutine_threadsafe(_close_all(), loop).result(timeout=30)
+        except Exception as e:
+            logger.warning(f"Error closing browsers: {e}")
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            self._loop_thread.join(timeout=5)
+            loop.close()
+    
+    def _load_retrieval_cache(self) -> Dict[str, Dict]:
+        """Read the retrieval cache left by earlier sessions."""
+        try:
+            return orjson.loads(self._retrieval_cache_path.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return {}
+    
+    def _retrieval_cache_key(
+        self,
+        drug_name: str,
+        agency: str,
+        document_types: Optional[List[str]] = None
+    ) -> str:
+        """Build the retrieval cache key for a drug at an agency."""
+        return '|'.join([agency, drug_name.strip().lower(), *sorted(document_types or [])])
+    
+    def _cached_retrieval(self, cache_key: str) -> Optional[List[str]]:
+        """
+        Get the files retrieved earlier for a cache key.
+        
+        Args:
+            cache_key: Key from _retrieval_cache_key
+        
+        Returns:
+            File paths, or None if there are none within the TTL or a file is gone
+        """
+        entry = self._retrieval_cache.get(cache_key)
+        if entry is None or time.time() - entry['retrieved_at'] > self.retrieval_cache_ttl:
+            return None
+        if not all(os.path.exists(path) for path in entry['files']):
+            return None
+        return list(entry['files'])
+    
+    def _remember_retrieval(self, cache_key: str, files: List[str]):
+        """Record retrieved files and persist the cache (atomically)."""
+        self._retrieval_cache[cache_key] = {'retrieved_at': time.time(), 'files': files}
+        
+        try:
+            tmp_path = self._retrieval_cache_path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp_path.write_bytes(orjson.dumps(self._retrieval_cache))
+            os.replace(tmp_path, self._retrieval_cache_path)
+        except OSError as e:
+            logger.warning(f"Could not persist retrieval cache: {e}")
+    
     async def retrieve_documents(
         self,
         drug_name: str,
         agencies: List[str],
-        document_types: Optional[List[str]] = None
+        document_types: Optional[List[str]] = None,
+        max_documents: Optional[int] = None
     ) -> Dict[str, List[str]]:
         """
         Retrieve regulatory documents for a drug from specified agencies.
@@ -76,35 +330,66 @@ class AIWebNavigator:
             drug_name: Name of the drug
             agencies: List of agency names (FDA, EMA, etc.)
             document_types: Optional list of specific document types to retrieve
+            max_documents: Maximum documents to retrieve per agency (None = all found)
         
         Returns:
             Dict mapping agency names to lists of downloaded file paths
         """
-        results = {}
+        # Browsers are bound to the navigator's loop, so always run there
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is not loop:
+            return await asyncio.wrap_future(
+                self.submit(self.retrieve_documents(drug_name, agencies, document_types, max_documents))
+            )
         
-        for agency in agencies:
-            logger.info(f"Retrieving documents from {agency} for {drug_name}")
-            
-            try:
-                files = await self._retrieve_from_agency(
-                    drug_name=drug_name,
-                    agency=agency,
-                    document_types=document_types
-                )
-                results[agency] = files
-                logger.info(f"Retrieved {len(files)} documents from {agency}")
-                
-            except Exception as e:
-                logger.error(f"Error retrieving from {agency}: {e}")
-                results[agency] = []
+        # Each agency has its own browser, so scrape them all at once
+        files_per_agency = await asyncio.gather(
+            *(
+                self._retrieve_and_log(drug_name, agency, document_types, max_documents)
+                for agency in agencies
+            )
+        )
         
-        return results
+        return dict(zip(agencies, files_per_agency))
+    
+    async def _retrieve_and_log(
+        self,
+        drug_name: str,
+        agency: str,
+        document_types: Optional[List[str]] = None,
+        max_documents: Optional[int] = None
+    ) -> List[str]:
+        """Retrieve documents from one agency, logging (not raising) failures."""
+        cache_key = self._retrieval_cache_key(drug_name, agency, document_types)
+        cached_files = self._cached_retrieval(cache_key)
+        if cached_files is not None:
+            logger.info(f"Reusing {len(cached_files)} documents retrieved from {agency} for {drug_name}")
+            return cached_files[:max_documents]
+        
+        logger.info(f"Retrieving documents from {agency} for {drug_name}")
+        
+        try:
+            files = await self._retrieve_from_agency(
+                drug_name=drug_name,
+                agency=agency,
+                document_types=document_types,
+                max_documents=max_documents
+            )
+            logger.info(f"Retrieved {len(files)} documents from {agency}")
+            if files:
+                self._remember_retrieval(cache_key, files)
+            return files[:max_documents]
+            
+        except Exception as e:
+            logger.error(f"Error retrieving from {agency}: {e}")
+            return []
     
     async def _retrieve_from_agency(
         self,
         drug_name: str,
         agency: str,
-        document_types: Optional[List[str]] = None
+        document_types: Optional[List[str]] = None,
+        max_documents: Optional[int] = None
     ) -> List[str]:
         """
         Retrieve documents from a specific agency.
@@ -113,6 +398,7 @@ class AIWebNavigator:
             drug_name: Name of the drug
             agency: Agency name
             document_types: Optional specific document types
+            max_documents: Maximum documents to download (None = all found)
         
         Returns:
             List of downloaded file paths
@@ -121,52 +407,57 @@ class AIWebNavigator:
             logger.error(f"Unknown agency: {agency}")
             return []
         
-        # Build the task description
-        task = self._build_task_description(drug_name, agency, document_types)
+        # Try plain HTTP first; specific document types need the agent
+        retriever = self.http_retrievers.get(agency)
+        if retriever is not None and not document_types:
+            try:
+                files = await retriever.retrieve(drug_name, max_documents)
+                if files:
+                    return files
+                logger.info(f"No {agency} documents found over HTTP, falling back to the AI agent")
+            except Exception as e:
+                logger.warning(f"HTTP retrieval from {agency} failed, falling back to the AI agent: {e}")
         
-        # Create browser instance
-        browser = Browser(
-            headless=True,  # Run in headless mode
-            disable_security=False
-        )
+        # Build the task description
+        task = self._build_task_description(drug_name, agency, document_types, max_documents)
         
-        try:
-            # Create agent
-            agent = Agent(
-                task=task,
-                llm=self.llm,
-                browser=browser,
-                tools=self.tools,
-                max_actions_per_step=10
-            )
-            
-            # Run the agent
-            logger.info(f"Starting AI agent for {agency}")
-            history = await agent.run()
+        # Concurrent queries for the same agency take turns with its browser
+        async with self._browser_lock(agency):
+            browser = await self._get_browser(agency)
             
-            # Extract downloaded files from history
-            downloaded_files = self._extract_downloaded_files(history)
-            
-            logger.info(f"Agent completed. Downloaded {len(downloaded_files)} files")
-            return downloaded_files
-            
-        except Exception as e:
-            logger.error(f"Error in AI agent for {agency}: {e}")
-            return []
-        
-        finally:
-            # Close browser
-            if browser:
-                try:
-                    await browser.close()
-                except:
-                    pass
+            try:
+                # Create agent
+                agent = Agent(
+                    task=task,
+                    llm=self.llm,
+                    browser=browser,
+                    tools=self.tools,
+                    max_actions_per_step=10
+                )
+                
+                # Run the agent
+                logger.info(f"Starting AI agent for {agency}")
+                downloads_before = self._snapshot_downloads()
+                history = await agent.run()
+                
+                # Extract downloaded files from history
+                downloaded_files = self._extract_downloaded_files(history, downloads_before)
+                
+                logger.info(f"Agent completed. Downloaded {len(downloaded_files)} files")
+                return downloaded_files
+                
+            except Exception as e:
+                logger.error(f"Error in AI agent for {agency}: {e}")
+                # The browser may be in a bad state - start fresh next time
+                await self._discard_browser(agency, browser)
+                return []
     
     def _build_task_description(
         self,
         drug_name: str,
         agency: str,
-        document_types: Optional[List[str]] = None
+        document_types: Optional[List[str]] = None,
+        max_documents: Optional[int] = None
     ) -> str:
         """
         Build a detailed task description for the AI agent.
@@ -175,6 +466,7 @@ class AIWebNavigator:
             drug_name: Name of the drug
             agency: Agency name
             document_types: Optional specific document types
+            max_documents: Maximum documents to download (None = all relevant)
         
         Returns:
             Task description string
@@ -182,6 +474,10 @@ class AIWebNavigator:
         agency_url = self.AGENCY_URLS[agency]
         default_doc_types = self.DOCUMENT_TYPES.get(agency, 'regulatory review documents')
         doc_types_str = ', '.join(document_types) if document_types else default_doc_types
+        if max_documents:
+            amount_str = f"download at most {max_documents}, the most relevant first"
+        else:
+            amount_str = "download all relevant ones"
         
         task = f"""
 Navigate to the {agency} website at {agency_url}.
@@ -203,7 +499,7 @@ Important:
 - Focus on regulatory REVIEW documents, not labels or patient information
 - Download only PDF files
 - Save files to the default download directory
-- If you encounter multiple documents, download all relevant ones
+- If you encounter multiple documents, {amount_str}
 - If the drug is not found, try alternative names or spellings
 
 Return a summary of downloaded files.
@@ -211,12 +507,26 @@ Return a summary of downloaded files.
         
         return task.strip()
     
-    def _extract_downloaded_files(self, agent_history) -> List[str]:
+    def _snapshot_downloads(self) -> Dict[str, int]:
+        """
+        Record the PDF files already in the download directory.
+        
+        Returns:
+            Dict mapping file names to modification times (ns)
+        """
+        with os.scandir(self.download_dir) as entries:
+            return {
+                entry.name: entry.stat().st_mtime_ns
+                for entry in entries if entry.name.endswith('.pdf')
+            }
+    
+    def _extract_downloaded_files(self, agent_history, downloads_before: Dict[str, int]) -> List[str]:
         """
         Extract list of downloaded files from agent execution history.
         
         Args:
             agent_history: History object from agent.run()
+            downloads_before: Snapshot of the download directory taken before the run
         
         Returns:
             List of file paths
@@ -224,15 +534,16 @@ Return a summary of downloaded files.
         # Check download directory for new PDF files
         download_path = Path(self.download_dir)
         
-        # Get all PDF files (sorted by modification time, newest first)
-        pdf_files = sorted(
-            download_path.glob('*.pdf'),
-            key=lambda p: p.stat().st_mtime,
-            reverse=True
-        )
+        # Only PDFs created or rewritten during the run (newest first); the
+        # directory also holds earlier downloads for other drugs and agencies
+        pdf_files = [
+            (name, mtime) for name, mtime in self._snapshot_downloads().items()
+            if downloads_before.get(name) != mtime
+        ]
+        pdf_files.sort(key=lambda item: item[1], reverse=True)
         
         # Return paths as strings
-        return [str(f) for f in pdf_files]
+        return [str(download_path / name) for name, _ in pdf_files]
     
     async def test_navigation(self, agency: str = 'FDA') -> bool:
         """
@@ -244,30 +555,44 @@ Return a summary of downloaded files.
         Returns:
             True if test successful
         """
-        try:
-            logger.info(f"Testing AI navigator with {agency}")
-            
-            # Simple test task
-            task = f"Go to {self.AGENCY_URLS[agency]} and tell me what you see on the page."
-            
-            browser = Browser(headless=True)
-            
-            agent = Agent(
-                task=task,
-                llm=self.llm,
-                browser=browser
-            )
-            
-            history = await agent.run()
-            
-            await browser.close()
-            
-            logger.info("Test navigation successful")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Test navigation failed: {e}")
-            return False
+        # Browsers are bound to the navigator's loop, so always run there
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is not loop:
+            return await asyncio.wrap_future(self.submit(self.test_navigation(agency)))
+        
+        async with self._browser_lock(agency):
+            browser = None
+            try:
+                logger.info(f"Testing AI navigator with {agency}")
+                
+                # Simple test task
+                task = f"Go to {self.AGENCY_URLS[agency]} and tell me what you see on the page."
+                
+                # Reuse the agency's persistent browser instead of a cold start
+                browser = await self._get_browser(agency)
+                
+                agent = Agent(
+                    task=task,
+                    llm=self.llm,
+                    browser=browser
+                )
+                
+                history = await agent.run()
+                
+                logger.info("Test navigation successful")
+                return True
+                
+            except Exception as e:
+                logger.error(f"Test navigation failed: {e}")
+                if browser is not None:
+                    await self._discard_browser(agency, browser)
+                return False
+
+
+@lru_cache()
+def get_navigator() -> AIWebNavigator:
+    """Get the shared AI navigator (one set of persistent browsers per process)."""
+    return AIWebNavigator()
 
 
 # Convenience function for backward compatibility
@@ -285,5 +610,4 @@ async def retrieve_documents_for_drug(
     Returns:
         Dict mapping agency names to lists of downloaded file paths
     """
-    navigator = AIWebNavigator()
-    return await navigator.retrieve_documents(drug_name, agencies)
+    return await get_navigator().retrieve_documents(drug_name, agencies)
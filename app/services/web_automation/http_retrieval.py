@@ -0,0 +1,205 @@
+"""
+Direct HTTP retrieval for agency sites whose pages are rendered server-side.
+Fetching and parsing the HTML takes one round trip per page, without a browser
+or LLM agent; the navigator falls back to the agent when nothing is found.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import quote, unquote, urljoin, urlparse
+
+import httpx
+from lxml import etree, html
+
+logger = logging.getLogger(__name__)
+
+
+class EMADocumentRetriever:
+    """Downloads EPAR assessment reports from the EMA website over plain HTTP."""
+    
+    BASE_URL = 'https://www.ema.europa.eu'
+    SEARCH_URL = 'https://www.ema.europa.eu/en/search'
+    MEDICINE_PATH = '/en/medicines/human/EPAR/'
+    
+    # Link queries, compiled once and evaluated against every fetched page
+    MEDICINE_LINKS_XPATH = etree.XPath(f"//a[contains(@href, '{MEDICINE_PATH}')]/@href")
+    PDF_LINKS_XPATH = etree.XPath("//a[contains(@href, '.pdf')]/@href")
+    
+    # Assessment reports only (not product information, overviews or leaflets)
+    REPORT_LINK_RE = re.compile(r'epar.*assessment-report.*\.pdf$', re.IGNORECASE)
+    MAX_DOCUMENTS = 10
+    
+    # Reports are downloaded in parallel over at most this many keep-alive
+    # connections; failed connection attempts are retried
+    MAX_CONNECTIONS = 8
+    CONNECT_RETRIES = 2
+    DOWNLOAD_CHUNK_SIZE = 1 << 16
+    MAX_DOCUMENT_BYTES = 200 * 1024 * 1024  # Reject anything larger than any real report
+    
+    # Characters not allowed in file names on common filesystems
+    FILENAME_TABLE = str.maketrans({char: '_' for char in '<>:"/\\|?*'})
+    MAX_FILENAME_LENGTH = 180  # Well under NAME_MAX (255 bytes), leaving room for the temporary .part suffix
+    
+    TIMEOUT = httpx.Timeout(10.0, read=60.0)
+    HEADERS = {'User-Agent': 'Mozilla/5.0 (compatible; RegulatorySearchAgent/1.0)'}
+    
+    def __init__(self, download_dir: str):
+        self.download_dir = download_dir
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the HTTP client shared by all retrievals, creating it on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.TIMEOUT,
+                headers=self.HEADERS,
+                transport=httpx.AsyncHTTPTransport(
+                    limits=httpx.Limits(
+                        max_connections=self.MAX_CONNECTIONS,
+                        max_keepalive_connections=self.MAX_CONNECTIONS
+                    ),
+                    retries=self.CONNECT_RETRIES
+                ),
+                follow_redirects=True
+            )
+        return self._client
+    
+    async def close(self):
+        """Close the HTTP client and its connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def retrieve(self, drug_name: str, max_documents: Optional[int] = None) -> List[str]:
+        """
+        Download the EPAR assessment reports of a drug.
+        
+        Args:
+            drug_name: Name of the drug
+            max_documents: Maximum reports to download (at most MAX_DOCUMENTS)
+        
+        Returns:
+            List of downloaded file paths (empty if the drug or reports weren't found)
+        
+        Raises:
+            httpx.HTTPError: If a page can't be fetched
+        """
+        client = self._get_client()
+        
+        medicine_url = await self._find_medicine_page(client, drug_name)
+        if medicine_url is None:
+            logger.info(f"No EMA medicine page found for {drug_name}")
+            return []
+        
+        response = await client.get(medicine_url)
+        response.raise_for_status()
+        report_urls = self._find_report_links(response.text, medicine_url)
+        logger.info(f"Found {len(report_urls)} EMA assessment reports at {medicine_url}")
+        
+        report_urls = report_urls[:min(max_documents or self.MAX_DOCUMENTS, self.MAX_DOCUMENTS)]
+        downloads = await asyncio.gather(
+            *(self._download(client, url) for url in report_urls),
+            return_exceptions=True
+        )
+        
+        files = []
+        for url, result in zip(report_urls, downloads):
+            if isinstance(result, (httpx.HTTPError, ValueError)):
+                logger.warning(f"Could not download {url}: {result}")
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                files.append(result)
+        
+        return files
+    
+    async def _find_medicine_page(self, client: httpx.AsyncClient, drug_name: str) -> Optional[str]:
+        """Search the EMA site and return the URL of the drug's EPAR page."""
+        response = await client.get(self.SEARCH_URL, params={'search_api_fulltext': drug_name})
+        response.raise_for_status()
+        
+        page = html.fromstring(response.text)
+        candidates = [urljoin(self.BASE_URL, href) for href in self.MEDICINE_LINKS_XPATH(page)]
+        if not candidates:
+            return None
+        
+        # Prefer the page named after the drug (e.g. .../EPAR/keytruda)
+        slug = quote(drug_name.strip().lower().replace(' ', '-'))
+        for url in candidates:
+            if urlparse(url).path.rstrip('/').lower().endswith('/' + slug):
+                return url
+        return candidates[0]
+    
+    def _find_report_links(self, page_html: str, page_url: str) -> List[str]:
+        """Get the assessment report PDF links of an EPAR page, without duplicates."""
+        page = html.fromstring(page_html)
+        links = []
+        
+        for href in self.PDF_LINKS_XPATH(page):
+            url = urljoin(page_url, href)
+            if self.REPORT_LINK_RE.search(urlparse(url).path) and url not in links:
+                links.append(url)
+        
+        return links
+    
+    def _file_name(self, url: str) -> str:
+        """Get a safe local file name for a URL, keeping its extension."""
+        file_name = os.path.basename(unquote(urlparse(url).path)).translate(self.FILENAME_TABLE)
+        if len(file_name) > self.MAX_FILENAME_LENGTH:
+            stem, extension = os.path.splitext(file_name)
+            file_name = stem[:self.MAX_FILENAME_LENGTH - len(extension)] + extension
+        return file_name
+    
+    async def _download(self, client: httpx.AsyncClient, url: str) -> str:
+        """
+        Stream a PDF into the download directory, reusing a copy already there.
+        
+        Args:
+            client: HTTP client
+            url: URL of the PDF
+        
+        Returns:
+            Path of the downloaded file
+        
+        Raises:
+            httpx.HTTPError: If the download fails
+            ValueError: If the file exceeds MAX_DOCUMENT_BYTES
+        """
+        file_path = Path(self.download_dir) / self._file_name(url)
+        if file_path.exists() and file_path.stat().st_size > 0:
+            logger.info(f"Already downloaded: {file_path.name}")
+            return str(file_path)
+        
+        # Uniquely named, so concurrent downloads of the same URL (from other
+        # sessions or processes) don't write into each other's partial file
+        partial_file = tempfile.NamedTemporaryFile(
+            dir=self.download_dir, prefix=f"{file_path.name}.", suffix='.part', delete=False
+        )
+        partial_path = Path(partial_file.name)
+        try:
+            with partial_file as f:
+                async with client.stream('GET', url) as response:
+                    response.raise_for_status()
+                    
+                    content_length = int(response.headers.get('Content-Length') or 0)
+                    if content_length > self.MAX_DOCUMENT_BYTES:
+                        raise ValueError(f"Document too large ({content_length} bytes)")
+                    
+                    received = 0
+                    async for data in response.aiter_bytes(self.DOWNLOAD_CHUNK_SIZE):
+                        received += len(data)
+                        if received > self.MAX_DOCUMENT_BYTES:
+                            raise ValueError(f"Document exceeds {self.MAX_DOCUMENT_BYTES} bytes")
+                        f.write(data)
+        except BaseException:
+            partial_path.unlink(missing_ok=True)
+            raise
+        os.replace(partial_path, file_path)
+        
+        logger.info(f"Downloaded {file_path.name}")
+        return str(file_path)
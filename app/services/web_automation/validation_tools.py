@@ -3,27 +3,185 @@ Validation tools for AI-powered web navigation.
 These tools help the browser-use agent verify it's downloading the correct documents.
 """
 
+import hashlib
 import os
 import logging
+import re
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
+
 import fitz  # PyMuPDF
-from openai import OpenAI
+import orjson
 
 from app.core.config import get_settings
+from app.services.document_processing import PDFParserService
+from app.services.openai_client import get_openai_client
 
 logger = logging.getLogger(__name__)
 
+_VALIDATION_SYSTEM_PROMPT = """You are a regulatory document validator. 
+                        Analyze the provided text and determine if it's a regulatory 
+                        review document for the specified drug."""
+
+_VALIDATION_RESPONSE_FORMAT = """{
+    "is_valid": true/false,
+    "document_type": "medical_review" | "clinical_review" | "label" | "patient_info" | "other",
+    "mentions_drug": true/false,
+    "confidence": 0.0-1.0,
+    "reason": "brief explanation"
+}"""
+
+# Room for one verdict in the response
+_VALIDATION_MAX_TOKENS = 150
+
+# Titles of regulatory review documents; a first page naming the drug at least
+# _CLEAR_DRUG_MENTIONS times next to one of them is accepted without the model
+_REVIEW_DOCUMENT_TITLES = (
+    "medical review",
+    "clinical review",
+    "pharmacology review",
+    "approval letter",
+    "assessment report",
+    "summary basis of decision"
+)
+_CLEAR_DRUG_MENTIONS = 3
+
+
+@lru_cache(maxsize=256)
+def _first_page_text(file_path: str, mtime_ns: int, size: int) -> str:
+    """
+    Extract the plain text of a PDF's first page (cached while the file is unchanged).
+    
+    Only page 0 is loaded. Ligatures are expanded and whitespace normalized,
+    which is all the validator needs.
+    """
+    # Pooled, so processing the download later on this thread reuses the opened document
+    with PDFParserService.open_document(file_path) as doc:
+        if len(doc) == 0:
+            return ""
+        
+        return doc.load_page(0).get_text("text", flags=fitz.TEXT_MEDIABOX_CLIP)
+
+
+@lru_cache(maxsize=256)
+def _validation_patterns(drug_name: str, expected_type: str) -> Tuple[re.Pattern, re.Pattern]:
+    """Compile the drug-name and document-title patterns of the validation pre-check."""
+    titles = {expected_type.replace('_', ' ').lower(), *_REVIEW_DOCUMENT_TITLES}
+    drug_pattern = re.compile(rf"\b{re.escape(drug_name.strip())}\b", re.IGNORECASE)
+    title_pattern = re.compile(
+        '|'.join(r'\s+'.join(map(re.escape, title.split())) for title in sorted(titles)),
+        re.IGNORECASE
+    )
+    return drug_pattern, title_pattern
+
+
+@lru_cache(maxsize=256)
+def _pdf_metadata(file_path: str, mtime_ns: int, size: int) -> Dict:
+    """Read a PDF's metadata (cached while the file is unchanged)."""
+    with PDFParserService.open_document(file_path) as doc:
+        metadata = doc.metadata
+        
+        return {
+            'title': metadata.get('title', ''),
+            'author': metadata.get('author', ''),
+            'subject': metadata.get('subject', ''),
+            'pages': len(doc),
+            'file_size': size,
+            'file_name': os.path.basename(file_path)
+        }
+
+
+class ValidationBatcher:
+    """
+    Collects document validations requested within a short window (by agents
+    running concurrently) and sends them to the model in one chat completion.
+    """
+    
+    def __init__(self, validator: 'DocumentValidator', window_seconds: float = 0.05, max_batch: int = 10):
+        self.validator = validator
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, str, str, Future]] = []
+        self._timer: threading.Timer = None
+        self._lock = threading.Lock()
+    
+    def validate(self, text: str, drug_name: str, expected_type: str) -> Dict:
+        """
+        Queue a validation for the next batch and wait for its result.
+        
+        Args:
+            text: First-page text of the document
+            drug_name: Expected drug name
+            expected_type: Expected document type
+        
+        Returns:
+            Validation results
+        """
+        future = Future()
+        batch = None
+        
+        with self._lock:
+            self._pending.append((text, drug_name, expected_type, future))
+            if len(self._pending) >= self.max_batch:
+                batch = self._take_batch()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window_seconds, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        
+        if batch:
+            self._run(batch)
+        return future.result()
+    
+    def _take_batch(self) -> List[Tuple[str, str, str, Future]]:
+        """Take the pending validations (with the lock held)."""
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+    
+    def _flush(self):
+        """Validate whatever is pending once the batching window closes."""
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._run(batch)
+    
+    def _run(self, batch: List[Tuple[str, str, str, Future]]):
+        """Validate a batch and resolve each caller's future."""
+        try:
+            results = self.validator._ai_validate_batch(
+                [(text, drug_name, expected_type) for text, drug_name, expected_type, _ in batch]
+            )
+        except Exception as e:
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+        
+        for (*_, future), result in zip(batch, results):
+            future.set_result(result)
+
 
 class DocumentValidator:
     """Validates regulatory documents using AI."""
     
+    # Duplicates are detected by file size plus a hash of the file's first MiB
+    DUPLICATE_HASH_BYTES = 1 << 20
+    DUPLICATE_INDEX_NAME = '.duplicate_index.json'
+    
     def __init__(self):
-        settings = get_settings()
-        self.client = OpenAI(
-            api_key=settings.openai_api_key,
-            base_url="https://api.openai.com/v1"
-        )
+        self.client = get_openai_client()
+        
+        # Content key -> file name, per download directory (loaded lazily)
+        self._duplicate_indexes: Dict[str, Dict[str, str]] = {}
+        self._duplicate_lock = threading.Lock()
+        
+        # Validations requested at about the same time share one model call
+        self.batcher = ValidationBatcher(self)
     
     def validate_regulatory_document(
         self, 
@@ -43,33 +201,16 @@ class DocumentValidator:
             Dict with validation results
         """
         try:
-            if not os.path.exists(file_path):
-                return {
-                    'is_valid': False,
-                    'reason': 'File does not exist',
-                    'confidence': 0.0
-                }
-            
-            # Check file extension
-            if not file_path.lower().endswith('.pdf'):
-                return {
-                    'is_valid': False,
-                    'reason': 'Not a PDF file',
-                    'confidence': 0.0
-                }
+            text, rejection = self._preview(file_path)
+            if rejection is not None:
+                return rejection
             
-            # Extract first page text
-            text = self._extract_first_page(file_path)
-            
-            if not text or len(text) < 100:
-                return {
-                    'is_valid': False,
-                    'reason': 'Could not extract text from PDF',
-                    'confidence': 0.0
-                }
+            verdict = self._precheck(text, drug_name, expected_type)
+            if verdict is not None:
+                return verdict
             
-            # Use GPT-4 to validate
-            validation = self._ai_validate(text, drug_name, expected_type)
+            # Use the validation model (batched with concurrent validations)
+            validation = self.batcher.validate(text, drug_name, expected_type)
             
             return validation
             
@@ -81,76 +222,164 @@ class DocumentValidator:
                 'confidence': 0.0
             }
     
+    def _preview(self, file_path: str) -> Tuple[str, Optional[Dict]]:
+        """
+        Get the first-page text to validate a file on.
+        
+        Args:
+            file_path: Path to the downloaded file
+        
+        Returns:
+            Tuple of (first-page text, rejection), where rejection is the
+            validation result if the file can't be validated by the model
+        """
+        if not os.path.exists(file_path):
+            return "", {
+                'is_valid': False,
+                'reason': 'File does not exist',
+                'confidence': 0.0
+            }
+        
+        # Check file extension
+        if not file_path.lower().endswith('.pdf'):
+            return "", {
+                'is_valid': False,
+                'reason': 'Not a PDF file',
+                'confidence': 0.0
+            }
+        
+        # Extract first page text
+        text = self._extract_first_page(file_path)
+        
+        if not text or len(text) < 100:
+            return "", {
+                'is_valid': False,
+                'reason': 'Could not extract text from PDF',
+                'confidence': 0.0
+            }
+        
+        return text, None
+    
+    def _precheck(self, text: str, drug_name: str, expected_type: str) -> Optional[Dict]:
+        """
+        Accept clear-cut documents from the first page without calling the model.
+        
+        Only acceptances are decided here: a page that doesn't mention the
+        searched name may still use the drug's other (brand or generic) name
+        or its application number, which the model can recognize.
+        
+        Args:
+            text: First-page text
+            drug_name: Expected drug name
+            expected_type: Expected document type
+        
+        Returns:
+            Validation result, or None if the model has to decide
+        """
+        drug_pattern, title_pattern = _validation_patterns(drug_name, expected_type)
+        drug_mentions = len(drug_pattern.findall(text))
+        
+        if drug_mentions >= _CLEAR_DRUG_MENTIONS and title_pattern.search(text):
+            return {
+                'is_valid': True,
+                'document_type': expected_type,
+                'confidence': 0.9,
+                'reason': f'First page names {drug_name} and a review document title'
+            }
+        
+        return None
+    
     def _extract_first_page(self, file_path: str) -> str:
         """Extract text from first page of PDF."""
         try:
-            doc = fitz.open(file_path)
-            if len(doc) == 0:
-                return ""
-            
-            first_page = doc[0]
-            text = first_page.get_text()
-            doc.close()
-            
-            return text
+            stat = os.stat(file_path)
+            return _first_page_text(file_path, stat.st_mtime_ns, stat.st_size)
             
         except Exception as e:
             logger.error(f"Error extracting PDF text: {e}")
             return ""
     
+    def _validation_request(self, text: str, drug_name: str, expected_type: str) -> Dict:
+        """Build the chat completion arguments to validate one document."""
+        return {
+            "model": get_settings().validation_model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": _VALIDATION_SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": f"""Is this a {expected_type} document for {drug_name}?
+
+Document preview (first page):
+{text[:2000]}
+
+Respond with JSON:
+{_VALIDATION_RESPONSE_FORMAT}"""
+                }
+            ],
+            "temperature": 0.0,
+            "max_tokens": _VALIDATION_MAX_TOKENS,
+            "response_format": {"type": "json_object"}
+        }
+    
+    def _batch_validation_request(self, items: List[Tuple[str, str, str]]) -> Dict:
+        """Build the chat completion arguments to validate several documents."""
+        documents = "\n\n".join(
+            f"Document {i + 1}: is this a {expected_type} document for {drug_name}?\n"
+            f"Preview (first page):\n{text[:2000]}"
+            for i, (text, drug_name, expected_type) in enumerate(items)
+        )
+        
+        return {
+            "model": get_settings().validation_model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": _VALIDATION_SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": f"""{documents}
+
+Respond with JSON of the form {{"results": [...]}}, with one object per document, in order:
+{_VALIDATION_RESPONSE_FORMAT}"""
+                }
+            ],
+            "temperature": 0.0,
+            "max_tokens": _VALIDATION_MAX_TOKENS * len(items),
+            "response_format": {"type": "json_object"}
+        }
+    
+    def _batch_results(self, content: str, count: int) -> List[Dict]:
+        """
+        Parse a batched validation response.
+        
+        Raises:
+            ValueError: If the response doesn't hold one verdict per document
+        """
+        results = orjson.loads(content).get('results')
+        if not isinstance(results, list) or len(results) != count:
+            raise ValueError(f"expected {count} results")
+        
+        logger.info(f"✓ Validated {count} documents in one call")
+        return [self._validation_result(result) for result in results]
+    
     def _ai_validate(
         self, 
         text: str, 
         drug_name: str, 
         expected_type: str
     ) -> Dict:
-        """Use GPT-4 to validate document content."""
+        """Use the validation model to validate document content."""
         try:
             response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are a regulatory document validator. 
-                        Analyze the provided text and determine if it's a regulatory 
-                        review document for the specified drug."""
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Is this a {expected_type} document for {drug_name}?
-
-Document preview (first page):
-{text[:2000]}
-
-Respond with JSON:
-{{
-    "is_valid": true/false,
-    "document_type": "medical_review" | "clinical_review" | "label" | "patient_info" | "other",
-    "mentions_drug": true/false,
-    "confidence": 0.0-1.0,
-    "reason": "brief explanation"
-}}"""
-                    }
-                ],
-                temperature=0.0
-            )
-            
-            import json
-            result = json.loads(response.choices[0].message.content)
-            
-            # Determine if valid
-            is_valid = (
-                result.get('is_valid', False) and 
-                result.get('mentions_drug', False) and
-                result.get('confidence', 0.0) > 0.7
+                **self._validation_request(text, drug_name, expected_type)
             )
             
-            return {
-                'is_valid': is_valid,
-                'document_type': result.get('document_type', 'unknown'),
-                'confidence': result.get('confidence', 0.0),
-                'reason': result.get('reason', 'AI validation completed')
-            }
+            result = orjson.loads(response.choices[0].message.content)
+            return self._validation_result(result)
             
         except Exception as e:
             logger.error(f"AI validation error: {e}")
@@ -160,9 +389,53 @@ Respond with JSON:
                 'confidence': 0.0
             }
     
+    def _ai_validate_batch(self, items: List[Tuple[str, str, str]]) -> List[Dict]:
+        """
+        Validate several documents with one model call.
+        
+        Falls back to one call per document if the batched response can't be
+        matched to the documents.
+        
+        Args:
+            items: (first-page text, drug name, expected type) of each document
+        
+        Returns:
+            Validation results, in the same order as items
+        """
+        if len(items) == 1:
+            return [self._ai_validate(*items[0])]
+        
+        try:
+            response = self.client.chat.completions.create(**self._batch_validation_request(items))
+            return self._batch_results(response.choices[0].message.content, len(items))
+            
+        except Exception as e:
+            logger.warning(f"Batched validation failed, validating one by one: {e}")
+            return [self._ai_validate(*item) for item in items]
+    
+    def _validation_result(self, result: Dict) -> Dict:
+        """Turn the model's verdict into a validation result."""
+        # Determine if valid
+        is_valid = (
+            result.get('is_valid', False) and 
+            result.get('mentions_drug', False) and
+            result.get('confidence', 0.0) > 0.7
+        )
+        
+        return {
+            'is_valid': is_valid,
+            'document_type': result.get('document_type', 'unknown'),
+            'confidence': result.get('confidence', 0.0),
+            'reason': result.get('reason', 'AI validation completed')
+        }
+    
     def check_duplicate(self, file_path: str, download_dir: str) -> bool:
         """
-        Check if file already exists in download directory.
+        Check if the same content already exists in the download directory.
+        
+        Files are matched by content (size and leading bytes), so renamed
+        copies are caught too. Files that aren't duplicates are recorded in
+        the directory's index for later checks.
         
         Args:
             file_path: Path to the file to check
@@ -173,15 +446,23 @@ Respond with JSON:
         """
         try:
             file_name = os.path.basename(file_path)
-            file_size = os.path.getsize(file_path)
+            content_key = self._content_key(file_path)
             
-            # Check for exact filename match
-            for existing_file in Path(download_dir).glob('*.pdf'):
-                if existing_file.name == file_name:
-                    # Check if file sizes match
-                    if existing_file.stat().st_size == file_size:
-                        logger.info(f"Duplicate found: {file_name}")
-                        return True
+            with self._duplicate_lock:
+                index = self._duplicate_index(download_dir)
+                existing_name = index.get(content_key)
+                
+                if (
+                    existing_name is not None
+                    and existing_name != file_name
+                    and os.path.exists(os.path.join(download_dir, existing_name))
+                ):
+                    logger.info(f"Duplicate found: {file_name} (same content as {existing_name})")
+                    return True
+                
+                if existing_name != file_name:
+                    index[content_key] = file_name
+                    self._save_duplicate_index(download_dir, index)
             
             return False
             
@@ -189,6 +470,45 @@ Respond with JSON:
             logger.error(f"Error checking for duplicates: {e}")
             return False
     
+    def _content_key(self, file_path: str) -> str:
+        """Get a file's duplicate-detection key (size and hash of the first MiB)."""
+        with open(file_path, 'rb') as f:
+            digest = hashlib.sha256(f.read(self.DUPLICATE_HASH_BYTES)).hexdigest()
+        return f"{os.path.getsize(file_path)}:{digest}"
+    
+    def _duplicate_index(self, download_dir: str) -> Dict[str, str]:
+        """
+        Get the content index of a download directory.
+        
+        Loaded from the directory's index file, or built once by hashing the
+        PDFs already there.
+        """
+        index = self._duplicate_indexes.get(download_dir)
+        if index is not None:
+            return index
+        
+        index_path = Path(download_dir) / self.DUPLICATE_INDEX_NAME
+        try:
+            index = orjson.loads(index_path.read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            index = {}
+            for existing_file in Path(download_dir).glob('*.pdf'):
+                index.setdefault(self._content_key(str(existing_file)), existing_file.name)
+            self._save_duplicate_index(download_dir, index)
+        
+        self._duplicate_indexes[download_dir] = index
+        return index
+    
+    def _save_duplicate_index(self, download_dir: str, index: Dict[str, str]):
+        """Write a directory's content index (atomically)."""
+        index_path = Path(download_dir) / self.DUPLICATE_INDEX_NAME
+        try:
+            tmp_path = index_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(orjson.dumps(index))
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            logger.warning(f"Could not save duplicate index: {e}")
+    
     def get_document_metadata(self, file_path: str) -> Dict:
         """
         Extract metadata from PDF document.
@@ -200,21 +520,42 @@ Respond with JSON:
             Dict with document metadata
         """
         try:
-            doc = fitz.open(file_path)
-            metadata = doc.metadata
-            
-            return {
-                'title': metadata.get('title', ''),
-                'author': metadata.get('author', ''),
-                'subject': metadata.get('subject', ''),
-                'pages': len(doc),
-                'file_size': os.path.getsize(file_path),
-                'file_name': os.path.basename(file_path)
-            }
+            stat = os.stat(file_path)
+            return dict(_pdf_metadata(file_path, stat.st_mtime_ns, stat.st_size))
             
         except Exception as e:
             logger.error(f"Error extracting metadata: {e}")
             return {}
+    
+    def get_all_metadata(self, download_dir: str) -> Iterator[Dict]:
+        """
+        Extract metadata from every PDF in a directory.
+        
+        One directory scan supplies each file's name and size; PDFs are
+        opened lazily as the iterator advances.
+        
+        Args:
+            download_dir: Directory to scan
+        
+        Yields:
+            Metadata dict of each readable PDF (with its 'file_path')
+        """
+        with os.scandir(download_dir) as entries:
+            pdf_entries = [
+                entry for entry in entries
+                if entry.name.lower().endswith('.pdf') and entry.is_file()
+            ]
+        
+        for entry in pdf_entries:
+            try:
+                stat = entry.stat()
+                metadata = dict(_pdf_metadata(entry.path, stat.st_mtime_ns, stat.st_size))
+            except Exception as e:
+                logger.error(f"Error extracting metadata from {entry.name}: {e}")
+                continue
+            
+            metadata['file_path'] = entry.path
+            yield metadata
 
 
 def create_validation_tools_for_browser_use():
@@ -0,0 +1,103 @@
+"""
+Shared fixtures for the system test scripts.
+
+Services load the FAISS index and API clients when they're built, so each
+is created once per test session (or per xdist worker) and reused.
+"""
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add app directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.core.autonomous_orchestrator import AutonomousOrchestrator
+from app.core.config import get_settings
+from app.services.document_processing import DocumentProcessor
+from app.services.rag_service import RAGService
+from app.services.vector_store import VectorStoreService
+
+
+@pytest.fixture(scope="session", autouse=True)
+def worker_data(tmp_path_factory):
+    """
+    Give each pytest-xdist worker its own copy of the files services write.
+    
+    Workers build their own vector store, so sharing the index, metadata,
+    answer cache and downloads would let their writes interleave. Each worker
+    starts from a copy of the configured index; the content-addressed caches
+    (documents, analyses, embeddings) are written atomically and stay shared.
+    """
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    if worker is None:
+        return
+    
+    settings = get_settings()
+    data_dir = tmp_path_factory.mktemp(f"data-{worker}")
+    paths = {
+        'FAISS_INDEX_PATH': (settings.faiss_index_path, data_dir / "faiss_index" / "regulatory_docs.index"),
+        'FAISS_METADATA_PATH': (settings.faiss_metadata_path, data_dir / "faiss_index" / "metadata.json"),
+        'ANSWER_CACHE_PATH': (settings.answer_cache_path, data_dir / "qa_cache" / "answers.jsonl"),
+    }
+    
+    for variable, (source, target) in paths.items():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if variable != 'ANSWER_CACHE_PATH' and os.path.exists(source):
+            shutil.copyfile(source, target)
+        os.environ[variable] = str(target)
+    
+    download_dir = data_dir / "downloaded_docs"
+    download_dir.mkdir()
+    os.environ['DOWNLOAD_DIR'] = f"{download_dir}/"
+    
+    get_settings.cache_clear()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def prefetch_index_files(worker_data):
+    """
+    Ask the OS to start reading the FAISS index and metadata into the page cache.
+    
+    The read-ahead runs in the background while the other fixtures are built,
+    so loading (or first searching a memory-mapped) index doesn't wait on disk.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    
+    settings = get_settings()
+    for path in (settings.faiss_index_path, settings.faiss_metadata_path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+
+@pytest.fixture(scope="session")
+def orchestrator():
+    """Orchestrator shared by all tests."""
+    return AutonomousOrchestrator()
+
+
+@pytest.fixture(scope="session")
+def document_processor():
+    """Document processor shared by all tests."""
+    return DocumentProcessor()
+
+
+@pytest.fixture(scope="session")
+def vector_store():
+    """Vector store shared by all tests."""
+    return VectorStoreService()
+
+
+@pytest.fixture(scope="session")
+def rag_service(vector_store):
+    """RAG service searching the shared vector store."""
+    return RAGService(vector_store)
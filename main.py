@@ -1,24 +1,53 @@
 """
 Main FastAPI application for the Regulatory Search Agent.
 """
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
+import logging
 import sys
 from pathlib import Path
 
 # Add app directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from app.core.config import get_settings
-from app.core.orchestrator import AgenticOrchestrator
+# Configure logging once for the whole application
+logging.basicConfig(level=logging.INFO)
+
+from app.core.config import get_settings, ensure_directories
+from app.core.autonomous_orchestrator import AutonomousOrchestrator
+
+# Get settings
+settings = get_settings()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the orchestrator once at startup, shared by all requests."""
+    ensure_directories()
+    # Loading the index and clients is blocking, so keep it off the event loop
+    app.state.orchestrator = await asyncio.to_thread(AutonomousOrchestrator)
+    yield
+    # Shut the browsers down with the server rather than leave them to exit hooks
+    await asyncio.to_thread(app.state.orchestrator.ai_navigator.close)
+
+
+def get_orchestrator(request: Request) -> AutonomousOrchestrator:
+    """Get the application's orchestrator (FastAPI dependency)."""
+    return request.app.state.orchestrator
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Regulatory Search Agent API",
     description="API for automated regulatory document retrieval and analysis",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -30,18 +59,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Get settings
-settings = get_settings()
-
-# Initialize orchestrator
-orchestrator = AgenticOrchestrator()
-
 
 # Request/Response models
 class QueryRequest(BaseModel):
     query: str
     model: Optional[str] = None
-    k: Optional[int] = 5
+    session_id: str = "default"
+    agencies: Optional[List[str]] = None
 
 
 class RetrieveRequest(BaseModel):
@@ -73,7 +97,7 @@ async def health_check():
 
 
 @app.get("/status")
-async def system_status():
+async def system_status(orchestrator: AutonomousOrchestrator = Depends(get_orchestrator)):
     """Get system status."""
     try:
         status = orchestrator.get_system_status()
@@ -83,12 +107,15 @@ async def system_status():
 
 
 @app.post("/api/retrieve")
-async def retrieve_documents(request: RetrieveRequest):
+async def retrieve_documents(
+    request: RetrieveRequest,
+    orchestrator: AutonomousOrchestrator = Depends(get_orchestrator)
+):
     """
     Retrieve and index regulatory documents.
     """
     try:
-        result = orchestrator.retrieve_and_index(
+        result = await orchestrator.aretrieve_and_index(
             drug_name=request.drug_name,
             agencies=request.agencies,
             max_docs_per_agency=request.max_docs_per_agency
@@ -99,15 +126,19 @@ async def retrieve_documents(request: RetrieveRequest):
 
 
 @app.post("/api/query")
-async def query(request: QueryRequest):
+async def query(
+    request: QueryRequest,
+    orchestrator: AutonomousOrchestrator = Depends(get_orchestrator)
+):
     """
     Answer a query using RAG.
     """
     try:
-        result = orchestrator.query(
-            question=request.query,
-            model=request.model,
-            k=request.k
+        result = await orchestrator.aprocess_query(
+            query=request.query,
+            session_id=request.session_id,
+            selected_agencies=request.agencies,
+            model=request.model
         )
         return result
     except Exception as e:
@@ -117,4 +148,12 @@ async def query(request: QueryRequest):
 if __name__ == "__main__":
     import uvicorn
     print(f"🚀 Starting Regulatory Search Agent API on {settings.host}:{settings.port}")
-    uvicorn.run(app, host=settings.host, port=settings.port)
+    # uvloop and httptools (uvicorn[standard]); workers need the app as an import string
+    uvicorn.run(
+        "main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=settings.workers,
+        loop="uvloop",
+        http="httptools"
+    )
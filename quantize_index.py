@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+One-shot migration that re-encodes the existing FAISS index with the
+FAISS_LARGE_INDEX encoding, regardless of FAISS_PQ_THRESHOLD.
+"""
+import logging
+import sys
+from pathlib import Path
+
+# Add app directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Configure logging once for the whole application
+logging.basicConfig(level=logging.INFO)
+
+from app.services.vector_store import VectorStoreService
+
+if __name__ == "__main__":
+    vector_store = VectorStoreService()
+    print(f"📊 Current index: {vector_store.get_stats()}")
+    
+    if vector_store.quantize_index(force=True):
+        print(f"✅ Index quantized: {vector_store.get_stats()}")
+    else:
+        print("⚠️  Index not quantized (already quantized or too few vectors)")
+        sys.exit(1)
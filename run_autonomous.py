@@ -8,7 +8,15 @@ from pathlib import Path
 # Add app directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from app.gui.autonomous_interface import demo
+from app.core.config import ensure_directories
+from app.core.logging_config import configure_queue_logging
+
+# Configure logging once for the whole application
+configure_queue_logging()
+
+ensure_directories()
+
+from app.gui.autonomous_interface import build_demo
 
 if __name__ == "__main__":
     print("🚀 Starting Autonomous Regulatory Search Agent...")
@@ -20,6 +28,7 @@ if __name__ == "__main__":
     print("   • Comparative analysis across agencies")
     print("   • Conversational context tracking\n")
     
+    demo = build_demo()
     demo.launch(
         server_name="0.0.0.0",
         server_port=7860,
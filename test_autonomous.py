@@ -4,19 +4,126 @@ Test script for the autonomous regulatory search agent.
 """
 import sys
 from pathlib import Path
+from typing import List
 
 # Add app directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from app.core.autonomous_orchestrator import AutonomousOrchestrator
+from app.core.logging_config import configure_queue_logging
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Configure logging, written from a background thread
+configure_queue_logging(format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-def test_autonomous_system():
+def _banner(title: str) -> List[str]:
+    """Format a test heading."""
+    return ["\n" + "="*70, title, "="*70]
+
+
+def _follow_up_queries(orchestrator: AutonomousOrchestrator) -> List[str]:
+    """Tests 1 and 2: a specific query, then a follow-up in the same session."""
+    lines = _banner("TEST 1: Specific Query with Drug Name")
+    
+    query1 = "What is Keytruda indicated for?"
+    lines.append(f"\nQuery: \"{query1}\"\n")
+    
+    result1 = orchestrator.process_query(
+        query=query1,
+        session_id="test",
+        selected_agencies=["FDA"]
+    )
+    
+    lines.append(f"\nStatus: {result1.get('status')}")
+    
+    if result1.get('status') == 'clarification_needed':
+        lines.append(f"Clarification: {result1.get('question')}")
+    elif result1.get('status') == 'success':
+        lines.append(f"✅ Answer generated")
+        lines.append(f"Answer preview: {result1.get('answer', '')[:300]}...")
+        
+        context = result1.get('context_summary', {})
+        lines.append(f"\nContext:")
+        lines.append(f"  Current drug: {context.get('current_drug')}")
+        lines.append(f"  Documents indexed: {context.get('documents_indexed')}")
+    else:
+        lines.append(f"❌ Error: {result1.get('error')}")
+    
+    # Test 2: Follow-up query (should use existing documents)
+    lines += _banner("TEST 2: Follow-up Query (No New Documents Needed)")
+    
+    query2 = "What are the safety considerations?"
+    lines.append(f"\nQuery: \"{query2}\"\n")
+    
+    result2 = orchestrator.process_query(
+        query=query2,
+        session_id="test",
+        selected_agencies=["FDA"]
+    )
+    
+    lines.append(f"\nStatus: {result2.get('status')}")
+    
+    if result2.get('status') == 'success':
+        lines.append(f"✅ Answer generated (using existing documents)")
+        lines.append(f"Answer preview: {result2.get('answer', '')[:300]}...")
+    else:
+        lines.append(f"❌ Error: {result2.get('error')}")
+    
+    return lines
+
+
+def _vague_query(orchestrator: AutonomousOrchestrator) -> List[str]:
+    """Test 3: a vague query should ask for clarification."""
+    lines = _banner("TEST 3: Vague Query (Should Request Clarification)")
+    
+    query3 = "Tell me about safety issues"
+    lines.append(f"\nQuery: \"{query3}\"\n")
+    
+    # Fresh session of its own, so it can run alongside tests 1 and 2
+    orchestrator.reset_context("test-vague")
+    
+    result3 = orchestrator.process_query(
+        query=query3,
+        session_id="test-vague"
+    )
+    
+    lines.append(f"\nStatus: {result3.get('status')}")
+    
+    if result3.get('status') == 'clarification_needed':
+        lines.append(f"✅ Clarification requested (as expected)")
+        lines.append(f"Question: {result3.get('question')}")
+    else:
+        lines.append(f"⚠️  Expected clarification but got: {result3.get('status')}")
+    
+    return lines
+
+
+def _query_analyzer() -> List[str]:
+    """Test 4: query analysis on its own."""
+    lines = _banner("TEST 4: Query Analyzer")
+    
+    from app.services.query_analyzer import QueryAnalyzer
+    analyzer = QueryAnalyzer()
+    
+    test_query = "What were the differences in safety issues between FDA and EMA reviews for Tezspire?"
+    lines.append(f"\nQuery: \"{test_query}\"\n")
+    
+    analysis = analyzer.analyze_query(test_query)
+    
+    lines.append(f"✅ Analysis complete:")
+    lines.append(f"  Drug names: {analysis.get('drug_names')}")
+    lines.append(f"  Agencies: {analysis.get('agencies')}")
+    lines.append(f"  Topics: {analysis.get('topics')}")
+    lines.append(f"  Query type: {analysis.get('query_type')}")
+    lines.append(f"  Needs documents: {analysis.get('needs_documents')}")
+    lines.append(f"  Clarification needed: {analysis.get('clarification_needed')}")
+    
+    return lines
+
+
+def test_autonomous_system(orchestrator: AutonomousOrchestrator):
     """Test the autonomous query processing system."""
     
     print("\n" + "="*70)
@@ -24,106 +131,11 @@ def test_autonomous_system():
     print("="*70 + "\n")
     
     try:
-        # Initialize orchestrator
-        print("1️⃣  Initializing autonomous orchestrator...")
-        orchestrator = AutonomousOrchestrator()
-        print("✅ Orchestrator initialized\n")
-        
-        # Test 1: Specific query with drug name
-        print("="*70)
-        print("TEST 1: Specific Query with Drug Name")
-        print("="*70)
-        
-        query1 = "What is Keytruda indicated for?"
-        print(f"\nQuery: \"{query1}\"\n")
-        
-        result1 = orchestrator.process_query(
-            query=query1,
-            session_id="test",
-            selected_agencies=["FDA"]
-        )
-        
-        print(f"\nStatus: {result1.get('status')}")
-        
-        if result1.get('status') == 'clarification_needed':
-            print(f"Clarification: {result1.get('question')}")
-        elif result1.get('status') == 'success':
-            print(f"✅ Answer generated")
-            print(f"Answer preview: {result1.get('answer', '')[:300]}...")
-            
-            context = result1.get('context_summary', {})
-            print(f"\nContext:")
-            print(f"  Current drug: {context.get('current_drug')}")
-            print(f"  Documents indexed: {context.get('documents_indexed')}")
-        else:
-            print(f"❌ Error: {result1.get('error')}")
-        
-        # Test 2: Follow-up query (should use existing documents)
-        print("\n" + "="*70)
-        print("TEST 2: Follow-up Query (No New Documents Needed)")
-        print("="*70)
-        
-        query2 = "What are the safety considerations?"
-        print(f"\nQuery: \"{query2}\"\n")
-        
-        result2 = orchestrator.process_query(
-            query=query2,
-            session_id="test",
-            selected_agencies=["FDA"]
-        )
-        
-        print(f"\nStatus: {result2.get('status')}")
-        
-        if result2.get('status') == 'success':
-            print(f"✅ Answer generated (using existing documents)")
-            print(f"Answer preview: {result2.get('answer', '')[:300]}...")
-        else:
-            print(f"❌ Error: {result2.get('error')}")
-        
-        # Test 3: Vague query (should ask for clarification)
-        print("\n" + "="*70)
-        print("TEST 3: Vague Query (Should Request Clarification)")
-        print("="*70)
-        
-        query3 = "Tell me about safety issues"
-        print(f"\nQuery: \"{query3}\"\n")
-        
-        # Reset context first
-        orchestrator.reset_context("test")
-        
-        result3 = orchestrator.process_query(
-            query=query3,
-            session_id="test"
-        )
-        
-        print(f"\nStatus: {result3.get('status')}")
-        
-        if result3.get('status') == 'clarification_needed':
-            print(f"✅ Clarification requested (as expected)")
-            print(f"Question: {result3.get('question')}")
-        else:
-            print(f"⚠️  Expected clarification but got: {result3.get('status')}")
-        
-        # Test 4: Query analyzer
-        print("\n" + "="*70)
-        print("TEST 4: Query Analyzer")
-        print("="*70)
-        
-        from app.services.query_analyzer import QueryAnalyzer
-        analyzer = QueryAnalyzer()
-        
-        test_query = "What were the differences in safety issues between FDA and EMA reviews for Tezspire?"
-        print(f"\nQuery: \"{test_query}\"\n")
-        
-        analysis = analyzer.analyze_query(test_query)
-        
-        print(f"✅ Analysis complete:")
-        print(f"  Drug names: {analysis.get('drug_names')}")
-        print(f"  Agencies: {analysis.get('agencies')}")
-        print(f"  Topics: {analysis.get('topics')}")
-        print(f"  Query type: {analysis.get('query_type')}")
-        print(f"  Needs documents: {analysis.get('needs_documents')}")
-        print(f"  Clarification needed: {analysis.get('clarification_needed')}")
+        # Run one after another: the scenarios share the orchestrator (its
+        # services and session contexts aren't meant for concurrent callers)
+        print("\n".join(_follow_up_queries(orchestrator)))
+        print("\n".join(_vague_query(orchestrator)))
+        print("\n".join(_query_analyzer()))
         
         print("\n" + "="*70)
         print("✅ AUTONOMOUS SYSTEM TEST COMPLETE")
@@ -146,5 +158,9 @@ def test_autonomous_system():
 
 
 if __name__ == "__main__":
-    success = test_autonomous_system()
+    print("1️⃣  Initializing autonomous orchestrator...")
+    orchestrator = AutonomousOrchestrator()
+    print("✅ Orchestrator initialized\n")
+    
+    success = test_autonomous_system(orchestrator)
     sys.exit(0 if success else 1)
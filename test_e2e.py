@@ -3,17 +3,19 @@
 End-to-end test script for the Regulatory Search Agent.
 Tests the complete workflow from document retrieval to question answering.
 """
+import asyncio
 import sys
 from pathlib import Path
 
 # Add app directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from app.core.orchestrator import AgenticOrchestrator
+from app.core.autonomous_orchestrator import AutonomousOrchestrator
+from app.core.logging_config import configure_queue_logging
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Configure logging, written from a background thread
+configure_queue_logging(format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
@@ -27,7 +29,7 @@ def test_system():
     try:
         # Initialize orchestrator
         print("1️⃣  Initializing orchestrator...")
-        orchestrator = AgenticOrchestrator()
+        orchestrator = AutonomousOrchestrator()
         print("✅ Orchestrator initialized\n")
         
         # Check system status
@@ -44,18 +46,18 @@ def test_system():
         print("   Max docs: 2")
         print("   (This may take 2-3 minutes...)\n")
         
-        result = orchestrator.retrieve_and_index(
+        result = asyncio.run(orchestrator.aretrieve_and_index(
             drug_name="Keytruda",
             agencies=["FDA"],
             max_docs_per_agency=2
-        )
+        ))
         
         if result['status'] == 'success':
             print(f"✅ Document retrieval successful!")
             print(f"   Agencies searched: {', '.join(result['agencies_searched'])}")
             print(f"   Documents downloaded: {len(result['documents_downloaded'])}")
             print(f"   Documents indexed: {result['documents_indexed']}")
-            print(f"   Total vectors: {result['total_vectors_in_index']}")
+            print(f"   Total vectors: {orchestrator.vector_store.total_vectors}")
             
             if result['errors']:
                 print(f"   ⚠️  Warnings: {len(result['errors'])}")
@@ -76,20 +78,17 @@ def test_system():
                 "What are the main safety considerations for Keytruda?",
             ]
             
-            for i, question in enumerate(test_questions, 1):
+            # One batched search, answers generated concurrently
+            answer_results = orchestrator.rag_service.generate_answer_batch(test_questions, k=3)
+            
+            for i, (question, answer_result) in enumerate(zip(test_questions, answer_results), 1):
                 print(f"\n   Question {i}: {question}")
                 
-                answer_result = orchestrator.query(
-                    question=question,
-                    k=3
-                )
-                
                 if answer_result['status'] == 'success':
+                    print(f"\n   Answer preview:\n   {answer_result['answer'][:200]}...")
                     print(f"   ✅ Answer generated ({len(answer_result['answer'])} characters)")
                     print(f"   Sources: {answer_result['num_chunks_retrieved']} chunks")
                     print(f"   Model: {answer_result['model_used']}")
-                    print(f"\n   Answer preview:")
-                    print(f"   {answer_result['answer'][:200]}...")
                 else:
                     print(f"   ❌ Query failed: {answer_result.get('error', 'Unknown error')}")
         else: